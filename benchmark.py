@@ -0,0 +1,216 @@
+import dspy
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+
+from fake_lm import FakeLM
+from timing import percentile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'style_evaluation'))
+sys.path.append(os.path.join(ROOT, 'summarize_metric'))
+
+# Canned outputs, matched against the prompt in order (first match wins)
+CANNED_RESPONSES = [
+    # tool_example.FizzBuzzReAct
+    ("[[ ## context ## ]]", {
+        "reasoning": "fizzbuzz(12) = Fizz, fizzbuzz(25) = Buzz, fizzbuzz(45) = FizzBuzz. "
+                     "Final answer: Fizz, Buzz, FizzBuzz.",
+    }),
+    # infoextraction.ExtractInfo
+    ("Extract structured information", {
+        "title": "Stanford Professor Researches Renewable Energy Storage",
+        "headings": ["Research", "Industry Consulting"],
+        "entities": [
+            {"name": "Sarah Chen", "type": "person"},
+            {"name": "Stanford", "type": "organization"},
+            {"name": "Google", "type": "organization"},
+            {"name": "Tesla", "type": "organization"},
+        ],
+    }),
+    # classify.Classify
+    ("Classify sentiment", {"sentiment": "positive", "confidence": 0.85}),
+    # cot.py / cot_slm.py
+    ("Two dice are tossed", {
+        "reasoning": "There are 36 outcomes and only (1, 1) sums to two.",
+        "answer": 0.0278,
+    }),
+    # style_evaluation: batched judge, single judge, then the predictor
+    ("[[ ## items ## ]]", {
+        "style_matches": [True, True, True, False],
+        "confidences": [0.95, 0.9, 0.9, 0.2],
+    }),
+    ("[[ ## requested_style ## ]]", {"style_match": True, "confidence": 0.9}),
+    ("[[ ## style ## ]]", {
+        "reasoning": "Answer in the requested style.",
+        "answer": "Machine learning is a branch of artificial intelligence that learns patterns from data.",
+    }),
+    # summarize_metric: Breakdown, then SummaryCorrectness
+    ("[[ ## passage ## ]]", {
+        "reasoning": "The passage has three key ideas.",
+        "key_ideas": "1. Built for the 1889 World's Fair. High.\n2. Initially criticized. Medium.\n3. World famous. High.",
+        "importance_grades": ["High", "Medium", "High"],
+    }),
+    ("[[ ## summary ## ]]", {
+        "reasoning": "The summary mentions all three ideas.",
+        "binary_scores": [True, True, True],
+        "overall_score": 1.0,
+    }),
+]
+
+def pipeline_react():
+    from tool_example import FizzBuzzReAct
+    agent = FizzBuzzReAct()
+    return lambda: agent("What happens when you apply FizzBuzz to the numbers 12, 25, and 45?")
+
+def pipeline_extract():
+    from infoextraction import ExtractInfo
+    module = dspy.Predict(ExtractInfo)
+    text = ("Dr. Sarah Chen, Stanford professor, published research on renewable energy storage "
+            "while consulting for Google's sustainability team and Tesla's battery division.")
+    return lambda: module(text=text)
+
+def pipeline_classify():
+    from classify import Classifier
+    classifier = Classifier()
+    return lambda: classifier("This book was super fun to read, though not the last chapter.")
+
+def pipeline_cot():
+    math = dspy.ChainOfThought("question -> answer: float")
+    return lambda: math(question="Two dice are tossed. What is the probability that the sum equals two?")
+
+def pipeline_style_eval():
+    from style_evaluation_metric import (
+        StylePredictor, MultiMetricEvaluate, BatchStyleJudge, length_metric, examples
+    )
+    devset = [
+        dspy.Example(question=ex["question"], style=ex["style"]).with_inputs("question", "style")
+        for ex in examples
+    ]
+    evaluator = MultiMetricEvaluate(
+        devset=devset,
+        metrics={'length': length_metric},
+        batch_metrics={'style_score': BatchStyleJudge(batch_size=4)},
+        primary='style_score',
+        display_progress=False,
+    )
+    predictor = StylePredictor()
+    return lambda: evaluator(predictor)
+
+def pipeline_summary_metric():
+    from summarization_metric import Metric, iter_rows
+    metric = Metric()
+    rows = [data for _, data in iter_rows(os.path.join(ROOT, 'summarize_metric', 'dataset.jsonl'))]
+
+    def run():
+        for data in rows:
+            example = dspy.Example(passage=data["passage"], summary=data["summary"])
+            metric(example=example, pred=example)
+    return run
+
+PIPELINES = {
+    "react": pipeline_react,
+    "extract": pipeline_extract,
+    "classify": pipeline_classify,
+    "cot": pipeline_cot,
+    "style_eval": pipeline_style_eval,
+    "summary_metric": pipeline_summary_metric,
+}
+
+def run_pipeline(name, lm, iterations=20, warmup=2):
+    """
+    Time one pipeline end to end against the fake LM.
+
+    Overhead is the wall time not spent inside the fake LM, i.e. prompt
+    building, parsing and bookkeeping in our code and in dspy. Allocations
+    are measured in a separate pass, since tracemalloc slows everything down.
+    """
+    run = PIPELINES[name]()
+    for _ in range(warmup):
+        run()
+
+    lm.reset()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    total = sum(timings)
+    lm_calls = lm.calls
+    overhead = total - lm.lm_seconds
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "pipeline": name,
+        "iterations": iterations,
+        "lm_calls_per_run": lm_calls / iterations,
+        "run_ms_mean": total / iterations * 1000,
+        "run_ms_p50": percentile(timings, 50) * 1000,
+        "run_ms_p95": percentile(timings, 95) * 1000,
+        "overhead_ms_per_run": overhead / iterations * 1000,
+        "overhead_ms_per_call": overhead / lm_calls * 1000 if lm_calls else 0.0,
+        "runs_per_sec": iterations / total if total else 0.0,
+        "peak_alloc_kb": peak / 1024,
+    }
+
+def print_report(results):
+    print(f"{'Pipeline':<15} | {'LM calls':>8} | {'Run ms':>8} | {'p95 ms':>8} | {'Ovh/run ms':>10} | "
+          f"{'Ovh/call ms':>11} | {'Runs/s':>8} | {'Peak KB':>8}")
+    print("-" * 100)
+    for r in results:
+        print(f"{r['pipeline']:<15} | {r['lm_calls_per_run']:>8.1f} | {r['run_ms_mean']:>8.2f} | "
+              f"{r['run_ms_p95']:>8.2f} | {r['overhead_ms_per_run']:>10.2f} | {r['overhead_ms_per_call']:>11.2f} | "
+              f"{r['runs_per_sec']:>8.1f} | {r['peak_alloc_kb']:>8.0f}")
+
+def check_regressions(results, baseline, tolerance):
+    """
+    Compare per-run overhead with a saved baseline and return the pipelines
+    that got slower by more than `tolerance` (e.g. 0.2 = 20%).
+    """
+    previous = {r["pipeline"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get(r["pipeline"])
+        if before and r["overhead_ms_per_run"] > before["overhead_ms_per_run"] * (1 + tolerance):
+            regressions.append((r["pipeline"], before["overhead_ms_per_run"], r["overhead_ms_per_run"]))
+    return regressions
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Offline benchmarks of every example pipeline against a fake LM.")
+    parser.add_argument("pipelines", nargs="*", default=list(PIPELINES), help=f"any of: {', '.join(PIPELINES)}")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per LM call")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier --save to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed overhead growth vs. the baseline")
+    args = parser.parse_args()
+
+    # dspy.Evaluate logs its average after every run
+    logging.getLogger("dspy.evaluate.evaluate").setLevel(logging.WARNING)
+
+    lm = FakeLM(CANNED_RESPONSES, latency=args.latency)
+    dspy.configure(lm=lm)
+
+    results = [run_pipeline(name, lm, iterations=args.iterations) for name in args.pipelines]
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = check_regressions(results, json.load(f), args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION: {name} overhead {before:.2f} ms -> {after:.2f} ms per run")
+        if regressions:
+            exit(1)
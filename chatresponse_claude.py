@@ -1,19 +1,37 @@
 import dspy
 
 from dotenv import load_dotenv
+from lm_cache import CachedLM, format_stats
 import os
+import argparse
 
-load_dotenv()
+def run(argv=None):
+    load_dotenv()
 
-if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Say Hello World with Claude.")
+    parser.add_argument("--stream", action="store_true", help="print tokens as they arrive and report their latency")
+    args = parser.parse_args(argv)
 
     api_key = os.environ.get("CLAUDE_API_KEY")
     if not api_key:
         print("Claude API key not found. Please set the CLAUDE_API_KEY environment variable.")
         exit(1)
 
-    lm = dspy.LM('anthropic/claude-3-5-sonnet-20240620', api_key=api_key)
-    dspy.configure(lm=lm)
+    lm = CachedLM(dspy.LM('anthropic/claude-3-5-sonnet-20240620', api_key=api_key))
+    dspy.configure(lm=lm.lm)
+
+    if args.stream:
+        from streaming import format_stream_stats, stream_lm
+        stream = stream_lm(lm.lm, [{"role": "user", "content": "Say Hello World!"}])
+        print("Chat response: ", end="", flush=True)
+        for chunk in stream:
+            print(chunk, end="", flush=True)
+        print(f"\n{format_stream_stats(stream.stats)}")
+        return
 
     chat_response = lm(messages=[{"role": "user", "content": "Say Hello World!"}])
-    print(f"Chat response: {chat_response}")
\ No newline at end of file
+    print(f"Chat response: {chat_response}")
+    print(format_stats(lm.cache))
+
+if __name__ == "__main__":
+    run()
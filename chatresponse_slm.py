@@ -1,9 +1,29 @@
 import dspy
+import argparse
 
-if __name__=="__main__":
+from lm_cache import CachedLM, format_stats
+from slm_client import get_slm_lm
 
-    lm = dspy.LM('ollama_chat/llama3.2', api_base='http://localhost:11434', api_key='')
-    dspy.configure(lm=lm)
+def run(argv=None):
+    parser = argparse.ArgumentParser(description="Say Hello World with the local SLM.")
+    parser.add_argument("--stream", action="store_true", help="print tokens as they arrive and report their latency")
+    args = parser.parse_args(argv)
+
+    lm = CachedLM(get_slm_lm())
+    dspy.configure(lm=lm.lm)
+
+    if args.stream:
+        from streaming import format_stream_stats, stream_lm
+        stream = stream_lm(lm.lm, [{"role": "user", "content": "Say Hello World!"}])
+        print("Chat response: ", end="", flush=True)
+        for chunk in stream:
+            print(chunk, end="", flush=True)
+        print(f"\n{format_stream_stats(stream.stats)}")
+        return
 
     chat_response = lm(messages=[{"role": "user", "content": "Say Hello World!"}])
-    print(f"Chat response: {chat_response}")
\ No newline at end of file
+    print(f"Chat response: {chat_response}")
+    print(format_stats(lm.cache))
+
+if __name__ == "__main__":
+    run()
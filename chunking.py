@@ -0,0 +1,103 @@
+import re
+import io
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Rough token estimate (~4 characters per token), enough to size chunks for the LM
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    """Approximate the number of LM tokens in `text`."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def iter_words(source, block_size=64 * 1024):
+    """
+    Yield the words of `source` (a string or a text file object), reading a
+    file `block_size` characters at a time so it never has to fit in memory.
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    tail = ""
+    while True:
+        block = source.read(block_size)
+        if not block:
+            break
+        words = re.split(r'\s+', tail + block)
+        # The last piece may be a word cut in half by the block boundary
+        tail = words.pop()
+        for word in words:
+            if word:
+                yield word
+    if tail:
+        yield tail
+
+def iter_chunks(source, max_tokens=512, overlap_tokens=64):
+    """
+    Split `source` into chunks of at most `max_tokens` estimated tokens.
+
+    Consecutive chunks share roughly `overlap_tokens` of text, so a sentence
+    cut at a chunk boundary is still seen whole by one of the two chunks.
+    Chunks are produced lazily from iter_words, so only the current chunk is
+    held in memory.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    budget = max_tokens * CHARS_PER_TOKEN
+    overlap = overlap_tokens * CHARS_PER_TOKEN
+
+    words, size, fresh = [], 0, 0
+    for word in iter_words(source):
+        if words and size + 1 + len(word) > budget and not fresh:
+            # The overlap alone leaves no room for this word; drop it
+            words, size = [], 0
+        elif words and size + 1 + len(word) > budget:
+            yield " ".join(words)
+            # Keep the tail of the chunk as the start of the next one
+            kept, kept_size = [], 0
+            for previous in reversed(words):
+                if kept_size + len(previous) + 1 > overlap:
+                    break
+                kept.append(previous)
+                kept_size += len(previous) + 1
+            words = kept[::-1]
+            size = max(0, kept_size - 1)
+            fresh = 0
+        size += len(word) + (1 if words else 0)
+        words.append(word)
+        fresh += 1
+    # Don't emit a final chunk that is only overlap already sent
+    if words and fresh:
+        yield " ".join(words)
+
+def map_bounded(fn, items, workers=4):
+    """
+    Apply `fn` to each item of an iterable on `workers` threads, yielding
+    (index, result, error) as calls finish.
+
+    At most `2 * workers` items are pulled from `items` ahead of the
+    results, so a lazily produced input (such as iter_chunks over a large
+    file) is never read much further than the work in flight.
+    """
+    items = enumerate(items)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+
+        def submit_next():
+            for index, item in items:
+                pending[pool.submit(fn, item)] = index
+                return True
+            return False
+
+        for _ in range(2 * workers):
+            if not submit_next():
+                break
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = pending.pop(future)
+                try:
+                    yield index, future.result(), None
+                except Exception as e:
+                    yield index, None, e
+                submit_next()
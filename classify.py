@@ -1,11 +1,22 @@
 import dspy
 
 from dotenv import load_dotenv
-import os
+from slm_client import get_slm_lm
+from structured_output import InstrumentedChatAdapter, JSONModeAdapter, format_parse_stats
+from timing import percentile
+import re
+import sys
+import csv
+import json
+import time
+import queue
+import contextlib
+import argparse
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal
 
-load_dotenv()
-
 class Classify(dspy.Signature):
     """Classify sentiment of a given sentence."""
     sentence: str = dspy.InputField()
@@ -17,17 +28,435 @@ class Classifier(dspy.Module):
         super().__init__()
         self.predictor = dspy.Predict(Classify)
 
-    def forward(self, question):
-        return self.predictor(question=question)
+    def forward(self, sentence):
+        return self.predictor(sentence=sentence)
+
+# Sentiment lexicon: word -> weight (positive or negative)
+LEXICON = {
+    # positive
+    'good': 1.0, 'great': 1.5, 'excellent': 2.0, 'amazing': 2.0, 'awesome': 2.0,
+    'wonderful': 2.0, 'fantastic': 2.0, 'love': 2.0, 'loved': 2.0, 'loves': 2.0,
+    'like': 0.5, 'liked': 1.0, 'enjoy': 1.0, 'enjoyed': 1.5, 'fun': 1.0,
+    'happy': 1.5, 'glad': 1.0, 'nice': 1.0, 'best': 1.5, 'perfect': 2.0,
+    'recommend': 1.5, 'beautiful': 1.5, 'brilliant': 2.0, 'pleased': 1.5,
+    'impressive': 1.5, 'delightful': 2.0, 'helpful': 1.0, 'easy': 0.5, 'fast': 0.5,
+    # negative
+    'bad': -1.0, 'poor': -1.5, 'terrible': -2.0, 'awful': -2.0, 'horrible': -2.0,
+    'hate': -2.0, 'hated': -2.0, 'worst': -2.0, 'boring': -1.5, 'disappointing': -1.5,
+    'disappointed': -1.5, 'sad': -1.0, 'angry': -1.5, 'annoying': -1.5, 'broken': -1.5,
+    'useless': -2.0, 'waste': -1.5, 'slow': -0.5, 'difficult': -0.5, 'ugly': -1.5,
+    'refund': -1.0, 'problem': -1.0, 'fail': -1.5, 'failed': -1.5,
+}
+
+# Words that flip the sentiment of the next few words
+NEGATORS = {'not', 'no', 'never', 'hardly', 'without', "isn't", "wasn't", "don't",
+            "doesn't", "didn't", "can't", "won't", "aren't", "weren't"}
+NEGATION_SPAN = 3
+
+class LexiconClassifier:
+    """
+    A cheap in-process sentiment scorer.
+
+    Sentences are scored against a word lexicon (with simple negation) as one
+    NumPy matrix per batch. Confidence is the share of the sentiment mass that
+    agrees with the winning label, so mixed sentences and sentences without
+    any known words get a low confidence.
+    """
+
+    def __init__(self, lexicon=None):
+        lexicon = lexicon or LEXICON
+        self.vocabulary = {word: i for i, word in enumerate(lexicon)}
+        self.weights = np.array(list(lexicon.values()), dtype=np.float64)
+
+    def _hits(self, sentences):
+        """Return (rows, columns, signs) of lexicon hits for a batch of sentences."""
+        rows, cols, signs = [], [], []
+        for row, sentence in enumerate(sentences):
+            negated = 0
+            for token in re.findall(r"[a-z']+", sentence.lower()):
+                if token in NEGATORS:
+                    negated = NEGATION_SPAN
+                    if token not in self.vocabulary:
+                        continue
+                col = self.vocabulary.get(token)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    signs.append(-1.0 if negated else 1.0)
+                negated = max(0, negated - 1)
+        return rows, cols, signs
+
+    def predict(self, sentences):
+        """Return (labels, confidences) for a batch of sentences."""
+        rows, cols, signs = self._hits(sentences)
+        counts = np.zeros((len(sentences), len(self.vocabulary)))
+        np.add.at(counts, (rows, cols), signs)
+
+        contributions = counts * self.weights
+        positive = np.clip(contributions, 0, None).sum(axis=1)
+        negative = -np.clip(contributions, None, 0).sum(axis=1)
+
+        labels = np.where(positive > negative, 'positive',
+                          np.where(negative > positive, 'negative', 'neutral'))
+        confidences = np.abs(positive - negative) / (positive + negative + 1.0)
+        return labels.tolist(), confidences.tolist()
+
+class CascadeClassifier(dspy.Module):
+    """
+    Answer confident sentences with the LexiconClassifier and send only the
+    rest to the LM Classifier.
+
+    Sentences whose local confidence is below `threshold` are escalated. For
+    every escalated sentence the local and LM answers (including the LM's
+    `confidence`) are kept in `calibration`, to tune the threshold later.
+    """
+
+    def __init__(self, threshold=0.75, lexicon=None):
+        super().__init__()
+        self.local = LexiconClassifier(lexicon)
+        self.lm_classifier = Classifier()
+        self.threshold = threshold
+        self.calibration = []
+        self.local_answers = 0
+        self.escalations = 0
+        self._lock = threading.Lock()
+
+    def resolve(self, sentence, local_sentiment, local_confidence):
+        """Return the local answer if it is confident enough, otherwise ask the LM."""
+        if local_confidence >= self.threshold:
+            with self._lock:
+                self.local_answers += 1
+            return dspy.Prediction(sentiment=local_sentiment, confidence=local_confidence, source='local')
+
+        result = self.lm_classifier(sentence=sentence)
+        with self._lock:
+            self.escalations += 1
+            self.calibration.append({
+                'sentence': sentence,
+                'local_sentiment': local_sentiment,
+                'local_confidence': local_confidence,
+                'lm_sentiment': result.sentiment,
+                'lm_confidence': result.confidence,
+            })
+        return dspy.Prediction(sentiment=result.sentiment, confidence=result.confidence, source='lm')
+
+    def forward(self, sentence):
+        labels, confidences = self.local.predict([sentence])
+        return self.resolve(sentence, labels[0], confidences[0])
+
+    def stats(self):
+        total = self.local_answers + self.escalations
+        return {
+            'sentences': total,
+            'local_answers': self.local_answers,
+            'escalations': self.escalations,
+            'escalation_rate': self.escalations / total if total else 0.0,
+        }
+
+def evaluate_cascade(cascade, records, label_field='label', workers=8,
+                     thresholds=(0.5, 0.6, 0.7, 0.75, 0.8, 0.9, 1.01)):
+    """
+    Compare the cascade with the LM alone on a labeled set.
+
+    The LM classifies every sentence once, so the escalation rate and accuracy
+    of the cascade can be computed for several thresholds without more calls.
+    """
+    records = [(record, sentence) for record, sentence in records if sentence is not None]
+    sentences = [sentence for _, sentence in records]
+    labels = [record[label_field] for record, _ in records]
+    local_labels, local_confidences = cascade.local.predict(sentences)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        lm_labels = [r.sentiment for r in pool.map(lambda s: cascade.lm_classifier(sentence=s), sentences)]
+
+    n = len(sentences)
+    lm_accuracy = sum(p == y for p, y in zip(lm_labels, labels)) / n if n else 0.0
+    sweep = []
+    for threshold in thresholds:
+        local = [c >= threshold for c in local_confidences]
+        predictions = [l if use_local else m for l, m, use_local in zip(local_labels, lm_labels, local)]
+        sweep.append({
+            'threshold': threshold,
+            'escalation_rate': 1 - sum(local) / n if n else 0.0,
+            'accuracy': sum(p == y for p, y in zip(predictions, labels)) / n if n else 0.0,
+            'agreement_with_lm': sum(p == m for p, m in zip(predictions, lm_labels)) / n if n else 0.0,
+        })
+    return {'sentences': n, 'lm_accuracy': lm_accuracy, 'sweep': sweep}
+
+def detect_format(path):
+    """Guess the input format from a file name; stdin defaults to JSONL."""
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith('.txt'):
+        return 'text'
+    return 'jsonl'
+
+def read_records(stream, fmt, field='sentence'):
+    """
+    Lazily yield (record, sentence) pairs from JSONL, CSV (with a header row)
+    or plain text with one sentence per line. A JSONL line that is not a
+    JSON object yields ({'line': n, 'error': ...}, None), so one bad line
+    becomes an error row instead of ending the stream.
+    """
+    if fmt == 'csv':
+        for record in csv.DictReader(stream):
+            yield record, record.get(field, '')
+        return
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if fmt == 'text':
+            yield {field: line}, line
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield {'line': number, 'error': f"invalid JSON: {e}"}, None
+                continue
+            if not isinstance(record, dict):
+                yield {'line': number, 'error': f"expected a JSON object, got {type(record).__name__}"}, None
+                continue
+            yield record, record.get(field, '')
+
+# Columns classify_stream may add to a row; an error row may be the first one written
+RESULT_FIELDS = ('line', 'sentiment', 'confidence', 'source', 'error')
+
+class RowWriter:
+    """
+    Write result rows as JSONL or CSV, flushing each row as it is written.
+
+    The CSV header is the first row's columns followed by any of `fields`
+    it lacks; later rows leave missing columns empty and drop unknown ones.
+    """
+
+    def __init__(self, stream, fmt, fields=RESULT_FIELDS):
+        self.stream = stream
+        self.fmt = fmt
+        self.fields = fields
+        self.csv_writer = None
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            if self.csv_writer is None:
+                fieldnames = list(row) + [name for name in self.fields if name not in row]
+                self.csv_writer = csv.DictWriter(self.stream, fieldnames=fieldnames,
+                                                 restval='', extrasaction='ignore')
+                self.csv_writer.writeheader()
+            self.csv_writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(row) + '\n')
+        self.stream.flush()
+
+def classify_stream(classifier, records, writer, workers=8, queue_size=64, ordered=False):
+    """
+    Classify a stream of (record, sentence) pairs with `workers` concurrent threads.
+
+    A reader thread feeds a bounded queue, so a fast input never runs ahead of
+    the LM by more than `queue_size` sentences (backpressure). Rows are written
+    as they complete; with ordered=True they are written in input order, and
+    the reorder buffer is bounded by the same window. A CascadeClassifier is
+    scored locally in batches of `queue_size` by the reader before its
+    sentences reach the workers. Unreadable input lines and failed
+    sentences are written as error rows and counted as errors, but left
+    out of the latency statistics; if reading the input fails outright,
+    the rows read so far are written and the error is raised.
+    Returns throughput and per-sentence latency statistics.
+    """
+    cascade = classifier if isinstance(classifier, CascadeClassifier) else None
+    work = queue.Queue(maxsize=queue_size)
+    done = queue.Queue()
+    # Sentences read but not yet written; bounds both queues and the reorder buffer
+    window = threading.Semaphore(queue_size + workers)
+
+    def enqueue(batch):
+        if cascade is not None:
+            local = zip(*cascade.local.predict([sentence or '' for _, _, sentence in batch]))
+        else:
+            local = [None] * len(batch)
+        for (index, record, sentence), scored in zip(batch, local):
+            window.acquire()
+            work.put((index, record, sentence, scored))
+
+    reader_errors = []
+
+    def reader():
+        # Whatever happens to the input, every worker gets its sentinel so the main loop ends
+        batch = []
+        try:
+            for index, (record, sentence) in enumerate(records):
+                batch.append((index, record, sentence))
+                if len(batch) >= queue_size:
+                    enqueue(batch)
+                    batch = []
+        except Exception as e:
+            reader_errors.append(e)
+        try:
+            # Sentences read before a failure are still classified and written
+            enqueue(batch)
+        except Exception as e:
+            reader_errors.append(e)
+        finally:
+            for _ in range(workers):
+                work.put(None)
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                done.put(None)
+                return
+            index, record, sentence, scored = item
+            start = time.perf_counter()
+            row = dict(record)
+            if sentence is None:
+                # An input line that could not be read; it already carries its error
+                row['sentiment'] = None
+                row['confidence'] = None
+                done.put((index, row, None, True))
+                continue
+            failed = False
+            try:
+                if scored is not None:
+                    result = cascade.resolve(sentence, *scored)
+                    row['source'] = result.source
+                else:
+                    result = classifier(sentence=sentence)
+                row['sentiment'] = result.sentiment
+                row['confidence'] = float(result.confidence)
+            except Exception as e:
+                row['sentiment'] = None
+                row['confidence'] = None
+                row['error'] = str(e)
+                failed = True
+            latency = None if failed else time.perf_counter() - start
+            done.put((index, row, latency, failed))
+
+    threads = [threading.Thread(target=reader, daemon=True)]
+    threads += [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    latencies = []
+    lines = 0
+    errors = 0
+    pending = {}
+    next_index = 0
+    finished_workers = 0
+    while finished_workers < workers:
+        item = done.get()
+        if item is None:
+            finished_workers += 1
+            continue
+        index, row, latency, failed = item
+        lines += 1
+        errors += failed
+        if latency is not None:
+            latencies.append(latency)
+        if not ordered:
+            writer.write(row)
+            window.release()
+            continue
+        pending[index] = row
+        while next_index in pending:
+            writer.write(pending.pop(next_index))
+            window.release()
+            next_index += 1
+
+    if reader_errors:
+        # The rows read before the failure are written; the input error itself is the caller's to see
+        raise reader_errors[0]
+    elapsed = time.perf_counter() - start
+    return {
+        'lines': lines,
+        'errors': errors,
+        'seconds': elapsed,
+        'lines_per_sec': lines / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+def run(argv=None):
+    """Classify one sentence, or a whole file in batch, from the command line."""
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Classify the sentiment of sentences.")
+    parser.add_argument("input", nargs="?", help="JSONL, CSV or text file to classify, or - for stdin")
+    parser.add_argument("--output", default="-", help="output file, or - for stdout")
+    parser.add_argument("--format", choices=["jsonl", "csv", "text"], help="input format (default: from the file name)")
+    parser.add_argument("--output-format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--field", default="sentence", help="JSONL/CSV field holding the sentence")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--ordered", action="store_true", help="write rows in input order")
+    parser.add_argument("--cascade", action="store_true",
+                        help="answer confident sentences with the local lexicon scorer, escalate the rest to the LM")
+    parser.add_argument("--threshold", type=float, default=0.75, help="local confidence needed to skip the LM")
+    parser.add_argument("--calibration", help="write the escalated sentences' local and LM answers to this JSONL file")
+    parser.add_argument("--evaluate", action="store_true",
+                        help="treat the input as labeled (--label-field) and compare the cascade with the LM alone")
+    parser.add_argument("--label-field", default="label")
+    parser.add_argument("--json-mode", action="store_true",
+                        help="constrain the LM to a JSON schema of the outputs, repairing locally before re-asking")
+    args = parser.parse_args(argv)
+
+    lm = get_slm_lm()
+    adapter = JSONModeAdapter() if args.json_mode else InstrumentedChatAdapter()
+    dspy.configure(lm=lm, adapter=adapter)
+
+    classifier = CascadeClassifier(threshold=args.threshold) if args.cascade or args.evaluate else Classifier()
+
+    if args.input is None:
+        sentence = "This book was super fun to read, though not the last chapter."
+        result = classifier(sentence)
+
+        print(f"Sentence: {sentence}")
+        print(f"Result: {result.sentiment} with confidence {result.confidence:.2f}.")
+        print(format_parse_stats(adapter))
+        return
+
+    fmt = args.format or detect_format(args.input)
+    # stdin and stdout are wrapped so that leaving the `with` closes only the files opened here
+    input_file = contextlib.nullcontext(sys.stdin) if args.input == "-" else open(args.input, 'r', encoding='utf-8', newline='')
+
+    if args.evaluate:
+        with input_file as source:
+            report = evaluate_cascade(classifier, read_records(source, fmt, field=args.field),
+                                      label_field=args.label_field, workers=args.workers)
+        print(f"LM-only accuracy on {report['sentences']} sentences: {report['lm_accuracy']:.1%}")
+        print(f"{'Threshold':>9} | {'Escalated':>9} | {'Accuracy':>8} | {'Agrees w/ LM':>12}")
+        for row in report['sweep']:
+            print(f"{row['threshold']:>9.2f} | {row['escalation_rate']:>9.1%} | {row['accuracy']:>8.1%} | "
+                  f"{row['agreement_with_lm']:>12.1%}")
+        print(format_parse_stats(adapter))
+        return
+
+    output_file = contextlib.nullcontext(sys.stdout) if args.output == "-" else open(args.output, 'w', encoding='utf-8', newline='')
+    with input_file as source, output_file as target:
+        stats = classify_stream(
+            classifier,
+            read_records(source, fmt, field=args.field),
+            RowWriter(target, args.output_format, fields=(args.field, *RESULT_FIELDS)),
+            workers=args.workers,
+            queue_size=args.queue_size,
+            ordered=args.ordered,
+        )
 
-if __name__=="__main__":
+    # Stats go to stderr so they never mix with rows written to stdout
+    print(f"Classified {stats['lines']} lines ({stats['errors']} errors) in {stats['seconds']:.1f}s: "
+          f"{stats['lines_per_sec']:.1f} lines/sec, p50 {stats['p50_ms']:.0f} ms, p99 {stats['p99_ms']:.0f} ms",
+          file=sys.stderr)
+    print(format_parse_stats(adapter), file=sys.stderr)
 
-    lm = dspy.LM('ollama_chat/llama3.2', api_base='http://localhost:11434', api_key='')
-    dspy.configure(lm=lm)
+    if args.cascade:
+        cascade_stats = classifier.stats()
+        print(f"Cascade: {cascade_stats['local_answers']} answered locally, {cascade_stats['escalations']} escalated "
+              f"({cascade_stats['escalation_rate']:.1%} escalation rate)", file=sys.stderr)
+        if args.calibration:
+            with open(args.calibration, 'w', encoding='utf-8') as f:
+                for row in classifier.calibration:
+                    f.write(json.dumps(row) + '\n')
 
-    classifier = Classifier()
-    sentence = "This book was super fun to read, though not the last chapter."
-    result = classifier(sentence)
-    
-    print(f"Sentence: {sentence}")
-    print(f"Result: {result.sentiment} with confidence {result.confidence:.2f}.")
\ No newline at end of file
+if __name__ == "__main__":
+    run()
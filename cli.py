@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import argparse
+import importlib
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# subcommand -> (module, directory relative to ROOT, help)
+COMMANDS = {
+    "classify": ("classify", "", "classify the sentiment of a sentence or a file"),
+    "cot": ("cot", "", "answer a math question with Chain of Thought"),
+    "extract": ("infoextraction", "", "extract a title, headings and entities from text"),
+    "react": ("tool_example", "", "run the FizzBuzz ReAct agent"),
+    "eval-style": ("style_evaluation_metric", "style_evaluation", "score styled answers with an LM judge"),
+    "eval-models": ("multi_model_eval", "style_evaluation", "evaluate several models concurrently under provider limits"),
+    "eval-summary": ("summarization_metric", "summarize_metric", "score summaries with the key-idea metric"),
+}
+
+# Importing the CLI itself must not load any of these; they are imported by the subcommand that needs them
+HEAVY_MODULES = ("dspy", "litellm", "numpy", "dotenv")
+
+# Runs in a fresh interpreter, so the timing is a true cold import
+IMPORT_PROBE = """
+import sys, time, json
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+dspy = sys.modules.get("dspy")
+print(json.dumps({{
+    "seconds": seconds,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+    "configures_lm": bool(dspy and dspy.settings.lm is not None),
+}}))
+"""
+
+def load_command(name):
+    """Import the module behind a subcommand."""
+    module, directory, _ = COMMANDS[name]
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(module)
+
+def measure_import(module, directory=""):
+    """
+    Import `module` in a fresh interpreter and return its import time, the
+    heavy modules it pulled in, and whether it had side effects (configured
+    an LM or printed anything).
+    """
+    code = IMPORT_PROBE.format(path=os.path.join(ROOT, directory), module=module, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    lines = result.stdout.strip().splitlines()
+    report = json.loads(lines[-1])
+    report["printed"] = len(lines) > 1
+    return report
+
+def check_import_budget(budget_ms=100.0):
+    """
+    Check that importing the CLI stays under `budget_ms` without loading any
+    heavy module, and that no subcommand module has import-time side effects.
+    Prints a report and returns True when every check passes.
+    """
+    ok = True
+    cli = measure_import("cli")
+    cli_ms = cli["seconds"] * 1000
+    status = "ok" if cli_ms <= budget_ms and not cli["heavy"] else "FAIL"
+    ok = ok and status == "ok"
+    print(f"{'cli':<24} {cli_ms:>8.1f} ms  (budget {budget_ms:.0f} ms) {status}")
+    if cli["heavy"]:
+        print(f"  cli imports heavy modules: {', '.join(cli['heavy'])}")
+
+    for name, (module, directory, _) in COMMANDS.items():
+        report = measure_import(module, directory)
+        problems = []
+        if report["configures_lm"]:
+            problems.append("configures an LM")
+        if report["printed"]:
+            problems.append("prints output")
+        ok = ok and not problems
+        print(f"{name:<24} {report['seconds'] * 1000:>8.1f} ms  {', '.join(problems) or 'no side effects'}")
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the dspy examples. Each subcommand loads only the modules it needs.",
+        epilog="commands:\n" + "\n".join(f"  {name:<14} {help}" for name, (_, _, help) in COMMANDS.items())
+               + "\n  check-imports  check the import-time budget (--budget-ms)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--trace", metavar="PATH",
+                        help="trace every module and LM call; writes spans to PATH (JSONL) and PATH.prom")
+    parser.add_argument("--trace-top", type=int, default=10, help="spans to list in the trace report")
+    parser.add_argument("command", choices=list(COMMANDS) + ["check-imports"], metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the command (see <command> --help)")
+    args = parser.parse_args(argv)
+
+    if args.command == "check-imports":
+        check_parser = argparse.ArgumentParser(prog="cli.py check-imports")
+        check_parser.add_argument("--budget-ms", type=float, default=100.0)
+        check_args = check_parser.parse_args(args.args)
+        sys.exit(0 if check_import_budget(check_args.budget_ms) else 1)
+
+    # So the subcommand's own --help reads "cli.py <command>"
+    sys.argv[0] = f"{os.path.basename(sys.argv[0])} {args.command}"
+    module = load_command(args.command)
+    if args.trace:
+        from tracing import traced
+        with traced(args.trace, args.trace + ".prom", top=args.trace_top):
+            module.run(args.args)
+    else:
+        module.run(args.args)
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,49 @@ import dspy
 
 from dotenv import load_dotenv
 import os
+import argparse
 
-load_dotenv()
+def run(argv=None):
+    """Answer a math question with the Chain of Thought primitive."""
+    load_dotenv()
 
-api_key = os.environ.get("OPENAI_API_KEY")
-if not api_key:
-   print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
-   exit(1)
-lm = dspy.LM('openai/gpt-4o-mini', api_key=api_key, temperature=1.0, max_tokens=10_000)
+    parser = argparse.ArgumentParser(description="Chain of Thought over a math question.")
+    parser.add_argument("--question", default="Two dice are tossed. What is the probability that the sum equals two?")
+    parser.add_argument("--slm", action="store_true", help="use the local SLM instead of gpt-4o-mini")
+    parser.add_argument("--samples", type=int, default=1, help="vote over up to this many concurrent samples")
+    parser.add_argument("--agree", type=int, default=3, help="matching answers that stop the vote early")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--stream", action="store_true",
+                        help="print the reasoning and the answer as they arrive and report token latency")
+    args = parser.parse_args(argv)
 
-dspy.configure(lm=lm)
+    if args.slm:
+        from slm_client import get_slm_lm
+        lm = get_slm_lm()
+    else:
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+            exit(1)
+        lm = dspy.LM('openai/gpt-4o-mini', api_key=api_key, temperature=1.0, max_tokens=10_000)
 
-math = dspy.ChainOfThought("question -> answer: float")
-result = math(question="Two dice are tossed. What is the probability that the sum equals two?")
+    dspy.configure(lm=lm)
 
-print(f"Result: {result}.")
\ No newline at end of file
+    if args.stream:
+        from streaming import format_stream_stats, stream_predict
+        result, stats = stream_predict(dspy.ChainOfThought("question -> answer: float"), lm, question=args.question)
+        print(f"\nResult: {result}.")
+        print(format_stream_stats(stats))
+        return
+
+    if args.samples > 1:
+        from self_consistency import SelfConsistentCoT
+        math = SelfConsistentCoT(lm, samples=args.samples, agree=args.agree, tolerance=args.tolerance)
+    else:
+        math = dspy.ChainOfThought("question -> answer: float")
+    result = math(question=args.question)
+
+    print(f"Result: {result}.")
+
+if __name__ == "__main__":
+    run()
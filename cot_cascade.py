@@ -0,0 +1,178 @@
+import dspy
+
+from dotenv import load_dotenv
+from slm_client import get_slm_lm
+from timing import percentile
+import os
+import math
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# gpt-4o list prices in USD per million tokens, used when the provider reports no cost
+REMOTE_PRICE_PER_MTOK = {'prompt': 2.50, 'completion': 10.00}
+
+DEFAULT_QUESTIONS = [
+    "Two dice are tossed. What is the probability that the sum equals two?",
+    "A train travels 120 km in 1.5 hours. What is its average speed in km/h?",
+    "What is 15% of 240?",
+    "A coin is flipped three times. What is the probability of getting exactly two heads?",
+    "If 3x + 7 = 22, what is x?",
+]
+
+def call_cost(entry):
+    """Return the USD cost of one LM history entry."""
+    if entry.get('cost'):
+        return entry['cost']
+    usage = entry.get('usage') or {}
+    return (usage.get('prompt_tokens', 0) * REMOTE_PRICE_PER_MTOK['prompt']
+            + usage.get('completion_tokens', 0) * REMOTE_PRICE_PER_MTOK['completion']) / 1e6
+
+class TierStats:
+    """Latency and cost counters for one tier of the cascade."""
+
+    def __init__(self):
+        self.calls = 0
+        self.latencies = []
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency, cost=0.0):
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(latency)
+            self.cost += cost
+
+class CascadeCoT(dspy.Module):
+    """
+    Answer with the local SLM first and escalate to the remote model only
+    when the SLM answer fails a check.
+
+    The SLM is sampled `samples` times in parallel (the first sample at the
+    LM's own settings, the rest at `temperature`). Its answer is accepted when
+    every sample parses to a finite number and all samples agree within
+    `tolerance`; otherwise the question goes to the remote model.
+    """
+
+    def __init__(self, slm, remote, signature="question -> answer: float", samples=2,
+                 tolerance=1e-3, temperature=0.7):
+        super().__init__()
+        self.math = dspy.ChainOfThought(signature)
+        self.slm = slm
+        self.remote = remote
+        self.samples = samples
+        self.tolerance = tolerance
+        # Extra samples must not be served from the cache, or they would all agree
+        self.slm_samplers = [slm] + [slm.copy(temperature=temperature, cache=False) for _ in range(samples - 1)]
+        self.slm_stats = TierStats()
+        self.remote_stats = TierStats()
+        self.questions = 0
+        self.escalations = 0
+
+    def _sample(self, lm, question):
+        with dspy.context(lm=lm):
+            try:
+                result = self.math(question=question)
+                answer = float(result.answer)
+            except Exception:
+                return None, None
+        return (answer, result) if math.isfinite(answer) else (None, None)
+
+    def _accept(self, answers):
+        if any(a is None for a in answers):
+            return False
+        return max(answers) - min(answers) <= self.tolerance * max(1.0, abs(answers[0]))
+
+    def forward(self, question):
+        self.questions += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.slm_samplers)) as pool:
+            samples = list(pool.map(lambda lm: self._sample(lm, question), self.slm_samplers))
+        self.slm_stats.record(time.perf_counter() - start)
+
+        answers = [answer for answer, _ in samples]
+        if self._accept(answers):
+            result = samples[0][1]
+            return dspy.Prediction(reasoning=result.reasoning, answer=answers[0], tier='slm', slm_answers=answers)
+
+        self.escalations += 1
+        start = time.perf_counter()
+        with dspy.context(lm=self.remote):
+            result = self.math(question=question)
+        cost = call_cost(self.remote.history[-1]) if self.remote.history else 0.0
+        self.remote_stats.record(time.perf_counter() - start, cost)
+        return dspy.Prediction(reasoning=result.reasoning, answer=result.answer, tier='remote', slm_answers=answers)
+
+    def stats(self):
+        """Per-tier latency, escalation rate and spend of the questions answered so far."""
+        return {
+            'questions': self.questions,
+            'escalations': self.escalations,
+            'escalation_rate': self.escalations / self.questions if self.questions else 0.0,
+            'slm_p50': percentile(self.slm_stats.latencies, 50),
+            'remote_p50': percentile(self.remote_stats.latencies, 50),
+            'cost': self.slm_stats.cost + self.remote_stats.cost,
+        }
+
+def remote_only(remote, questions):
+    """Answer every question with the remote model and return (latencies, cost)."""
+    # The cascade has already asked the remote model some of these, so keep its cache out of the timings
+    remote = remote.copy(cache=False)
+    program = dspy.ChainOfThought("question -> answer: float")
+    latencies, cost = [], 0.0
+    with dspy.context(lm=remote):
+        for question in questions:
+            start = time.perf_counter()
+            program(question=question)
+            latencies.append(time.perf_counter() - start)
+            cost += call_cost(remote.history[-1]) if remote.history else 0.0
+    return latencies, cost
+
+def run(argv=None):
+    """Answer math questions with the SLM-first cascade from the command line."""
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Answer math questions on the local SLM, escalating to gpt-4o when needed.")
+    parser.add_argument("--questions", help="text file with one question per line")
+    parser.add_argument("--samples", type=int, default=2, help="SLM samples that must agree")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--baseline", action="store_true", help="also run every question on gpt-4o alone for comparison")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+        exit(1)
+
+    remote = dspy.LM('openai/gpt-4o', api_key=api_key)
+    slm = get_slm_lm()
+    dspy.configure(lm=slm)
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, 'r', encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    cascade = CascadeCoT(slm, remote, samples=args.samples, tolerance=args.tolerance)
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        result = cascade(question=question)
+        latencies.append(time.perf_counter() - start)
+        print(f"[{result.tier}] {question} -> {result.answer}")
+
+    stats = cascade.stats()
+    print(f"\nEscalated {stats['escalations']} of {stats['questions']} questions ({stats['escalation_rate']:.0%})")
+    print(f"Tier p50 latency: SLM {stats['slm_p50']:.2f}s, remote {stats['remote_p50']:.2f}s")
+    print(f"Cascade: p50 latency {percentile(latencies, 50):.2f}s, spend ${stats['cost']:.5f}")
+
+    if args.baseline:
+        baseline_latencies, baseline_cost = remote_only(remote, questions)
+        print(f"gpt-4o only: p50 latency {percentile(baseline_latencies, 50):.2f}s, spend ${baseline_cost:.5f}")
+        if baseline_cost:
+            print(f"Spend reduction: {1 - stats['cost'] / baseline_cost:.0%}")
+
+if __name__ == "__main__":
+    run()
@@ -1,24 +1,36 @@
 import dspy
 
 from dotenv import load_dotenv
-import os
+from slm_client import get_slm_lm
+import argparse
 
-load_dotenv()
+def run(argv=None):
+    load_dotenv()
 
-if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Chain of Thought over a math question on the local SLM.")
+    parser.add_argument("--samples", type=int, default=1, help="vote over up to this many concurrent samples")
+    parser.add_argument("--agree", type=int, default=3, help="matching answers that stop the vote early")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    args = parser.parse_args(argv)
 
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
-        exit(1)
+    # api_key = os.environ.get("OPENAI_API_KEY")
+    # if not api_key:
+    #     print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+    #     exit(1)
+    # lm = dspy.LM('openai/gpt-4o', api_key=api_key)
 
-    lm = dspy.LM('openai/gpt-4o', api_key=api_key)
+    lm = get_slm_lm()
     dspy.configure(lm=lm)
 
-    # lm = dspy.LM('ollama_chat/llama3.2', api_base='http://localhost:11434', api_key='')
-    dspy.configure(lm=lm)
-
-    math = dspy.ChainOfThought("question -> answer: float")
+    if args.samples > 1:
+        # A single llama3.2 sample is unreliable; vote, and stop as soon as enough samples agree
+        from self_consistency import SelfConsistentCoT
+        math = SelfConsistentCoT(lm, samples=args.samples, agree=args.agree, tolerance=args.tolerance)
+    else:
+        math = dspy.ChainOfThought("question -> answer: float")
     result = math(question="Two dice are tossed. What is the probability that the sum equals two?")
 
-    print(f"Result: {result}.")
\ No newline at end of file
+    print(f"Result: {result}.")
+
+if __name__ == "__main__":
+    run()
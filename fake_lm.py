@@ -0,0 +1,146 @@
+import dspy
+import json
+import time
+import asyncio
+import threading
+
+from dspy.lm15 import Message, Response, TextPart, Usage, response_to_events
+
+class FakeEngine:
+    """
+    The dspy engine behind FakeLM: answers each request with the first
+    canned output whose pattern is in its text, after `latency` seconds.
+
+    Engines are shared by the copies of an LM, so the call counters here
+    cover every lm.copy() as well.
+    """
+
+    def __init__(self, responses, latency=0.0):
+        self.responses = responses
+        self.latency = latency
+        self.calls = 0
+        self.lm_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.lm_seconds = 0.0
+
+    def _prompt_text(self, request):
+        parts = []
+        if request.system is not None:
+            parts.append(request.system if isinstance(request.system, str)
+                         else "".join(part.text for part in request.system))
+        parts.extend(message.text or "" for message in request.messages)
+        return "\n".join(parts)
+
+    def _render(self, output):
+        if isinstance(output, str):
+            return output
+        sections = []
+        for name, value in output.items():
+            if not isinstance(value, str):
+                value = json.dumps(value)
+            sections.append(f"[[ ## {name} ## ]]\n{value}")
+        sections.append("[[ ## completed ## ]]")
+        return "\n\n".join(sections)
+
+    def _match(self, request):
+        text = self._prompt_text(request)
+        for pattern, output in self.responses:
+            if pattern in text:
+                return text, output
+        raise ValueError(f"FakeLM has no canned response for prompt: {text[:200]!r}")
+
+    def _response(self, request, text, output, start):
+        content = self._render(output)
+        with self._lock:
+            self.calls += 1
+            self.lm_seconds += time.perf_counter() - start
+
+        # Rough token counts (~4 characters per token), enough for relative comparisons
+        input_tokens = len(text) // 4
+        output_tokens = len(content) // 4
+        return Response(
+            id=None,
+            model=request.model,
+            message=Message.assistant([TextPart(content)]),
+            finish_reason="stop",
+            usage=Usage(input_tokens=input_tokens, output_tokens=output_tokens,
+                        total_tokens=input_tokens + output_tokens),
+        )
+
+    def complete(self, request):
+        text, output = self._match(request)
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response(request, text, output, start)
+
+    def stream(self, request):
+        return response_to_events(self.complete(request))
+
+    def close(self):
+        pass
+
+class AsyncFakeEngine:
+    """The async counterpart of a FakeEngine; it sleeps on the event loop so concurrent acall()s overlap and can be cancelled."""
+
+    def __init__(self, sync):
+        self.sync = sync
+
+    async def complete(self, request):
+        text, output = self.sync._match(request)
+        start = time.perf_counter()
+        if self.sync.latency:
+            await asyncio.sleep(self.sync.latency)
+        return self.sync._response(request, text, output, start)
+
+    async def stream(self, request):
+        for event in response_to_events(await self.complete(request)):
+            yield event
+
+    async def aclose(self):
+        pass
+
+class FakeLM(dspy.LM):
+    """
+    A deterministic, in-process stand-in for dspy.LM that never touches the network.
+
+    `responses` is a list of (pattern, output) pairs. The first pattern found
+    in the prompt picks the output: a dict of output field -> value is
+    rendered the way dspy's ChatAdapter expects, a plain string is returned
+    as is (for direct lm(messages=...) calls). Every call sleeps for
+    `latency` seconds to simulate model time, which is tracked separately
+    so benchmarks can report the overhead of our own code. The replies come
+    from a FakeEngine, so dspy's own call path (cache, history, callbacks,
+    usage) runs as it does for a real provider; copies share the counters.
+    """
+
+    def __init__(self, responses, latency=0.0, model="fake/lm", cache=False):
+        engine = FakeEngine(responses, latency)
+        super().__init__(model, temperature=0.0, max_tokens=1000, cache=cache,
+                         engine=engine, async_engine=AsyncFakeEngine(engine))
+        self.fake_engine = engine
+
+    @property
+    def responses(self):
+        return self.fake_engine.responses
+
+    @property
+    def latency(self):
+        return self.fake_engine.latency
+
+    @property
+    def calls(self):
+        return self.fake_engine.calls
+
+    @property
+    def lm_seconds(self):
+        return self.fake_engine.lm_seconds
+
+    def reset(self):
+        """Clear the call counters and history."""
+        self.fake_engine.reset()
+        self.history = []
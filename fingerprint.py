@@ -0,0 +1,11 @@
+def signature_fingerprint(signature):
+    """
+    Describe a signature (instructions, fields and their descriptions)
+    as a string, so a change to the prompt invalidates cached outputs and
+    stored results keyed on it.
+    """
+    parts = [signature.__name__, signature.instructions]
+    for name, field in signature.fields.items():
+        extra = field.json_schema_extra or {}
+        parts.append(f"{name}:{extra.get('__dspy_field_type', '')}:{extra.get('desc', '')}")
+    return "\n".join(parts)
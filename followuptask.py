@@ -1,20 +1,171 @@
 import dspy
 
 from dotenv import load_dotenv
+from lm_cache import CachedLM, format_stats
+from chunking import iter_chunks, map_bounded, estimate_tokens
 import os
+import re
+import sys
+import time
+import argparse
 
-load_dotenv()
+DEFAULT_TEXT = "Our quarterly sales report shows a 15% revenue increase, but customer satisfaction scores dropped to 3.2/5. The marketing campaign launched last month generated 2,000 new leads, though conversion rates remain at 8%. Supply chain delays affected 30% of orders in the northeast region. Additionally, three key team members submitted resignation letters this week, and our main competitor just announced a major product launch scheduled for next month."
 
-# lm = dspy.LM('ollama_chat/llama3.2', api_base='http://localhost:11434', api_key='')
+TASK_PROMPT = "Find the top {k} follow up tasks in this text. Make sure the most actionable items are summarized in a single sentence. The text is: '{text}'"
 
-api_key = os.environ.get("OPENAI_API_KEY")
-if not api_key:
-   print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
-   exit(1)
-lm = dspy.LM('openai/gpt-4o-mini', api_key=api_key, temperature=1.0, max_tokens=10_000)
+MAP_PROMPT = ("List the follow up tasks in this excerpt, at most {limit}, one per line, each summarized in a "
+              "single actionable sentence. Reply NONE if there are none. The excerpt is: '{text}'")
 
-dspy.configure(lm=lm)
+REDUCE_PROMPT = ("These candidate follow up tasks were extracted from parts of one long document; the number in "
+                 "brackets is how many parts mention each. Merge duplicates and reply with only the top {k} most "
+                 "actionable tasks as a numbered list, one sentence each.\n\n{candidates}")
 
-lm_message = lm(messages=[{"role": "user", "content": "Find the top 3 follow up tasks in this text. Make sure the most actionable items are summarized in a single sentence. The text is: 'Our quarterly sales report shows a 15% revenue increase, but customer satisfaction scores dropped to 3.2/5. The marketing campaign launched last month generated 2,000 new leads, though conversion rates remain at 8%. Supply chain delays affected 30% of orders in the northeast region. Additionally, three key team members submitted resignation letters this week, and our main competitor just announced a major product launch scheduled for next month.'"}])
+def parse_tasks(text):
+    """Split an LM reply into task sentences, dropping bullets, numbering and NONE."""
+    tasks = []
+    for line in str(text).splitlines():
+        line = re.sub(r'^\s*(?:[-*•]|\d+[.)])\s*', '', line).strip()
+        if line and line.strip('.').upper() != 'NONE':
+            tasks.append(line)
+    return tasks
 
-print(f"Response: {lm_message}")
\ No newline at end of file
+def task_words(task):
+    return set(re.findall(r'[a-z0-9]+', task.lower()))
+
+def dedupe_tasks(tasks, similarity=0.7):
+    """
+    Collapse near-duplicate tasks (word-set Jaccard similarity at or above
+    `similarity`) and return [(task, support)] sorted by support, where
+    support is how many candidates were merged into the task.
+    """
+    merged = []
+    for task in tasks:
+        words = task_words(task)
+        for entry in merged:
+            union = words | entry['words']
+            if union and len(words & entry['words']) / len(union) >= similarity:
+                entry['support'] += 1
+                break
+        else:
+            merged.append({'task': task, 'words': words, 'support': 1})
+    merged.sort(key=lambda entry: -entry['support'])
+    return [(entry['task'], entry['support']) for entry in merged]
+
+def usage_tokens(lm, start):
+    """Total tokens of the LM calls made since history index `start`."""
+    return sum((entry.get('usage') or {}).get('total_tokens', 0) for entry in lm.history[start:])
+
+def single_call(lm, text, k=3):
+    """Find the top `k` follow-up tasks with one LM call over the whole text."""
+    return lm(messages=[{"role": "user", "content": TASK_PROMPT.format(k=k, text=text)}])[0]
+
+def map_reduce(lm, source, k=3, chunk_tokens=1024, map_tokens=256, reduce_budget=2048, workers=4):
+    """
+    Find the top `k` follow-up tasks of a long text (a string or a text file
+    object) with a map-reduce over chunks.
+
+    The map step streams `source` in chunks of `chunk_tokens` and asks for
+    the tasks of each chunk with a `map_tokens` completion budget, on at
+    most `workers` concurrent calls. The reduce step dedupes the candidates
+    locally, then asks the LM to merge and rank them to the top `k`; if the
+    candidates exceed `reduce_budget` tokens they are reduced in groups first.
+    """
+    def extract(chunk):
+        prompt = MAP_PROMPT.format(limit=k, text=chunk)
+        return parse_tasks(lm(messages=[{"role": "user", "content": prompt}], max_tokens=map_tokens)[0])
+
+    candidates, chunks, failed = [], 0, 0
+    for index, tasks, error in map_bounded(extract, iter_chunks(source, chunk_tokens, chunk_tokens // 8), workers):
+        chunks += 1
+        if error is not None:
+            failed += 1
+            print(f"Chunk {index} failed: {error}", file=sys.stderr)
+            continue
+        candidates.extend(tasks)
+
+    ranked = dedupe_tasks(candidates)
+    reduce_calls = 0
+    while len(ranked) > k:
+        lines = [f"- [{support}] {task}" for task, support in ranked]
+        groups, group, size = [], [], 0
+        for line in lines:
+            if group and size + estimate_tokens(line) > reduce_budget:
+                groups.append(group)
+                group, size = [], 0
+            group.append(line)
+            size += estimate_tokens(line)
+        groups.append(group)
+
+        reduced = []
+        for group in groups:
+            prompt = REDUCE_PROMPT.format(k=k, candidates="\n".join(group))
+            reduced.extend(parse_tasks(lm(messages=[{"role": "user", "content": prompt}], max_tokens=map_tokens)[0])[:k])
+            reduce_calls += 1
+        if len(groups) == 1 or len(reduced) >= len(ranked):
+            ranked = [(task, 1) for task in reduced]
+            break
+        ranked = dedupe_tasks(reduced)
+
+    return {
+        'tasks': [task for task, _ in ranked[:k]],
+        'chunks': chunks,
+        'failed': failed,
+        'candidates': len(candidates),
+        'reduce_calls': reduce_calls,
+    }
+
+def run(argv=None):
+    """Find the top follow-up tasks in a text, or in a long --file with map-reduce."""
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Find the top follow up tasks in a text.")
+    parser.add_argument("--file", help="long text file (transcript, report archive) to map-reduce over")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--chunk-tokens", type=int, default=1024)
+    parser.add_argument("--map-tokens", type=int, default=256, help="completion budget of each map and reduce call")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--compare", action="store_true", help="also run the single-call approach on the whole file")
+    parser.add_argument("--cache-sampled", action="store_true",
+                        help="cache the temperature 1.0 replies, so a rerun on the same text reuses the first answer")
+    args = parser.parse_args(argv)
+
+    # lm = dspy.LM('ollama_chat/llama3.2', api_base='http://localhost:11434', api_key='')
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+        exit(1)
+    # Sampled at temperature 1.0, so caching (ours and dspy's) is off unless asked for with --cache-sampled
+    lm = CachedLM(dspy.LM('openai/gpt-4o-mini', api_key=api_key, temperature=1.0, max_tokens=10_000,
+                          cache=args.cache_sampled), allow_nondeterministic=args.cache_sampled)
+
+    dspy.configure(lm=lm.lm)
+
+    if args.file is None:
+        lm_message = single_call(lm, DEFAULT_TEXT, k=args.top_k)
+
+        print(f"Response: {lm_message}")
+        print(format_stats(lm.cache))
+        return
+
+    start, history_start = time.perf_counter(), len(lm.history)
+    with open(args.file, 'r', encoding='utf-8') as f:
+        report = map_reduce(lm, f, k=args.top_k, chunk_tokens=args.chunk_tokens,
+                            map_tokens=args.map_tokens, workers=args.workers)
+    seconds, tokens = time.perf_counter() - start, usage_tokens(lm, history_start)
+
+    for i, task in enumerate(report['tasks'], 1):
+        print(f"{i}. {task}")
+    print(f"\nMap-reduce: {report['chunks']} chunks ({report['failed']} failed), {report['candidates']} candidates, "
+          f"{report['reduce_calls']} reduce calls, {tokens} tokens in {seconds:.1f}s")
+
+    if args.compare:
+        start, history_start = time.perf_counter(), len(lm.history)
+        with open(args.file, 'r', encoding='utf-8') as f:
+            response = single_call(lm, f.read(), k=args.top_k)
+        seconds, tokens = time.perf_counter() - start, usage_tokens(lm, history_start)
+        print(f"\nSingle call:\n{response}\n\nSingle call: {tokens} tokens in {seconds:.1f}s")
+    print(format_stats(lm.cache))
+
+if __name__ == "__main__":
+    run()
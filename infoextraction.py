@@ -1,7 +1,15 @@
 import dspy
+import re
+import sys
+import time
+import argparse
+import contextlib
+import tracemalloc
 
-lm = dspy.LM('ollama_chat/llama3.2', api_base='http://localhost:11434', api_key='')
-dspy.configure(lm=lm)
+from chunking import iter_chunks, map_bounded
+from collections import Counter
+from slm_client import get_slm_lm
+from structured_output import InstrumentedChatAdapter, JSONModeAdapter, format_parse_stats
 
 class ExtractInfo(dspy.Signature):
     """Extract structured information from text."""
@@ -10,8 +18,165 @@ class ExtractInfo(dspy.Signature):
     headings: list[str] = dspy.OutputField()
     entities: list[dict[str, str]] = dspy.OutputField(desc="entities and metadata")
 
-module = dspy.Predict(ExtractInfo)
-text = "Dr. Sarah Chen, Stanford professor, published research on renewable energy storage while consulting for Google's sustainability team and Tesla's battery division."
-result = module(text=text)
+# Keys that hold an entity's name, in order of preference
+ENTITY_NAME_KEYS = ("name", "entity", "text", "value")
 
-print(f"Result: {result}.")
\ No newline at end of file
+def normalize_name(name):
+    """Lower-case, drop possessives and punctuation, collapse whitespace."""
+    name = re.sub(r"['’]s\b", "", str(name).lower())
+    name = re.sub(r'[^\w\s]', ' ', name)
+    return re.sub(r'\s+', ' ', name).strip()
+
+def entity_name(entity):
+    """Return the name of an extracted entity dict."""
+    for key in ENTITY_NAME_KEYS:
+        if entity.get(key):
+            return entity[key]
+    return next(iter(entity.values()), "")
+
+class ExtractionMerger:
+    """
+    Merge per-chunk ExtractInfo predictions into one result.
+
+    Headings and entities are deduplicated by normalized name; the first
+    occurrence in document order wins and later occurrences only fill in
+    missing entity metadata. Chunks may be added in any order. The title
+    is the one proposed by most chunks, ties going to the earliest.
+    """
+
+    def __init__(self):
+        self.headings = {}
+        self.entities = {}
+        self.titles = Counter()
+        self.first_title = {}
+
+    def add(self, index, prediction):
+        title = str(prediction.title or "").strip()
+        if title:
+            key = normalize_name(title)
+            self.titles[key] += 1
+            if key not in self.first_title or index < self.first_title[key][0]:
+                self.first_title[key] = (index, title)
+
+        # Items are ordered by (chunk, position in the chunk), whatever order the chunks arrive in
+        for position, heading in enumerate(prediction.headings or []):
+            key = normalize_name(heading)
+            if key and (key not in self.headings or (index, position) < self.headings[key][0]):
+                self.headings[key] = ((index, position), str(heading).strip())
+
+        for position, entity in enumerate(prediction.entities or []):
+            if not isinstance(entity, dict):
+                continue
+            key = normalize_name(entity_name(entity))
+            if not key:
+                continue
+            if key not in self.entities:
+                self.entities[key] = ((index, position), dict(entity))
+                continue
+            first, merged = self.entities[key]
+            if (index, position) < first:
+                merged, entity = dict(entity), merged
+                first = (index, position)
+            for field, value in entity.items():
+                merged.setdefault(field, value)
+            self.entities[key] = (first, merged)
+
+    def result(self):
+        title = ""
+        if self.titles:
+            key = max(self.titles, key=lambda k: (self.titles[k], -self.first_title[k][0]))
+            title = self.first_title[key][1]
+        return dspy.Prediction(
+            title=title,
+            headings=[heading for _, heading in sorted(self.headings.values(), key=lambda item: item[0])],
+            entities=[entity for _, entity in sorted(self.entities.values(), key=lambda item: item[0])],
+        )
+
+class ChunkedExtractor:
+    """
+    Run ExtractInfo over a long document in overlapping, token-budgeted
+    chunks on `workers` threads, and merge the chunk results.
+
+    The document is streamed through iter_chunks, and only the chunks in
+    flight are held in memory, so files larger than memory work.
+    """
+
+    def __init__(self, max_tokens=512, overlap_tokens=64, workers=4):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.workers = workers
+        self.module = dspy.Predict(ExtractInfo)
+
+    def _extract(self, chunk):
+        # dspy's trace would otherwise keep every chunk's text alive until the run ends
+        with dspy.context(trace=None):
+            return self.module(text=chunk)
+
+    def __call__(self, source):
+        """Extract from `source`, a string or a text file object; returns (prediction, stats)."""
+        merger = ExtractionMerger()
+        chunks = failed = 0
+        start = time.perf_counter()
+
+        for index, prediction, error in map_bounded(
+                self._extract,
+                iter_chunks(source, self.max_tokens, self.overlap_tokens),
+                workers=self.workers):
+            chunks += 1
+            if error is not None:
+                failed += 1
+                print(f"Chunk {index} failed: {error}", file=sys.stderr)
+                continue
+            merger.add(index, prediction)
+
+        elapsed = time.perf_counter() - start
+        return merger.result(), {
+            "chunks": chunks,
+            "failed": failed,
+            "seconds": elapsed,
+            "chunks_per_sec": chunks / elapsed if elapsed else 0.0,
+        }
+
+def run(argv=None):
+    """Extract a title, headings and entities from --text (or a demo sentence), or from a whole --file."""
+    parser = argparse.ArgumentParser(description="Extract structured information from text.")
+    parser.add_argument("--text", default="Dr. Sarah Chen, Stanford professor, published research on renewable energy storage while consulting for Google's sustainability team and Tesla's battery division.")
+    parser.add_argument("--file", help="extract from a (large) text file in chunks, or - for stdin")
+    parser.add_argument("--chunk-tokens", type=int, default=512)
+    parser.add_argument("--overlap-tokens", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--json-mode", action="store_true",
+                        help="constrain the LM to a JSON schema of the outputs, repairing locally before re-asking")
+    args = parser.parse_args(argv)
+
+    lm = get_slm_lm()
+    adapter = JSONModeAdapter() if args.json_mode else InstrumentedChatAdapter()
+    # A long document makes thousands of calls; don't keep them all in the LM history
+    dspy.configure(lm=lm, adapter=adapter, disable_history=args.file is not None)
+
+    if args.file is None:
+        module = dspy.Predict(ExtractInfo)
+        result = module(text=args.text)
+
+        print(f"Result: {result}.")
+        print(format_parse_stats(adapter))
+        return
+
+    extractor = ChunkedExtractor(args.chunk_tokens, args.overlap_tokens, args.workers)
+    # stdin is wrapped so that leaving the `with` does not close it
+    input_file = contextlib.nullcontext(sys.stdin) if args.file == "-" else open(args.file, 'r', encoding='utf-8')
+    tracemalloc.start()
+    with input_file as source:
+        result, stats = extractor(source)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Title: {result.title}")
+    print(f"Headings: {result.headings}")
+    print(f"Entities: {result.entities}")
+    print(f"\n{stats['chunks']} chunks ({stats['failed']} failed) in {stats['seconds']:.1f}s: "
+          f"{stats['chunks_per_sec']:.2f} chunks/sec, peak memory {peak / 1024 / 1024:.1f} MB")
+    print(format_parse_stats(adapter))
+
+if __name__ == "__main__":
+    run()
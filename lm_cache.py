@@ -0,0 +1,202 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "DSPY_RESPONSE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "dspysimple", "responses.sqlite")
+)
+
+# Request parameters that change the response; everything else (api keys, base urls) is ignored
+SAMPLING_PARAMS = ("temperature", "max_tokens", "max_completion_tokens", "top_p", "top_k", "n", "stop",
+                   "seed", "presence_penalty", "frequency_penalty", "response_format", "logprobs")
+
+def normalize_messages(messages):
+    """Lower-case roles and collapse whitespace in contents, so cosmetic differences share an entry."""
+    normalized = []
+    for message in messages or []:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            content = re.sub(r'\s+', ' ', content).strip()
+        normalized.append({**message, "role": str(message.get("role", "")).strip().lower(), "content": content})
+    return normalized
+
+class ResponseCache:
+    """
+    A persistent LM response cache in SQLite, shared by every script and process.
+
+    Entries expire `ttl` seconds after they were written, and when the stored
+    responses exceed `max_bytes` the least recently used ones are evicted. The
+    database runs in WAL mode and every write is one short IMMEDIATE
+    transaction, so many worker processes can use the same file.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=100 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.saved_seconds = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    latency REAL NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('total_bytes', 0)")
+
+    def _connection(self):
+        """Return this thread's connection, reconnecting after a fork."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def key(self, model, messages, params):
+        """Return the cache key of a request."""
+        sampling = {name: params[name] for name in SAMPLING_PARAMS if params.get(name) is not None}
+        payload = json.dumps(
+            {"model": model, "messages": normalize_messages(messages), "params": sampling},
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for `key`, or None if it is missing or expired."""
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT response, latency FROM responses WHERE key = ? AND created > ?", (key, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += row[1]
+        return json.loads(row[0])
+
+    def put(self, key, model, response, latency):
+        """Store a response, then drop expired entries and evict until under `max_bytes`."""
+        data = json.dumps(response)
+        size = len(data.encode("utf-8"))
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            old = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, data, size, latency, now, now),
+            )
+            conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_bytes'", (size - (old[0] if old else 0),))
+
+            expired = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses WHERE created <= ?", (now - self.ttl,)
+            ).fetchone()[0]
+            if expired:
+                conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+                conn.execute("UPDATE meta SET value = value - ? WHERE name = 'total_bytes'", (expired,))
+
+            total = conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+            if total > self.max_bytes:
+                freed = 0
+                victims = []
+                for victim, victim_size in conn.execute(
+                        "SELECT key, size FROM responses WHERE key != ? ORDER BY accessed", (key,)):
+                    if total - freed <= self.max_bytes:
+                        break
+                    victims.append((victim,))
+                    freed += victim_size
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+                conn.execute("UPDATE meta SET value = value - ? WHERE name = 'total_bytes'", (freed,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        """Return hit/miss counters and the LM latency saved by hits in this process."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
+
+_default_cache = None
+
+def get_default_cache():
+    """Return the process-wide cache at DEFAULT_CACHE_PATH."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
+
+class CachedLM:
+    """
+    Wrap a dspy.LM so direct lm(messages=...) calls go through the shared ResponseCache.
+
+    Requests sampled with a temperature above zero are non-deterministic, so
+    they bypass the cache unless allow_nondeterministic=True. All other
+    attributes are forwarded to the wrapped LM.
+    """
+
+    def __init__(self, lm, cache=None, allow_nondeterministic=False):
+        self.lm = lm
+        self.cache = cache or get_default_cache()
+        self.allow_nondeterministic = allow_nondeterministic
+
+    def __getattr__(self, name):
+        return getattr(self.lm, name)
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        if messages is None:
+            messages = [{"role": "user", "content": prompt}]
+        params = {**self.lm.kwargs, **kwargs}
+
+        if (params.get("temperature") or 0) > 0 and not self.allow_nondeterministic:
+            with self.cache._lock:
+                self.cache.skipped += 1
+            return self.lm(messages=messages, **kwargs)
+
+        key = self.cache.key(self.lm.model, messages, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        response = self.lm(messages=messages, **kwargs)
+        self.cache.put(key, self.lm.model, response, time.perf_counter() - start)
+        return response
+
+def format_stats(cache):
+    """One-line summary of a cache's counters."""
+    stats = cache.stats()
+    return (f"Response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['skipped']} skipped "
+            f"({stats['hit_rate']:.0%} hit rate, {stats['saved_seconds']:.2f}s saved)")
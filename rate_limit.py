@@ -0,0 +1,450 @@
+import copy
+import time
+import argparse
+import random
+import asyncio
+import threading
+
+from contextlib import contextmanager
+
+from chunking import estimate_tokens
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled at `per_minute` tokens per minute,
+    holding at most `burst` tokens (default: one second's worth, at least 1).
+    """
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount=1.0):
+        """
+        Take `amount` tokens now, going into debt if needed, and return the
+        seconds until the debt is paid off: the caller waits that long before
+        going ahead. Reservations are served in order, and async callers can
+        wait without holding a thread.
+        """
+        # A request larger than the bucket would wait forever; let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, amount=1.0):
+        """Block until `amount` tokens are available, take them, and return the seconds waited."""
+        delay = self.reserve(amount)
+        time.sleep(delay)
+        return delay
+
+    def charge(self, amount):
+        """Take `amount` tokens without waiting; the bucket may go into debt, which later acquires pay off."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+
+class ProviderLimiter:
+    """Concurrency and requests-per-minute limits shared by every LM of one provider."""
+
+    def __init__(self, provider, max_concurrency=4, rpm=None):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.bucket = TokenBucket(rpm) if rpm else None
+        self.requests = 0
+        self.wait_seconds = 0.0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        """Hold one concurrency slot and one request of the per-minute budget for the block."""
+        start = time.perf_counter()
+        with self.semaphore:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            self._count(start)
+            yield
+
+    def _count(self, start):
+        with self.lock:
+            self.requests += 1
+            self.wait_seconds += time.perf_counter() - start
+
+    def run(self, call, tokens=0, usage=None):
+        """Run `call()` in a slot. `tokens` and `usage` are accepted for AdaptiveLimiter compatibility."""
+        with self.slot():
+            return call()
+
+    async def arun(self, call, tokens=0, usage=None):
+        start = time.perf_counter()
+        await poll(lambda: self.semaphore.acquire(blocking=False))
+        try:
+            if self.bucket is not None:
+                await asyncio.sleep(self.bucket.reserve())
+            self._count(start)
+            return await call()
+        finally:
+            self.semaphore.release()
+
+async def poll(try_acquire):
+    """
+    Wait until `try_acquire()` succeeds. The limiters' slots are threading
+    primitives; blocking on one in a worker thread would fill the event
+    loop's default executor, which dspy's acall needs to make progress.
+    """
+    delay = 0.005
+    while not try_acquire():
+        await asyncio.sleep(delay)
+        delay = min(0.05, delay * 2)
+
+def classify_error(error):
+    """
+    How a failed LM call should be retried: 'rate_limited' for 429s,
+    'transient' for timeouts, server and connection errors, None otherwise.
+    """
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if status == 429 or type(error).__name__ in ("LMRateLimitError", "RateLimitError"):
+        return "rate_limited"
+    from dspy.utils.exceptions import is_retryable_lm_error
+    if is_retryable_lm_error(error) or status in (408, 500, 502, 503, 504):
+        return "transient"
+    return None
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency control and retries for the LM calls of one provider.
+
+    The in-flight limit starts at `initial` and grows by about one request
+    per window of successful calls while callers are actually waiting on it
+    (additive increase). A 429, or an average latency above `latency_factor`
+    times the baseline of the fastest recent calls, cuts it by `decrease`
+    (multiplicative decrease); only calls started after the previous cut
+    can cut it again, so one burst of 429s counts once. Rate-limited and transient failures
+    are retried up to `max_retries` times, after the provider's Retry-After
+    hint when it sends one and with full-jitter exponential backoff when it
+    does not; the cut already slows everyone else down. Optional token
+    buckets bound requests (`rpm`) and prompt plus completion tokens
+    (`tpm`) per minute.
+    """
+
+    def __init__(self, provider, max_concurrency=64, rpm=None, tpm=None, initial=None, min_concurrency=1,
+                 decrease=0.5, latency_factor=3.0, max_retries=6, base_delay=0.5, max_delay=30.0):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.limit = float(initial or max(min_concurrency, max_concurrency // 4))
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        # Six seconds' worth of tokens, so that one large prompt fits in the bucket
+        self.token_bucket = TokenBucket(tpm, burst=tpm / 10) if tpm else None
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.latency = None
+        self.baseline = None
+        self.requests = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.failures = 0
+        self.decreases = 0
+        self.peak_in_flight = 0
+        self.peak_limit = self.limit
+        self.wait_seconds = 0.0
+        self.backoff_seconds = 0.0
+
+    def _try_slot(self):
+        with self.cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def _reserve(self, tokens):
+        """Reserve one request and `tokens` tokens of the per-minute budgets; return the seconds to wait."""
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = self.request_bucket.reserve()
+        if self.token_bucket is not None and tokens:
+            delay = max(delay, self.token_bucket.reserve(tokens))
+        return delay
+
+    def _started(self, start):
+        with self.cond:
+            self.requests += 1
+            self.wait_seconds += time.perf_counter() - start
+        return time.monotonic()
+
+    def _acquire(self, tokens):
+        """Wait for an in-flight slot and the per-minute budgets; return the call's start time."""
+        start = time.perf_counter()
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        time.sleep(self._reserve(tokens))
+        return self._started(start)
+
+    async def _aacquire(self, tokens):
+        start = time.perf_counter()
+        await poll(self._try_slot)
+        await asyncio.sleep(self._reserve(tokens))
+        return self._started(start)
+
+    def _cut(self, started):
+        # Calls started before the last cut ran under the old limit and say nothing about the new one
+        if started >= self.last_decrease:
+            self.limit = max(self.min_concurrency, self.limit * self.decrease)
+            self.last_decrease = time.monotonic()
+            self.decreases += 1
+
+    def _release(self, started, outcome):
+        now = time.monotonic()
+        latency = now - started
+        with self.cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if outcome == "ok":
+                self.successes += 1
+                # A moving average, so that one latency spike is not taken for a queue building up
+                self.latency = latency if self.latency is None else self.latency + 0.05 * (latency - self.latency)
+                # The baseline follows the fastest calls down at once and slower ones up slowly
+                self.baseline = latency if self.baseline is None or latency < self.baseline \
+                    else self.baseline + 0.01 * (latency - self.baseline)
+                if self.latency > self.latency_factor * self.baseline:
+                    self._cut(started)
+                elif saturated:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                    self.peak_limit = max(self.peak_limit, self.limit)
+            elif outcome == "rate_limited":
+                self.rate_limited += 1
+                self._cut(started)
+            elif outcome == "error":
+                self.failures += 1
+            self.cond.notify_all()
+
+    def _backoff(self, error, attempt):
+        """Seconds to wait before retry `attempt`: the Retry-After hint plus jitter, else full-jitter backoff."""
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            # Retries told to wait the same time spread out instead of arriving together
+            delay = min(self.max_delay, retry_after) * random.uniform(1.0, 1.2)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        with self.cond:
+            self.retries += 1
+            self.backoff_seconds += delay
+        return delay
+
+    def _failed(self, started, error, attempt):
+        """Record a failed call; return the backoff before retrying it, or None to give up."""
+        kind = classify_error(error)
+        self._release(started, kind or "error")
+        if kind is None or attempt == self.max_retries:
+            if kind is not None:
+                with self.cond:
+                    self.failures += 1
+            return None
+        return self._backoff(error, attempt)
+
+    def run(self, call, tokens=0, usage=None):
+        """
+        Run `call()` under the limits, retrying rate-limited and transient
+        failures. `tokens` is the prompt size charged to the tokens-per-minute
+        bucket up front; `usage(result)` returns the completion tokens charged after.
+        """
+        for attempt in range(self.max_retries + 1):
+            started = self._acquire(tokens)
+            try:
+                result = call()
+            except Exception as e:
+                delay = self._failed(started, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._release(started, "ok")
+            if self.token_bucket is not None and usage is not None:
+                self.token_bucket.charge(usage(result))
+            return result
+
+    async def arun(self, call, tokens=0, usage=None):
+        for attempt in range(self.max_retries + 1):
+            started = await self._aacquire(tokens)
+            try:
+                result = await call()
+            except Exception as e:
+                delay = self._failed(started, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._release(started, "ok")
+            if self.token_bucket is not None and usage is not None:
+                self.token_bucket.charge(usage(result))
+            return result
+
+def format_stats(limiter):
+    """One line of AdaptiveLimiter counters."""
+    return (f"{limiter.provider}: {limiter.successes}/{limiter.requests} calls succeeded, "
+            f"{limiter.rate_limited} rate limited, {limiter.retries} retries, {limiter.failures} failed; "
+            f"limit {limiter.limit:.1f} (peak {limiter.peak_limit:.1f}, {limiter.decreases} cuts), "
+            f"peak {limiter.peak_in_flight} in flight, {limiter.wait_seconds:.1f}s queued, "
+            f"{limiter.backoff_seconds:.1f}s backing off")
+
+def provider_of(model):
+    """The provider prefix of a litellm-style model name ('openai/gpt-4o' -> 'openai')."""
+    return model.split("/", 1)[0] if "/" in model else model
+
+class ProviderLimits:
+    """
+    Per-provider limiters, created on first use from `limits`, a dict of
+    provider -> (max_concurrency, rpm). Unknown providers get `default`.
+    `limiter` is the limiter class, ProviderLimiter or AdaptiveLimiter.
+    """
+
+    def __init__(self, limits=None, default=(4, None), limiter=ProviderLimiter):
+        self.limits = limits or {}
+        self.default = default
+        self.limiter_class = limiter
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def for_model(self, model):
+        provider = provider_of(model)
+        with self.lock:
+            if provider not in self.limiters:
+                max_concurrency, rpm = self.limits.get(provider, self.default)
+                self.limiters[provider] = self.limiter_class(provider, max_concurrency, rpm)
+            return self.limiters[provider]
+
+def prompt_tokens(prompt=None, messages=None):
+    """Estimated tokens of an LM call's prompt or messages."""
+    if messages is None:
+        return estimate_tokens(prompt or "")
+    return sum(estimate_tokens(str(message.get("content", ""))) for message in messages)
+
+def completion_tokens(lm, outputs):
+    """Completion tokens of a finished call: from its history entry if kept, else estimated from the outputs."""
+    for entry in reversed(getattr(lm, "history", [])[-64:]):
+        if entry.get("outputs") is outputs:
+            return (entry.get("usage") or {}).get("completion_tokens", 0) or 0
+    return sum(estimate_tokens(output if isinstance(output, str) else str(output.get("text", "")))
+               for output in outputs)
+
+class RateLimitedMixin:
+    """Runs every call of the LM it is mixed into through its limiter."""
+
+    limiter = None
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        call = super().__call__
+        return self.limiter.run(lambda: call(prompt, messages=messages, **kwargs),
+                                tokens=prompt_tokens(prompt, messages),
+                                usage=lambda outputs: completion_tokens(self, outputs))
+
+    async def acall(self, prompt=None, messages=None, **kwargs):
+        call = super().acall
+        return await self.limiter.arun(lambda: call(prompt, messages=messages, **kwargs),
+                                       tokens=prompt_tokens(prompt, messages),
+                                       usage=lambda outputs: completion_tokens(self, outputs))
+
+_limited_classes = {}
+_limited_lock = threading.Lock()
+
+def rate_limited(lm, limiter):
+    """
+    Return a copy of `lm` whose calls go through `limiter`.
+
+    The copy shares the original's settings and history and is still an
+    instance of the original class, so dspy treats it as the same kind of
+    LM (Predict only accepts BaseLM instances, which rules out a plain proxy).
+    """
+    cls = type(lm)
+    with _limited_lock:
+        limited_cls = _limited_classes.get(cls)
+        if limited_cls is None:
+            limited_cls = type(f"RateLimited{cls.__name__}", (RateLimitedMixin, cls), {})
+            _limited_classes[cls] = limited_cls
+    limited = copy.copy(lm)
+    limited.__class__ = limited_cls
+    limited.limiter = limiter
+    if getattr(limiter, "max_retries", 0):
+        # The limiter retries; dspy's own retries would sleep while holding a slot and retry twice over
+        limited.num_retries = 0
+    return limited
+
+def stub_run(lm, calls, workers):
+    """Send `calls` requests from `workers` threads; return (seconds, succeeded, failed)."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def one(i):
+        try:
+            lm(f"Request {i}")
+            return True
+        except Exception:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(one, range(calls)))
+    return time.perf_counter() - start, sum(results), len(results) - sum(results)
+
+def run(argv=None):
+    """Compare a fixed thread count using dspy's own retries with AdaptiveLimiter, against the stub server."""
+    parser = argparse.ArgumentParser(description="Benchmark adaptive concurrency against a stub server that returns 429s.")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=32, help="caller threads, and the adaptive limit's ceiling")
+    parser.add_argument("--capacity", type=int, default=8, help="requests the stub serves at once before sending 429s")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="chance of a 429 at any load")
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--spike-rate", type=float, default=0.05, help="chance of a latency spike")
+    parser.add_argument("--spike-delay", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--rpm", type=float, help="requests-per-minute budget of the adaptive limiter")
+    parser.add_argument("--tpm", type=float, help="tokens-per-minute budget of the adaptive limiter")
+    args = parser.parse_args(argv)
+
+    import dspy
+    from stub_server import StubConfig, start_stub_server
+
+    server = start_stub_server(StubConfig(
+        latency=args.latency, capacity=args.capacity, error_rate=args.error_rate, retry_after=args.retry_after,
+        spike_rate=args.spike_rate, spike_delay=args.spike_delay))
+    api_base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    lm = dspy.LM("openai/stub", api_base=api_base, api_key="stub", cache=False, num_retries=3)
+    limiter = AdaptiveLimiter("openai", max_concurrency=args.workers, rpm=args.rpm, tpm=args.tpm)
+
+    print(f"{args.calls} calls from {args.workers} threads; the stub serves {args.capacity} at once\n")
+    print(f"{'Mode':<10} | {'Seconds':>7} | {'Calls/s':>7} | {'OK':>4} | {'Failed':>6} | {'429s':>5} | {'Peak in flight':>14}")
+    for mode, client in (("fixed", lm), ("adaptive", rate_limited(lm, limiter))):
+        state = server.state
+        with state.lock:
+            state.rate_limited = state.max_in_flight = 0
+        seconds, succeeded, failed = stub_run(client, args.calls, args.workers)
+        print(f"{mode:<10} | {seconds:>7.1f} | {succeeded / seconds:>7.1f} | {succeeded:>4} | {failed:>6} | "
+              f"{state.rate_limited:>5} | {state.max_in_flight:>14}")
+    print()
+    print(format_stats(limiter))
+    server.shutdown()
+
+if __name__ == "__main__":
+    run()
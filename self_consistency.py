@@ -0,0 +1,185 @@
+import dspy
+
+from dotenv import load_dotenv
+from cot_cascade import DEFAULT_QUESTIONS
+from timing import percentile
+import os
+import math
+import time
+import asyncio
+import argparse
+
+class SelfConsistentCoT(dspy.Module):
+    """
+    Chain of Thought with self-consistency voting and early stopping.
+
+    Up to `samples` answers are drawn concurrently (at most `concurrency`
+    in flight) at `temperature` with the cache off. Numeric answers within
+    `tolerance` (relative, as in CascadeCoT) count as one vote. As soon as
+    one answer has `agree` votes, or no answer can reach `agree` with the
+    samples left, the remaining in-flight requests are cancelled and the
+    plurality answer is returned. With `early_stop=False` every sample is
+    awaited, which is plain fixed-k voting.
+
+    The prediction carries the answer, the reasoning of its first sample,
+    the vote distribution as {answer: votes}, and how many samples were
+    finished, launched and cancelled.
+    """
+
+    def __init__(self, lm=None, signature="question -> answer: float", samples=5, agree=3,
+                 tolerance=1e-3, temperature=0.7, concurrency=None, early_stop=True):
+        super().__init__()
+        self.math = dspy.ChainOfThought(signature)
+        self.lm = lm
+        self.samples = samples
+        self.agree = min(agree, samples)
+        self.tolerance = tolerance
+        self.temperature = temperature
+        self.concurrency = concurrency or samples
+        self.early_stop = early_stop
+        self._sampler = None
+
+    def sampler(self):
+        # Samples must not be served from the cache, or they would all agree
+        lm = self.lm or dspy.settings.lm
+        if self._sampler is None or self._sampler[0] is not lm:
+            self._sampler = (lm, lm.copy(temperature=self.temperature, cache=False))
+        return self._sampler[1]
+
+    def _same(self, a, b):
+        return abs(a - b) <= self.tolerance * max(1.0, abs(a))
+
+    async def _sample(self, lm, question):
+        with dspy.context(lm=lm):
+            result = await self.math.acall(question=question)
+        answer = float(result.answer)
+        if not math.isfinite(answer):
+            raise ValueError(f"answer is not a finite number: {result.answer!r}")
+        return answer, result
+
+    async def aforward(self, question):
+        lm = self.sampler()
+        clusters = []  # [answer, votes, first result], in first-seen order
+        pending = set()
+        launched = finished = failed = 0
+        decided = False
+
+        while True:
+            while not decided and launched < self.samples and len(pending) < self.concurrency:
+                pending.add(asyncio.ensure_future(self._sample(lm, question)))
+                launched += 1
+            if decided or not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                finished += 1
+                try:
+                    answer, result = task.result()
+                except Exception:
+                    failed += 1
+                    continue
+                for cluster in clusters:
+                    if self._same(cluster[0], answer):
+                        cluster[1] += 1
+                        break
+                else:
+                    clusters.append([answer, 1, result])
+
+            if self.early_stop:
+                best = max((votes for _, votes, _ in clusters), default=0)
+                decided = best >= self.agree or best + self.samples - finished < self.agree
+
+        cancelled = len(pending)
+        for task in pending:
+            task.cancel()
+        # Let the cancellations run so the HTTP requests are closed before returning
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        if not clusters:
+            raise ValueError(f"none of the {finished} samples produced a numeric answer")
+        answer, votes, result = max(clusters, key=lambda cluster: cluster[1])
+        return dspy.Prediction(
+            reasoning=result.reasoning,
+            answer=answer,
+            votes={cluster[0]: cluster[1] for cluster in sorted(clusters, key=lambda c: -c[1])},
+            agreed=votes >= self.agree,
+            samples_used=finished,
+            launched=launched,
+            cancelled=cancelled,
+            failed=failed,
+        )
+
+    def forward(self, question):
+        return asyncio.run(self.aforward(question))
+
+def compare_voting(lm, questions, samples=5, agree=3, tolerance=1e-3, temperature=0.7, concurrency=None):
+    """
+    Answer every question with early-stopping self-consistency and with
+    fixed-k voting over the same number of samples. Returns one report per
+    mode with the mean samples used, wall times and the answers.
+    """
+    reports = {}
+    for mode, early_stop in (("early stop", True), ("fixed k", False)):
+        program = SelfConsistentCoT(lm, samples=samples, agree=agree, tolerance=tolerance,
+                                    temperature=temperature, concurrency=concurrency, early_stop=early_stop)
+        used, walls, answers = [], [], []
+        for question in questions:
+            start = time.perf_counter()
+            result = program(question=question)
+            walls.append(time.perf_counter() - start)
+            used.append(result.samples_used)
+            answers.append(result.answer)
+        reports[mode] = {
+            'mean_samples': sum(used) / len(used),
+            'wall': sum(walls),
+            'p50': percentile(walls, 50),
+            'answers': answers,
+        }
+    return reports
+
+def run(argv=None):
+    """Answer math questions by self-consistency voting and compare early stopping with fixed-k voting."""
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Self-consistency Chain of Thought with early stopping.")
+    parser.add_argument("--questions", help="text file with one question per line")
+    parser.add_argument("--samples", type=int, default=5, help="most samples drawn per question")
+    parser.add_argument("--agree", type=int, default=3, help="matching answers that settle a question")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--concurrency", type=int, help="samples in flight at once (default: all of them)")
+    parser.add_argument("--remote", action="store_true", help="sample gpt-4o-mini instead of the local SLM")
+    args = parser.parse_args(argv)
+
+    if args.remote:
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+            exit(1)
+        lm = dspy.LM('openai/gpt-4o-mini', api_key=api_key, max_tokens=10_000)
+    else:
+        from slm_client import get_slm_lm
+        lm = get_slm_lm()
+    dspy.configure(lm=lm)
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, 'r', encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    reports = compare_voting(lm, questions, samples=args.samples, agree=args.agree, tolerance=args.tolerance,
+                             temperature=args.temperature, concurrency=args.concurrency)
+    early, fixed = reports["early stop"], reports["fixed k"]
+    for question, answer, fixed_answer in zip(questions, early['answers'], fixed['answers']):
+        flag = "" if abs(answer - fixed_answer) <= args.tolerance * max(1.0, abs(answer)) else f" (fixed k: {fixed_answer})"
+        print(f"{question} -> {answer}{flag}")
+
+    print(f"\n{'Mode':<10} | {'Mean samples':>12} | {'Wall s':>7} | {'p50 s':>6}")
+    for mode, report in reports.items():
+        print(f"{mode:<10} | {report['mean_samples']:>12.2f} | {report['wall']:>7.2f} | {report['p50']:>6.2f}")
+    if fixed['wall']:
+        print(f"Early stopping used {early['mean_samples'] / args.samples:.0%} of the samples "
+              f"in {early['wall'] / fixed['wall']:.0%} of the fixed-k wall time")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,210 @@
+import dspy
+import json
+import time
+import queue
+import argparse
+import threading
+import http.client
+
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+DEFAULT_API_BASE = 'http://localhost:11434'
+DEFAULT_MODEL = 'llama3.2'
+# How long Ollama keeps the model resident after the last request
+DEFAULT_KEEP_ALIVE = '30m'
+
+class WarmupClient:
+    """
+    A small Ollama HTTP client for loading models and measuring how warm
+    they are: preload, unload and time-to-first-token on the streaming
+    chat endpoint.
+
+    Its connections are kept alive in a pool, so repeated measurements
+    time the model rather than TCP setup. It does not carry LM traffic:
+    the dspy.LM from get_slm_lm sends its requests through litellm's own
+    HTTP client.
+    """
+
+    def __init__(self, api_base=DEFAULT_API_BASE, pool_size=4, timeout=300):
+        parts = urlsplit(api_base)
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 11434
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._pool = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    @contextmanager
+    def _connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._new_connection()
+        # Only a connection whose response was read to the end can be reused
+        reusable = False
+        try:
+            yield conn
+            reusable = True
+        finally:
+            if reusable and self._pool.qsize() < self.pool_size:
+                self._pool.put(conn)
+            else:
+                conn.close()
+
+    def _send(self, conn, path, payload):
+        body = json.dumps(payload).encode('utf-8')
+        conn.request('POST', path, body=body, headers={
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive',
+        })
+        return conn.getresponse()
+
+    def _request(self, conn, path, payload):
+        """Send a request, retrying once on a fresh connection if the pooled one went stale."""
+        try:
+            return self._send(conn, path, payload)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            return self._send(conn, path, payload)
+
+    def post_json(self, path, payload):
+        """POST a JSON payload and return the decoded JSON response."""
+        with self._connection() as conn:
+            response = self._request(conn, path, payload)
+            data = response.read()
+            if response.status != 200:
+                raise RuntimeError(f"Ollama returned {response.status}: {data[:200]!r}")
+            return json.loads(data)
+
+    def stream_json(self, path, payload):
+        """POST a JSON payload and yield each line of the NDJSON response."""
+        with self._connection() as conn:
+            response = self._request(conn, path, payload)
+            if response.status != 200:
+                raise RuntimeError(f"Ollama returned {response.status}: {response.read()[:200]!r}")
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+    def preload(self, model=DEFAULT_MODEL, keep_alive=DEFAULT_KEEP_ALIVE):
+        """Load the model into memory ahead of the first real request; returns seconds taken."""
+        start = time.perf_counter()
+        self.post_json('/api/generate', {'model': model, 'keep_alive': keep_alive})
+        return time.perf_counter() - start
+
+    def unload(self, model=DEFAULT_MODEL):
+        """Ask Ollama to drop the model from memory."""
+        self.post_json('/api/generate', {'model': model, 'keep_alive': 0})
+
+    def chat_stream(self, messages, model=DEFAULT_MODEL, keep_alive=DEFAULT_KEEP_ALIVE, options=None):
+        """Yield the content of each streamed chat chunk."""
+        payload = {'model': model, 'messages': messages, 'stream': True, 'keep_alive': keep_alive}
+        if options:
+            payload['options'] = options
+        for chunk in self.stream_json('/api/chat', payload):
+            content = chunk.get('message', {}).get('content', '')
+            if content:
+                yield content
+
+    def time_to_first_token(self, messages, model=DEFAULT_MODEL, keep_alive=DEFAULT_KEEP_ALIVE):
+        """Return (time to first token, total time) in seconds for one streamed chat request."""
+        start = time.perf_counter()
+        first = None
+        for _ in self.chat_stream(messages, model=model, keep_alive=keep_alive):
+            if first is None:
+                first = time.perf_counter() - start
+        total = time.perf_counter() - start
+        return (first if first is not None else total), total
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+_clients = {}
+_lms = {}
+_lock = threading.Lock()
+
+def get_warmup_client(api_base=DEFAULT_API_BASE):
+    """Return the process-wide WarmupClient for `api_base`."""
+    with _lock:
+        if api_base not in _clients:
+            _clients[api_base] = WarmupClient(api_base)
+        return _clients[api_base]
+
+def get_slm_lm(model=DEFAULT_MODEL, api_base=DEFAULT_API_BASE, keep_alive=DEFAULT_KEEP_ALIVE, preload=True, **kwargs):
+    """
+    Return the shared dspy.LM for a local Ollama model.
+
+    The LM is created once per process and model, so every module reuses
+    the same LM and litellm's HTTP client behind it. `keep_alive` is sent
+    with each request so the model stays resident between calls, and with
+    preload=True the model is loaded through the WarmupClient before the
+    LM is handed out, moving the load cost out of the first real request.
+    A failed preload is reported and the LM is returned anyway.
+    """
+    key = (model, api_base, keep_alive, tuple(sorted(kwargs.items())))
+    with _lock:
+        lm = _lms.get(key)
+    if lm is not None:
+        return lm
+
+    if preload:
+        try:
+            get_warmup_client(api_base).preload(model, keep_alive)
+        except (OSError, RuntimeError, http.client.HTTPException) as e:
+            print(f"Could not preload {model} from {api_base}: {e}")
+
+    lm = dspy.LM(f'ollama_chat/{model}', api_base=api_base, api_key='', keep_alive=keep_alive, **kwargs)
+    with _lock:
+        return _lms.setdefault(key, lm)
+
+def measure_cold_warm(client, model=DEFAULT_MODEL, warm_runs=3):
+    """
+    Measure time-to-first-token with the model unloaded (cold) and after an
+    explicit preload (warm).
+    """
+    messages = [{'role': 'user', 'content': 'Say Hello World!'}]
+
+    client.unload(model)
+    cold_ttft, cold_total = client.time_to_first_token(messages, model=model)
+
+    preload_seconds = client.preload(model)
+    warm = [client.time_to_first_token(messages, model=model) for _ in range(warm_runs)]
+    return {
+        'cold_ttft': cold_ttft,
+        'cold_total': cold_total,
+        'preload': preload_seconds,
+        'warm_ttft': sum(t for t, _ in warm) / len(warm),
+        'warm_total': sum(t for _, t in warm) / len(warm),
+        'connections_opened': client.connections_opened,
+    }
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Preload the local SLM and report cold vs. warm time-to-first-token.")
+    parser.add_argument("--api-base", default=DEFAULT_API_BASE)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--stub", action="store_true", help="run against an in-process Ollama stub server")
+    args = parser.parse_args()
+
+    api_base = args.api_base
+    if args.stub:
+        from stub_server import start_stub_server
+        server = start_stub_server()
+        api_base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    report = measure_cold_warm(get_warmup_client(api_base), model=args.model)
+    print(f"Cold time-to-first-token: {report['cold_ttft'] * 1000:.0f} ms (total {report['cold_total'] * 1000:.0f} ms)")
+    print(f"Warm time-to-first-token: {report['warm_ttft'] * 1000:.0f} ms (total {report['warm_total'] * 1000:.0f} ms)")
+    print(f"Preload of a resident model: {report['preload'] * 1000:.0f} ms")
+    print(f"HTTP connections opened: {report['connections_opened']}")
@@ -0,0 +1,177 @@
+import dspy
+import time
+import argparse
+
+from dotenv import load_dotenv
+from timing import percentile
+
+class StreamStats:
+    """Time to first token and inter-token gaps of one streamed completion."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.last = None
+        self.gaps = []
+        self.chunks = 0
+        self.total = 0.0
+
+    def chunk(self):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now - self.start
+        else:
+            self.gaps.append(now - self.last)
+        self.last = now
+        self.chunks += 1
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    @property
+    def ttft(self):
+        return self.first if self.first is not None else self.total
+
+    def inter_token(self, q):
+        """The q-th percentile (0-100) of the gaps between chunks, in seconds."""
+        return percentile(self.gaps, q)
+
+def format_stream_stats(stats):
+    return (f"TTFT {stats.ttft * 1000:.0f} ms, {stats.chunks} chunks, inter-token p50 "
+            f"{stats.inter_token(50) * 1000:.0f} ms / p95 {stats.inter_token(95) * 1000:.0f} ms, "
+            f"total {stats.total:.2f}s")
+
+class TokenStream:
+    """
+    Iterate the text chunks of a streamed completion while recording its
+    StreamStats. The request is sent when iteration starts; `text` holds
+    everything received so far.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.parts = []
+        self.stats = StreamStats()
+
+    def __iter__(self):
+        self.stats = StreamStats()
+        for chunk in self._chunks:
+            self.stats.chunk()
+            self.parts.append(chunk)
+            yield chunk
+        self.stats.finish()
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+def chunk_text(chunk):
+    """The text delta of one chunk of a streamed LM response, or '' if it carries none."""
+    choices = getattr(chunk, 'choices', None) or []
+    delta = getattr(choices[0], 'delta', None) if choices else None
+    return getattr(delta, 'content', None) or ''
+
+def _reply(lm):
+    def chat(messages):
+        return dspy.Prediction(text=lm(messages=messages)[0])
+    return chat
+
+def _lm_chunks(lm, messages):
+    streamed = False
+    for value in dspy.streamify(_reply(lm), async_streaming=False)(messages):
+        if isinstance(value, dspy.Prediction):
+            # A cached reply arrives whole, without chunks
+            if not streamed and value.text:
+                yield value.text
+        else:
+            text = chunk_text(value)
+            if text:
+                streamed = True
+                yield text
+
+def stream_lm(lm, messages):
+    """
+    Stream a chat completion for `messages` from a dspy.LM, through
+    dspy.streamify, so the LM's provider settings, callbacks, history and
+    cache apply as for any other call. Returns a TokenStream; nothing is
+    sent until it is iterated. A reply served from the cache comes as a
+    single chunk.
+    """
+    return TokenStream(_lm_chunks(lm, messages))
+
+def echo(chunk):
+    print(chunk, end="", flush=True)
+
+def stream_predict(program, lm=None, on_chunk=echo, fields=None, **inputs):
+    """
+    Run a single-predictor program (Predict or ChainOfThought) with its
+    completion streamed through dspy.streamify. The contents of the output
+    `fields` (default: all of them, reasoning included) go to `on_chunk` as
+    they arrive, without the adapter's field markers; a newline is passed
+    between two fields. Returns (prediction, StreamStats).
+    """
+    predict = getattr(program, 'predict', program)
+    fields = fields or list(predict.signature.output_fields)
+    listeners = [dspy.streaming.StreamListener(signature_field_name=field) for field in fields]
+    streamer = dspy.streamify(program, stream_listeners=listeners, async_streaming=False)
+
+    stats = StreamStats()
+    prediction, field = None, None
+    with dspy.context(lm=lm or dspy.settings.lm):
+        for value in streamer(**inputs):
+            if isinstance(value, dspy.Prediction):
+                prediction = value
+            elif isinstance(value, dspy.streaming.StreamResponse) and value.chunk:
+                if field is not None and value.signature_field_name != field:
+                    on_chunk("\n")
+                field = value.signature_field_name
+                stats.chunk()
+                on_chunk(value.chunk)
+    stats.finish()
+    return prediction, stats
+
+def run(argv=None):
+    """Stream a chat reply, or a Chain of Thought answer, and report time to first token and inter-token latency."""
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Stream LM replies and report time to first token and inter-token latency.")
+    parser.add_argument("--provider", choices=["openai", "anthropic", "ollama_chat"], nargs="+",
+                        default=["openai", "anthropic", "ollama_chat"])
+    parser.add_argument("--cot", action="store_true", help="stream a Chain of Thought answer and parse its fields")
+    parser.add_argument("--question", default="Two dice are tossed. What is the probability that the sum equals two?")
+    parser.add_argument("--stub", action="store_true", help="stream from an in-process stub server instead")
+    args = parser.parse_args(argv)
+
+    models = {
+        'openai': 'openai/gpt-4o-mini',
+        'anthropic': 'anthropic/claude-3-5-sonnet-20240620',
+        'ollama_chat': 'ollama_chat/llama3.2',
+    }
+    api_bases = {}
+    if args.stub:
+        from stub_server import StubConfig, start_stub_server
+        reply = ("[[ ## reasoning ## ]]\nThere are 36 equally likely outcomes and only (1, 1) sums to two.\n\n"
+                 "[[ ## answer ## ]]\n0.0278\n\n[[ ## completed ## ]]") if args.cot else StubConfig.reply
+        server = start_stub_server(StubConfig(reply=reply, load_delay=0.0, latency=0.3, token_delay=0.02))
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        api_bases = {'openai': f"{base}/v1", 'anthropic': base, 'ollama_chat': base}
+
+    for provider in args.provider:
+        kwargs = {'api_key': 'stub'} if args.stub else {}
+        # Latency is what is measured here, so replies are never served from the cache
+        lm = dspy.LM(models[provider], api_base=api_bases.get(provider), cache=False, **kwargs)
+        print(f"--- {lm.model}")
+        if args.cot:
+            result, stats = stream_predict(dspy.ChainOfThought("question -> answer: float"), lm,
+                                           question=args.question)
+            print(f"\nAnswer: {result.answer}")
+        else:
+            stream = stream_lm(lm, [{"role": "user", "content": "Say Hello World!"}])
+            for chunk in stream:
+                echo(chunk)
+            print()
+            stats = stream.stats
+        print(format_stream_stats(stats))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,277 @@
+import dspy
+import re
+import json
+import typing
+import pydantic
+import threading
+import contextvars
+import json_repair
+
+from dspy.utils.exceptions import AdapterParseError
+
+# The failed completion and its error while a JSONModeAdapter re-asks, so format() can show them to the LM
+_reask = contextvars.ContextVar("reask", default=None)
+
+REASK_PROMPT = ("Your reply could not be used: {error}. Reply again with only a JSON object with the fields "
+                "{fields}, matching this JSON schema:\n{schema}")
+
+class ParseStats:
+    """Parse outcomes of one signature: LM completions, failures, local repairs, re-asks and errors."""
+
+    def __init__(self):
+        self.calls = 0
+        self.completions = 0
+        self.parse_failures = 0
+        self.repairs = 0
+        self.reasks = 0
+        self.errors = 0
+
+    @property
+    def failure_rate(self):
+        """Share of completions that did not parse as they came."""
+        return self.parse_failures / self.completions if self.completions else 0.0
+
+    @property
+    def wasted_calls(self):
+        """LM calls beyond one per prediction (fallbacks and re-asks)."""
+        return self.completions - self.calls
+
+def signature_name(signature):
+    name = signature.__name__
+    if name == "StringSignature":
+        name = ", ".join(signature.output_fields)
+    return name
+
+class ParseStatsMixin:
+    """
+    Count, per signature, the predictions an adapter makes, the LM
+    completions it parses and how many of them fail, on top of any dspy
+    adapter. Counters are shared by every adapter given the same `stats`.
+    """
+
+    def _init_stats(self, stats=None, count_calls=True):
+        self.stats = {} if stats is None else stats
+        self.count_calls = count_calls
+        self._stats_lock = threading.Lock()
+
+    def _count(self, signature, **increments):
+        with self._stats_lock:
+            stats = self.stats.setdefault(signature_name(signature), ParseStats())
+            for key, value in increments.items():
+                setattr(stats, key, getattr(stats, key) + value)
+
+    def parse(self, signature, completion):
+        self._count(signature, completions=1)
+        try:
+            return super().parse(signature, completion)
+        except AdapterParseError:
+            self._count(signature, parse_failures=1)
+            raise
+
+    def __call__(self, lm, lm_kwargs, signature, demos, inputs):
+        if self.count_calls:
+            self._count(signature, calls=1)
+        try:
+            return super().__call__(lm, lm_kwargs, signature, demos, inputs)
+        except AdapterParseError:
+            if self.count_calls:
+                self._count(signature, errors=1)
+            raise
+
+    async def acall(self, lm, lm_kwargs, signature, demos, inputs):
+        if self.count_calls:
+            self._count(signature, calls=1)
+        try:
+            return await super().acall(lm, lm_kwargs, signature, demos, inputs)
+        except AdapterParseError:
+            if self.count_calls:
+                self._count(signature, errors=1)
+            raise
+
+class InstrumentedJSONAdapter(ParseStatsMixin, dspy.JSONAdapter):
+    def __init__(self, stats=None, count_calls=True, **kwargs):
+        super().__init__(**kwargs)
+        self._init_stats(stats, count_calls)
+
+class InstrumentedChatAdapter(ParseStatsMixin, dspy.ChatAdapter):
+    """dspy's default ChatAdapter with parse counters; its JSONAdapter fallback counts into the same stats."""
+
+    def __init__(self, stats=None, **kwargs):
+        super().__init__(**kwargs)
+        self._init_stats(stats)
+
+    def _make_json_adapter_fallback(self):
+        return InstrumentedJSONAdapter(self.stats, count_calls=False,
+                                       use_native_function_calling=self.use_native_function_calling,
+                                       parallel_tool_calls=self.parallel_tool_calls)
+
+def has_open_mapping(annotation):
+    """Whether a type contains a dict, which has no fixed properties (strict structured outputs reject it)."""
+    if typing.get_origin(annotation) is dict or annotation is dict:
+        return True
+    return any(has_open_mapping(arg) for arg in typing.get_args(annotation))
+
+def output_schema(signature):
+    """A JSON schema of an object holding the signature's output fields, all required."""
+    properties = {}
+    for name, field in signature.output_fields.items():
+        schema = pydantic.TypeAdapter(field.annotation).json_schema()
+        description = (field.json_schema_extra or {}).get("desc")
+        if description and not description.startswith("${"):
+            schema["description"] = description
+        properties[name] = schema
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+def _coerce(value, annotation):
+    """Nudge a near-miss value towards `annotation`: label case, percentages, a lone item for a list."""
+    origin = typing.get_origin(annotation)
+    if origin is typing.Literal:
+        for choice in typing.get_args(annotation):
+            if isinstance(value, str) and str(choice).lower() == value.strip().strip("'\".").lower():
+                return choice
+    elif annotation is float and isinstance(value, str):
+        match = re.search(r'-?\d+(?:\.\d+)?', value)
+        if match:
+            number = float(match.group(0))
+            return number / 100 if value.strip().endswith("%") else number
+    elif origin is list:
+        (item,) = typing.get_args(annotation) or (typing.Any,)
+        if isinstance(value, str) and typing.get_origin(item) is not dict:
+            value = [part.strip() for part in re.split(r'[\n,;]', value) if part.strip()]
+        elif not isinstance(value, list):
+            value = [value]
+        return [_coerce(element, item) for element in value]
+    elif origin is dict and isinstance(value, dict):
+        return {str(key): item if isinstance(item, str) else json.dumps(item) for key, item in value.items()}
+    return value
+
+def describe(error):
+    """A short reason for a failed parse, naming the fields pydantic rejected."""
+    if isinstance(error, pydantic.ValidationError):
+        return "; ".join(f"`{'.'.join(map(str, e['loc']))}` {e['msg'].lower()}" for e in error.errors())
+    return str(error)
+
+class JSONModeAdapter(ParseStatsMixin, dspy.JSONAdapter):
+    """
+    Constrained JSON output for structured signatures.
+
+    The JSON schema of the output fields is sent as the provider's
+    structured output format: Ollama's `format`, or a `json_schema`
+    response_format where the LM supports one. Each completion is first
+    parsed strictly; if that fails, a local repair pass (JSON repair, label
+    case, percentages, lone list items) is validated against the schema,
+    and only if that fails too is the LM re-asked, up to `max_reasks`
+    times, with the failed reply and the error. Counters per signature are
+    in `stats` (see format_parse_stats).
+    """
+
+    def __init__(self, max_reasks=1, stats=None, **kwargs):
+        super().__init__(**kwargs)
+        self._init_stats(stats)
+        self.max_reasks = max_reasks
+        self._validators = {}
+
+    def _validator(self, signature):
+        # Signatures are classes (or per-call string signatures), so cache by identity with the class kept alive
+        key = id(signature)
+        if key not in self._validators:
+            fields = {name: (field.annotation, ...) for name, field in signature.output_fields.items()}
+            self._validators[key] = (signature, pydantic.create_model(f"{signature.__name__}Output", **fields))
+        return self._validators[key][1]
+
+    def _prepare_response_format(self, lm, lm_kwargs, signature):
+        schema = output_schema(signature)
+        provider = str(getattr(lm, "model", "")).split("/", 1)[0]
+        if provider in ("ollama", "ollama_chat"):
+            lm_kwargs["format"] = schema
+        elif "response_format" in getattr(lm, "supported_params", ()):
+            strict = not any(has_open_mapping(field.annotation) for field in signature.output_fields.values())
+            lm_kwargs["response_format"] = {"type": "json_schema", "json_schema": {
+                "name": re.sub(r'\W', '_', signature.__name__), "schema": schema, "strict": strict}}
+
+    def format(self, signature, demos, inputs):
+        messages = super().format(signature, demos, inputs)
+        reask = _reask.get()
+        if reask is not None:
+            completion, error = reask
+            messages.append({"role": "assistant", "content": completion})
+            messages.append({"role": "user", "content": REASK_PROMPT.format(
+                error=error, fields=", ".join(f"`{name}`" for name in signature.output_fields),
+                schema=json.dumps(output_schema(signature)))})
+        return messages
+
+    def parse(self, signature, completion):
+        self._count(signature, completions=1)
+        validator = self._validator(signature)
+        try:
+            fields = json.loads(completion)
+            return validator.model_validate(fields).model_dump()
+        except (ValueError, TypeError, pydantic.ValidationError):
+            self._count(signature, parse_failures=1)
+
+        try:
+            fields = json_repair.loads(re.sub(r'^```(?:json)?|```$', '', completion.strip()))
+            if not isinstance(fields, dict):
+                match = re.search(r'\{.*\}', completion, re.DOTALL)
+                fields = json_repair.loads(match.group(0)) if match else None
+            if not isinstance(fields, dict):
+                raise ValueError("the reply is not a JSON object")
+            by_name = {str(key).strip().lower(): value for key, value in fields.items()}
+            fields = {name: _coerce(by_name[name.lower()], field.annotation)
+                      for name, field in signature.output_fields.items() if name.lower() in by_name}
+            result = validator.model_validate(fields).model_dump()
+        except (ValueError, TypeError, pydantic.ValidationError) as e:
+            raise AdapterParseError(adapter_name=type(self).__name__, signature=signature,
+                                    lm_response=completion, message=describe(e)) from e
+        self._count(signature, repairs=1)
+        return result
+
+    def __call__(self, lm, lm_kwargs, signature, demos, inputs):
+        self._count(signature, calls=1)
+        kwargs, reask = lm_kwargs, None
+        for attempt in range(self.max_reasks + 1):
+            token = _reask.set(reask)
+            try:
+                # JSON mode re-asks instead of taking dspy's fallback, so skip ParseStatsMixin.__call__
+                return super(ParseStatsMixin, self).__call__(lm, dict(kwargs), signature, demos, inputs)
+            except AdapterParseError as e:
+                kwargs, reask = self._failed(signature, lm_kwargs, attempt, e)
+            finally:
+                _reask.reset(token)
+
+    async def acall(self, lm, lm_kwargs, signature, demos, inputs):
+        self._count(signature, calls=1)
+        kwargs, reask = lm_kwargs, None
+        for attempt in range(self.max_reasks + 1):
+            token = _reask.set(reask)
+            try:
+                return await super(ParseStatsMixin, self).acall(lm, dict(kwargs), signature, demos, inputs)
+            except AdapterParseError as e:
+                kwargs, reask = self._failed(signature, lm_kwargs, attempt, e)
+            finally:
+                _reask.reset(token)
+
+    def _failed(self, signature, lm_kwargs, attempt, error):
+        """Count a completion that could not be repaired; re-raise it once the re-asks are used up."""
+        if attempt == self.max_reasks:
+            self._count(signature, errors=1)
+            raise error
+        self._count(signature, reasks=1)
+        # A re-ask must not be answered from the cache
+        return dict(lm_kwargs, rollout_id=attempt + 1), (error.lm_response, describe(error.__cause__ or error))
+
+def format_parse_stats(adapter):
+    """One line per signature: predictions, LM completions, parse failure rate, repairs, re-asks and errors."""
+    with adapter._stats_lock:
+        stats = sorted(adapter.stats.items())
+    lines = []
+    for name, entry in stats:
+        lines.append(f"{name}: {entry.calls} predictions, {entry.completions} LM completions "
+                     f"({entry.wasted_calls} wasted), {entry.failure_rate:.0%} parse failures, "
+                     f"{entry.repairs} repaired locally, {entry.reasks} re-asks, {entry.errors} errors")
+    return "\n".join(lines) or "No structured predictions"
@@ -0,0 +1,374 @@
+import re
+import json
+import time
+import random
+import argparse
+import threading
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+@dataclass
+class StubConfig:
+    """Behaviour of the stub LM server."""
+    reply: str = "Hello World!"
+    # Seconds to "load" a model that is not resident yet
+    load_delay: float = 2.0
+    # Seconds between streamed tokens
+    token_delay: float = 0.02
+    # How long a model stays loaded when a request does not say (Ollama's default is 5m)
+    default_keep_alive: str = "5m"
+    # OpenAI and Anthropic endpoints: seconds per reply (before the first token when streaming), and how they misbehave
+    latency: float = 0.05
+    # Requests in flight beyond this are answered with 429 (0 means unlimited)
+    capacity: int = 0
+    # Chance of a 429 regardless of load, and the Retry-After sent with every 429 (None sends none)
+    error_rate: float = 0.0
+    retry_after: float = 1.0
+    # Chance of a reply taking `spike_delay` seconds longer
+    spike_rate: float = 0.0
+    spike_delay: float = 1.0
+    seed: int = 0
+
+def parse_keep_alive(value) -> float:
+    """
+    Convert an Ollama keep_alive value ("30m", "10s", "1h", 300, 0, -1) to
+    seconds; negative values keep the model loaded forever.
+    """
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    match = re.fullmatch(r'\s*(-?\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*', str(value))
+    if not match:
+        raise ValueError(f"Invalid keep_alive: {value}")
+    number = float(match.group(1))
+    if number < 0:
+        return float("inf")
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}[match.group(2)]
+    return number * scale
+
+def tokenize(text: str):
+    """Split a reply into word-sized pieces, keeping the whitespace."""
+    return re.findall(r'\S+\s*|\s+', text)
+
+class StubState:
+    """Shared, thread-safe state of a running stub server."""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        # model name -> time at which it is unloaded
+        self.loaded: Dict[str, float] = {}
+        self.connections = 0
+        self.requests = 0
+        self.loads = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rate_limited = 0
+        self.spikes = 0
+        self.random = random.Random(config.seed)
+
+    def admit(self):
+        """
+        Decide the fate of an OpenAI-style request: return (status, delay),
+        where a 429 is sent when the stub is over capacity or by chance.
+        Admitted requests count as in flight until `finish()`.
+        """
+        config = self.config
+        with self.lock:
+            if (config.capacity and self.in_flight >= config.capacity) or self.random.random() < config.error_rate:
+                self.rate_limited += 1
+                return 429, 0.0
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = config.latency
+            if self.random.random() < config.spike_rate:
+                self.spikes += 1
+                delay += config.spike_delay
+        return 200, delay
+
+    def finish(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def ensure_loaded(self, model: str, keep_alive) -> float:
+        """Load `model` if needed and return the seconds spent loading it."""
+        seconds = parse_keep_alive(keep_alive if keep_alive is not None else self.config.default_keep_alive)
+        with self.lock:
+            now = time.monotonic()
+            resident = self.loaded.get(model, 0) > now
+            if seconds == 0:
+                self.loaded.pop(model, None)
+            else:
+                self.loaded[model] = now + seconds
+            if resident or seconds == 0:
+                return 0.0
+            self.loads += 1
+
+        time.sleep(self.config.load_delay)
+        return self.config.load_delay
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler that speaks enough of the Ollama, OpenAI and Anthropic chat APIs for the examples."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, kept-alive
+    # connections stall on delayed ACKs
+    disable_nagle_algorithm = True
+    state: StubState = None
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b"{}"
+        return json.loads(body or b"{}")
+
+    def _send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            with self.state.lock:
+                models = [{"name": name} for name in self.state.loaded]
+            self._send_json({"models": models})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        with self.state.lock:
+            self.state.requests += 1
+        payload = self._read_json()
+        if self.path == "/api/generate":
+            self._ollama_generate(payload)
+        elif self.path == "/api/chat":
+            self._ollama_chat(payload)
+        elif self.path in ("/v1/chat/completions", "/chat/completions"):
+            self._openai_chat(payload)
+        elif self.path == "/v1/messages":
+            self._anthropic_messages(payload)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _ollama_generate(self, payload):
+        # A generate request without a prompt only loads (or, with keep_alive=0, unloads) the model
+        model = payload.get("model", "")
+        load_seconds = self.state.ensure_loaded(model, payload.get("keep_alive"))
+        done_reason = "unload" if parse_keep_alive(payload.get("keep_alive", 1)) == 0 else "load"
+        self._send_json({
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": "",
+            "done": True,
+            "done_reason": done_reason,
+            "load_duration": int(load_seconds * 1e9),
+        })
+
+    def _ollama_chat(self, payload):
+        model = payload.get("model", "")
+        load_seconds = self.state.ensure_loaded(model, payload.get("keep_alive"))
+        reply = self.state.config.reply
+        created_at = datetime.now(timezone.utc).isoformat()
+        final = {
+            "model": model,
+            "created_at": created_at,
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": sum(len(m.get("content", "")) // 4 for m in payload.get("messages", [])),
+            "eval_count": len(tokenize(reply)),
+        }
+
+        if not payload.get("stream", True):
+            time.sleep(self.state.config.token_delay * len(tokenize(reply)))
+            final["message"]["content"] = reply
+            self._send_json(final)
+            return
+
+        self._start_chunked("application/x-ndjson")
+        for token in tokenize(reply):
+            time.sleep(self.state.config.token_delay)
+            chunk = {
+                "model": model,
+                "created_at": created_at,
+                "message": {"role": "assistant", "content": token},
+                "done": False,
+            }
+            self._write_chunk(json.dumps(chunk).encode("utf-8") + b"\n")
+        self._write_chunk(json.dumps(final).encode("utf-8") + b"\n")
+        self._end_chunked()
+
+    def _admitted(self, rate_limit_error):
+        """Admit a request or answer it with a 429 carrying `rate_limit_error`; returns the reply delay or None."""
+        status, delay = self.state.admit()
+        if status == 429:
+            retry_after = self.state.config.retry_after
+            headers = {} if retry_after is None else {"Retry-After": f"{retry_after:g}"}
+            self._send_json(rate_limit_error, status=429, headers=headers)
+            return None
+        return delay
+
+    def _write_event(self, data, event=None):
+        """Write one server-sent event as its own chunk."""
+        lines = (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+        self._write_chunk(lines.encode("utf-8"))
+
+    def _stream_reply(self, delay, send_token):
+        """Wait out the first-token delay, then send the reply token by token with `token_delay` in between."""
+        try:
+            time.sleep(delay)
+            for i, token in enumerate(tokenize(self.state.config.reply)):
+                if i:
+                    time.sleep(self.state.config.token_delay)
+                send_token(token)
+        finally:
+            self.state.finish()
+
+    def _usage(self, payload):
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in payload.get("messages", []))
+        return prompt_tokens, len(tokenize(self.state.config.reply))
+
+    def _openai_chat(self, payload):
+        delay = self._admitted({"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                          "code": "rate_limit_exceeded"}})
+        if delay is None:
+            return
+        reply = self.state.config.reply
+        prompt_tokens, completion_tokens = self._usage(payload)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-stub{self.state.requests}"
+        model = payload.get("model", "")
+
+        if payload.get("stream"):
+            def chunk(delta, finish_reason=None, **extra):
+                return json.dumps({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                                   "model": model, "choices": [{"index": 0, "delta": delta,
+                                                                "finish_reason": finish_reason}], **extra})
+
+            self._start_chunked("text/event-stream")
+            self._write_event(chunk({"role": "assistant", "content": ""}))
+            self._stream_reply(delay, lambda token: self._write_event(chunk({"content": token})))
+            self._write_event(chunk({}, "stop"))
+            if (payload.get("stream_options") or {}).get("include_usage"):
+                self._write_event(json.dumps({"id": completion_id, "object": "chat.completion.chunk",
+                                              "created": int(time.time()), "model": model, "choices": [],
+                                              "usage": usage}))
+            self._write_event("[DONE]")
+            self._end_chunked()
+            return
+
+        try:
+            time.sleep(delay)
+        finally:
+            self.state.finish()
+        self._send_json({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _anthropic_messages(self, payload):
+        delay = self._admitted({"type": "error", "error": {"type": "rate_limit_error",
+                                                            "message": "Number of requests has exceeded your rate limit"}})
+        if delay is None:
+            return
+        reply = self.state.config.reply
+        prompt_tokens, completion_tokens = self._usage(payload)
+        message = {"id": f"msg_stub{self.state.requests}", "type": "message", "role": "assistant",
+                   "model": payload.get("model", ""), "content": [], "stop_reason": None, "stop_sequence": None,
+                   "usage": {"input_tokens": prompt_tokens, "output_tokens": 0}}
+
+        if payload.get("stream"):
+            def event(name, **data):
+                self._write_event(json.dumps({"type": name, **data}), event=name)
+
+            self._start_chunked("text/event-stream")
+            event("message_start", message=message)
+            event("content_block_start", index=0, content_block={"type": "text", "text": ""})
+            self._stream_reply(delay, lambda token: event("content_block_delta", index=0,
+                                                          delta={"type": "text_delta", "text": token}))
+            event("content_block_stop", index=0)
+            event("message_delta", delta={"stop_reason": "end_turn", "stop_sequence": None},
+                  usage={"output_tokens": completion_tokens})
+            event("message_stop")
+            self._end_chunked()
+            return
+
+        try:
+            time.sleep(delay)
+        finally:
+            self.state.finish()
+        message.update(content=[{"type": "text", "text": reply}], stop_reason="end_turn",
+                       usage={"input_tokens": prompt_tokens, "output_tokens": completion_tokens})
+        self._send_json(message)
+
+def start_stub_server(config: StubConfig = None, host="127.0.0.1", port=0):
+    """
+    Start a stub server on a background thread and return it. The address
+    is in `server.server_address` and counters are in `server.state`;
+    call `server.shutdown()` and `server.server_close()` to stop it.
+    """
+    state = StubState(config or StubConfig())
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Local stub of an Ollama-, OpenAI- and Anthropic-compatible LM server.")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--reply", default=StubConfig.reply)
+    parser.add_argument("--load-delay", type=float, default=StubConfig.load_delay)
+    parser.add_argument("--token-delay", type=float, default=StubConfig.token_delay)
+    parser.add_argument("--latency", type=float, default=StubConfig.latency,
+                        help="seconds before an OpenAI or Anthropic reply (or its first streamed token)")
+    args = parser.parse_args()
+
+    server = start_stub_server(
+        StubConfig(reply=args.reply, load_delay=args.load_delay, token_delay=args.token_delay, latency=args.latency),
+        port=args.port,
+    )
+    print(f"Stub server listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import argparse
+import dspy
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import AdaptiveLimiter, ProviderLimiter, ProviderLimits, format_stats, provider_of, rate_limited
+from results_store import ResultsStore, DEFAULT_STORE, print_comparison
+from style_evaluation_metric import (JUDGE_BATCH_SIZE, evaluate_examples, examples, make_lm,
+                                     prompt_hash, result_rows)
+
+DEFAULT_MODELS = ["openai/gpt-4.1-mini", "openai/gpt-4o", "anthropic/claude-sonnet-4-20250514"]
+
+# provider -> (max concurrent requests, requests per minute); None means no per-minute limit
+PROVIDER_LIMITS = {
+    "openai": (8, 500),
+    "anthropic": (4, 50),
+    "ollama_chat": (2, None),
+}
+
+def parse_limit(text):
+    """Parse a --limit value of the form provider=concurrency[:rpm]."""
+    provider, _, value = text.partition("=")
+    concurrency, _, rpm = value.partition(":")
+    return provider, (int(concurrency), float(rpm) if rpm else None)
+
+def evaluate_model(model, lm, judge_lm, todo, num_threads):
+    """Evaluate StylePredictor on `lm` over `todo`; returns the result rows and throughput numbers."""
+    start = time.perf_counter()
+    calls = len(lm.history)
+    with dspy.context(lm=lm):
+        evaluator, _ = evaluate_examples(todo, judge_lm, num_threads=num_threads, display_progress=False)
+    seconds = time.perf_counter() - start
+    return {
+        'model': model,
+        'rows': result_rows(evaluator),
+        'examples': len(todo),
+        'seconds': seconds,
+        'lm_calls': len(lm.history) - calls,
+    }
+
+def run_models(models, judge_model=None, store=None, limits=None, force=False):
+    """
+    Evaluate every model concurrently, each on its own thread, with LM calls
+    limited per provider so that providers overlap instead of queueing
+    behind each other. Results go to `store`; examples already stored for
+    a model are skipped unless `force`. Returns the per-model reports.
+    """
+    limits = limits or ProviderLimits(PROVIDER_LIMITS)
+    run_hash = prompt_hash(JUDGE_BATCH_SIZE)
+
+    # LMs are shared per model name, so a judge that is also a predictor counts against one limiter
+    lms = {}
+    def limited_lm(model):
+        if model not in lms:
+            lms[model] = rate_limited(make_lm(model), limits.for_model(model))
+        return lms[model]
+
+    jobs = {}
+    for model in models:
+        judge = judge_model or model
+        todo = examples if force else store.missing(examples, model, judge, run_hash)
+        jobs[model] = (judge, todo)
+
+    reports = []
+    with ThreadPoolExecutor(max_workers=max(1, len(models))) as pool:
+        futures = {}
+        for model, (judge, todo) in jobs.items():
+            if not todo:
+                reports.append({'model': model, 'rows': [], 'examples': 0, 'seconds': 0.0, 'lm_calls': 0})
+                continue
+            lm, judge_lm = limited_lm(model), limited_lm(judge)
+            futures[pool.submit(evaluate_model, model, lm, judge_lm, todo, lm.limiter.max_concurrency)] = model
+
+        for future in as_completed(futures):
+            model = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                print(f"{model} failed: {e}")
+                continue
+            # SQLite connections stay on the thread that opened them
+            store.put(model, jobs[model][0], run_hash, report['rows'])
+            reports.append(report)
+    return reports
+
+def run(argv=None):
+    """Evaluate several models concurrently with per-provider limits and compare them."""
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Evaluate StylePredictor on several models concurrently.")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--judge-model", help="one judge for every model (default: each model judges itself)")
+    parser.add_argument("--limit", action="append", default=[], type=parse_limit, metavar="PROVIDER=N[:RPM]",
+                        help="override a provider's concurrency and requests per minute, e.g. openai=16:1000")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="treat each provider's concurrency as a ceiling and adapt to 429s and latency (AIMD)")
+    parser.add_argument("--store", default=DEFAULT_STORE)
+    parser.add_argument("--force", action="store_true", help="recompute stored results")
+    args = parser.parse_args(argv)
+
+    # dspy only lets the main thread configure; each model runs in a dspy.context on its own thread
+    dspy.configure()
+
+    limits = ProviderLimits({**PROVIDER_LIMITS, **dict(args.limit)},
+                            limiter=AdaptiveLimiter if args.adaptive else ProviderLimiter)
+    store = ResultsStore(args.store)
+    start = time.perf_counter()
+    reports = run_models(args.models, judge_model=args.judge_model, store=store, limits=limits, force=args.force)
+    wall = time.perf_counter() - start
+
+    print(f"{'Model':<36} | {'Provider':<11} | {'Examples':>8} | {'Seconds':>7} | {'Ex/s':>5} | {'LM calls':>8}")
+    print("-" * 91)
+    for report in sorted(reports, key=lambda r: r['model']):
+        rate = report['examples'] / report['seconds'] if report['seconds'] else 0.0
+        print(f"{report['model']:<36} | {provider_of(report['model']):<11} | {report['examples']:>8} | "
+              f"{report['seconds']:>7.1f} | {rate:>5.2f} | {report['lm_calls']:>8}")
+    serial = sum(report['seconds'] for report in reports)
+    print(f"Wall time {wall:.1f}s for all models (the models one after another: {serial:.1f}s)")
+    for provider, limiter in sorted(limits.limiters.items()):
+        if args.adaptive:
+            print(f"  {format_stats(limiter)}")
+            continue
+        print(f"  {provider}: {limiter.requests} requests, {limiter.wait_seconds:.1f}s waiting for a slot "
+              f"(limit {limiter.max_concurrency} concurrent, {limiter.rpm or 'no'} rpm)")
+
+    print()
+    print_comparison(*store.compare(args.models, judge_model=args.judge_model))
+    store.close()
+
+if __name__ == "__main__":
+    run()
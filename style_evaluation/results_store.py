@@ -0,0 +1,164 @@
+import os
+import time
+import sqlite3
+import hashlib
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE = os.path.join(HERE, 'results.sqlite')
+
+COLUMNS = ("example_id", "predictor_model", "judge_model", "prompt_hash",
+           "question", "style", "answer", "style_score", "length", "created")
+
+def example_id(question, style):
+    """Stable id of a devset example, from its inputs."""
+    return hashlib.sha256(f"{question}\0{style}".encode("utf-8")).hexdigest()[:16]
+
+class ResultsStore:
+    """
+    Style-evaluation results in SQLite, one row per (example, predictor
+    model, judge model, prompt hash) cell.
+
+    A rerun asks `missing()` which examples have no row for its key and only
+    evaluates those; a change to the prompts changes the hash, so every cell
+    is recomputed. Queries never call an LM, and this module does not import
+    dspy, so comparing stored runs is instant.
+    """
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                example_id TEXT NOT NULL,
+                predictor_model TEXT NOT NULL,
+                judge_model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                question TEXT NOT NULL,
+                style TEXT NOT NULL,
+                answer TEXT,
+                style_score REAL,
+                length INTEGER,
+                created REAL NOT NULL,
+                PRIMARY KEY (example_id, predictor_model, judge_model, prompt_hash)
+            )""")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, predictor_model, judge_model, prompt_hash):
+        """Return {example_id: row dict} of one run."""
+        rows = self.conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM results "
+            "WHERE predictor_model = ? AND judge_model = ? AND prompt_hash = ?",
+            (predictor_model, judge_model, prompt_hash),
+        )
+        return {row[0]: dict(zip(COLUMNS, row)) for row in rows}
+
+    def missing(self, examples, predictor_model, judge_model, prompt_hash):
+        """Return the (question, style) examples that have no stored result for this key."""
+        done = self.get(predictor_model, judge_model, prompt_hash)
+        return [ex for ex in examples if example_id(ex["question"], ex["style"]) not in done]
+
+    def put(self, predictor_model, judge_model, prompt_hash, results):
+        """
+        Store results, a list of dicts with question, style, answer,
+        style_score and length, in one transaction.
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [(example_id(r["question"], r["style"]), predictor_model, judge_model, prompt_hash,
+                  r["question"], r["style"], r.get("answer"), r.get("style_score"), r.get("length"), now)
+                 for r in results],
+            )
+
+    def runs(self):
+        """Summarize every stored run: models, prompt hash, examples, averages and last update."""
+        rows = self.conn.execute("""
+            SELECT predictor_model, judge_model, prompt_hash, COUNT(*), AVG(style_score), AVG(length), MAX(created)
+            FROM results GROUP BY predictor_model, judge_model, prompt_hash ORDER BY MAX(created) DESC""")
+        keys = ("predictor_model", "judge_model", "prompt_hash", "examples", "style_score", "length", "updated")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def latest_hash(self, predictor_model, judge_model):
+        row = self.conn.execute(
+            "SELECT prompt_hash FROM results WHERE predictor_model = ? AND judge_model = ? "
+            "ORDER BY created DESC LIMIT 1", (predictor_model, judge_model)).fetchone()
+        return row[0] if row else None
+
+    def compare(self, models, judge_model=None, prompt_hash=None):
+        """
+        Line up the results of several predictor models per example.
+
+        Each model's most recent prompt hash is used unless `prompt_hash` is
+        given; `judge_model` defaults to the model itself (self-judged runs).
+        Returns (examples, columns): examples is a list of
+        {question, style, cells: {model: row}} in first-seen order.
+        """
+        examples = {}
+        for model in models:
+            judge = judge_model or model
+            run_hash = prompt_hash or self.latest_hash(model, judge)
+            if run_hash is None:
+                continue
+            for row in self.get(model, judge, run_hash).values():
+                entry = examples.setdefault(row["example_id"], {
+                    "question": row["question"], "style": row["style"], "cells": {}})
+                entry["cells"][model] = row
+        return list(examples.values()), models
+
+def print_comparison(examples, models):
+    """Print per-example style scores and lengths of each model side by side, with averages."""
+    width = max(12, *(len(m) for m in models))
+    print(f"{'Query':<25} | {'Style':<8} | " + " | ".join(f"{m:<{width}}" for m in models))
+    print("-" * (38 + (width + 3) * len(models)))
+    for entry in examples:
+        question = entry["question"][:22] + "..." if len(entry["question"]) > 22 else entry["question"]
+        cells = []
+        for model in models:
+            row = entry["cells"].get(model)
+            if row is None or row["style_score"] is None:
+                cells.append(f"{'-':<{width}}")
+            else:
+                cells.append(f"{row['style_score']:.2f} ({row['length']}w)".ljust(width))
+        print(f"{question:<25} | {entry['style']:<8} | " + " | ".join(cells))
+    print("-" * (38 + (width + 3) * len(models)))
+
+    averages = []
+    for model in models:
+        scores = [e["cells"][model]["style_score"] for e in examples
+                  if model in e["cells"] and e["cells"][model]["style_score"] is not None]
+        averages.append(f"{sum(scores) / len(scores):.2f}".ljust(width) if scores else f"{'-':<{width}}")
+    print(f"{'Average style score':<36} | " + " | ".join(averages))
+
+    # Examples where the models disagree on whether the style was matched
+    flips = [e for e in examples if len({(e["cells"][m]["style_score"] or 0) >= 0.5
+                                         for m in models if m in e["cells"]}) > 1]
+    print(f"Examples where the models disagree on the style match: {len(flips)}")
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Query stored style-evaluation results without calling any LM.")
+    parser.add_argument("--store", default=DEFAULT_STORE)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("runs", help="list stored runs")
+    diff = sub.add_parser("diff", help="compare predictor models side by side")
+    diff.add_argument("models", nargs="+")
+    diff.add_argument("--judge", help="judge model (default: each model judges itself)")
+    diff.add_argument("--prompt-hash", help="compare this prompt version instead of each model's latest")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.store)
+    if args.command == "runs":
+        print(f"{'Predictor':<32} | {'Judge':<32} | {'Prompt':<8} | {'Examples':>8} | {'Style':>5} | {'Length':>6} | Updated")
+        for run in store.runs():
+            updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["updated"]))
+            score = f"{run['style_score']:.2f}" if run["style_score"] is not None else "N/A"
+            print(f"{run['predictor_model']:<32} | {run['judge_model']:<32} | {run['prompt_hash'][:8]:<8} | "
+                  f"{run['examples']:>8} | {score:>5} | {run['length'] or 0:>6.0f} | {updated}")
+    else:
+        print_comparison(*store.compare(args.models, judge_model=args.judge, prompt_hash=args.prompt_hash))
+    store.close()
@@ -1,27 +1,16 @@
 import dspy
 
 from dotenv import load_dotenv
+from results_store import ResultsStore, DEFAULT_STORE, example_id
 import os
+import sys
+import json
+import hashlib
+import argparse
 
-load_dotenv()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# USE GPT-4o FOR EVALUATION
-api_key = os.environ.get("OPENAI_API_KEY")
-if not api_key:
-    print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
-    exit(1)
-lm = dspy.LM('openai/gpt-4.1-mini', api_key=api_key)
-#lm = dspy.LM('openai/gpt-4o', api_key=api_key)
-
-
-# USE CLAUDE-SONNET4 FOR EVALUATION
-# api_key = os.environ.get("CLAUDE_API_KEY")
-# if not api_key:
-#    print("Claude API key not found. Please set the CLAUDE_API_KEY environment variable.")
-#    exit(1)
-# lm = dspy.LM('anthropic/claude-sonnet-4-20250514', api_key=api_key)
-
-dspy.settings.configure(lm=lm)
+from fingerprint import signature_fingerprint
 
 class QuestionAnswer(dspy.Signature):
     question: str = dspy.InputField()
@@ -36,77 +25,238 @@ class StyleEvaluation(dspy.Signature):
     style_match: bool = dspy.OutputField()
     confidence: float = dspy.OutputField()
 
+class BatchStyleEvaluation(dspy.Signature):
+    """Evaluate if each answer matches its requested style. Neutral should be balanced/objective, NOT sarcastic.
+    Return exactly one style_match and one confidence per item, in the order of the items."""
+    items: list[dict[str, str]] = dspy.InputField(desc="items with question, requested_style (formal=professional, casual=friendly, neutral=balanced/objective) and answer")
+    style_matches: list[bool] = dspy.OutputField(desc="one entry per item")
+    confidences: list[float] = dspy.OutputField(desc="one entry per item")
+
+STYLE_INSTRUCTIONS = {
+    "formal": "Be formal and professional.",
+    "casual": "Be casual and friendly.",
+    "neutral": "Act like a tired, frustrated person who's annoyed by obvious questions. Use phrases like 'Obviously...', 'Come on...', 'Really?'"  # Intentional mismatch
+}
+
 class StylePredictor(dspy.Module):
     def __init__(self):
         super().__init__()
         self.generate_answer = dspy.ChainOfThought(QuestionAnswer)
     
     def forward(self, question: str, style: str):
-        instructions = {
-            "formal": "Be formal and professional.",
-            "casual": "Be casual and friendly.",
-            "neutral": "Act like a tired, frustrated person who's annoyed by obvious questions. Use phrases like 'Obviously...', 'Come on...', 'Really?'"  # Intentional mismatch
-        }
-        enhanced_question = f"{instructions.get(style, '')} {question}"
+        enhanced_question = f"{STYLE_INSTRUCTIONS.get(style, '')} {question}"
         return self.generate_answer(question=enhanced_question, style=style)
 
 style_evaluator = dspy.Predict(StyleEvaluation)
 
-def style_metric(example, prediction):
-    result = style_evaluator(
-        question=example.question,
-        requested_style=example.style, 
-        answer=prediction.answer
-    )
+def style_score(style_match, confidence):
+    """Turn a judge's style_match/confidence pair into a score."""
     try:
-        match = str(result.style_match).lower() in ['true', 'yes', '1']
-        score = float(result.confidence) if match else 0.2
+        match = str(style_match).lower() in ['true', 'yes', '1']
+        score = float(confidence) if match else 0.2
         return score
     except Exception as e:
         return 0.5
 
+def style_metric(example, prediction, lm=None):
+    with dspy.context(lm=lm or dspy.settings.lm):
+        result = style_evaluator(
+            question=example.question,
+            requested_style=example.style, 
+            answer=prediction.answer
+        )
+    return style_score(result.style_match, result.confidence)
+
+# Score of an answer the judge could not score, dspy.Evaluate's default failure_score
+FAILURE_SCORE = 0.0
+
+def lm_usage(lm, start=0):
+    """Return (calls, total tokens) of `lm` since history index `start`."""
+    history = list(lm.history)[start:]
+    tokens = sum((entry.get('usage') or {}).get('total_tokens', 0) or 0 for entry in history)
+    return len(history), tokens
+
+class BatchStyleJudge:
+    """
+    LLM-as-judge that scores up to `batch_size` answers per call.
+
+    Each batch packs the (question, requested_style, answer) triples into one
+    BatchStyleEvaluation call. If the reply cannot be parsed or does not hold
+    one judgment per item, the batch falls back to one style_metric call per item;
+    an item that still fails gets FAILURE_SCORE, as dspy.Evaluate would give it.
+    Judgments use `lm` when given, otherwise the configured LM. Calls and
+    tokens are counted so `report()` can compare against the per-example path.
+    """
+
+    def __init__(self, batch_size=8, lm=None):
+        self.batch_size = batch_size
+        self.lm = lm
+        self.batch_evaluator = dspy.Predict(BatchStyleEvaluation)
+        self.items = 0
+        self.batch_calls = 0
+        self.fallback_calls = 0
+        self.failed_batches = 0
+        self.failed_items = 0
+        self.batch_tokens = 0
+        self.fallback_tokens = 0
+
+    def _judge_batch(self, examples, predictions):
+        items = [
+            {'question': ex.question, 'requested_style': ex.style, 'answer': pred.answer}
+            for ex, pred in zip(examples, predictions)
+        ]
+        result = self.batch_evaluator(items=items)
+        matches, confidences = list(result.style_matches), list(result.confidences)
+        if len(matches) != len(items) or len(confidences) != len(items):
+            raise ValueError(f"expected {len(items)} judgments, got {len(matches)}/{len(confidences)}")
+        return [style_score(m, c) for m, c in zip(matches, confidences)]
+
+    def __call__(self, examples, predictions):
+        # Judge on a copy with its own history, so other threads' calls are not counted as the judge's
+        lm = (self.lm or dspy.settings.lm).copy()
+        with dspy.context(lm=lm):
+            return self._judge_all(examples, predictions, lm)
+
+    def _judge_all(self, examples, predictions, lm):
+        scores = []
+        for i in range(0, len(examples), self.batch_size):
+            batch_examples = examples[i:i + self.batch_size]
+            batch_predictions = predictions[i:i + self.batch_size]
+            self.items += len(batch_examples)
+
+            start = len(lm.history)
+            try:
+                scores.extend(self._judge_batch(batch_examples, batch_predictions))
+                calls, tokens = lm_usage(lm, start)
+                self.batch_calls += calls
+                self.batch_tokens += tokens
+                continue
+            except Exception as e:
+                calls, tokens = lm_usage(lm, start)
+                self.batch_calls += calls
+                self.batch_tokens += tokens
+                self.failed_batches += 1
+                print(f"Batch judgment failed ({e}), falling back to per-item calls")
+
+            start = len(lm.history)
+            for ex, pred in zip(batch_examples, batch_predictions):
+                try:
+                    scores.append(style_metric(ex, pred))
+                except Exception as e:
+                    # Like dspy.Evaluate, an item the judge cannot score gets the failure score
+                    self.failed_items += 1
+                    print(f"Judgment failed for {example_key(ex)} ({type(e).__name__}), scoring it {FAILURE_SCORE}")
+                    scores.append(FAILURE_SCORE)
+            calls, tokens = lm_usage(lm, start)
+            self.fallback_calls += calls
+            self.fallback_tokens += tokens
+        return scores
+
+    def report(self, per_example_tokens=None):
+        """
+        Summarize judge calls and tokens. The per-example path makes one call
+        per item; pass its measured token count as `per_example_tokens`,
+        otherwise it is estimated from the fallback calls when there were any.
+        """
+        calls = self.batch_calls + self.fallback_calls
+        tokens = self.batch_tokens + self.fallback_tokens
+        if per_example_tokens is None and self.fallback_calls:
+            per_example_tokens = self.fallback_tokens / self.fallback_calls * self.items
+        return {
+            'items': self.items,
+            'calls': calls,
+            'failed_batches': self.failed_batches,
+            'failed_items': self.failed_items,
+            'fallback_calls': self.fallback_calls,
+            'calls_saved': self.items - calls,
+            'tokens': tokens,
+            'per_example_tokens': per_example_tokens,
+            'tokens_saved': per_example_tokens - tokens if per_example_tokens is not None else None,
+        }
+
 def length_metric(example, prediction):
     return len(prediction.answer.split())
 
-# Store results for table display
-table_results = []
-
-def style_metric_with_storage(example, prediction):
-    score = style_metric(example, prediction)
-    # Find existing entry or create new one
-    for result in table_results:
-        if result['question'] == example.question:
-            result['style_score'] = score
-            result['prediction'] = prediction.answer
-            return score
-    # Create new entry
-    table_results.append({
-        'question': example.question,
-        'style': example.style,
-        'style_score': score,
-        'prediction': prediction.answer,
-        'length': None
-    })
-    return score
-
-def length_metric_with_storage(example, prediction):
-    length = length_metric(example, prediction)
-    # Find existing entry or create new one
-    for result in table_results:
-        if result['question'] == example.question:
-            result['length'] = length
-            if 'prediction' not in result:
-                result['prediction'] = prediction.answer
-            return length
-    # Create new entry
-    table_results.append({
-        'question': example.question,
-        'style': example.style,
-        'style_score': None,
-        'prediction': prediction.answer,
-        'length': length
-    })
-    return length
+def example_key(example):
+    """Key a devset example by its inputs."""
+    return (example.question, example.style)
+
+def prompt_hash(judge_batch_size):
+    """Hash everything that shapes the answers and the judgments, to key stored results."""
+    judge = BatchStyleEvaluation if judge_batch_size > 1 else StyleEvaluation
+    payload = json.dumps({
+        "predictor": signature_fingerprint(QuestionAnswer),
+        "instructions": STYLE_INSTRUCTIONS,
+        "judge": signature_fingerprint(judge),
+        "judge_batch_size": judge_batch_size,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MultiMetricEvaluate:
+    """
+    Evaluate a program with several metrics while generating each prediction once.
+
+    Predictions come from a single dspy.Evaluate pass; every prediction is then
+    scored by all `metrics` (a dict of name -> metric function). `batch_metrics`
+    are scored after the pass, over all predictions at once, by functions that
+    take a list of examples and a list of predictions and return a list of scores.
+    Per-example results are kept in `results`, a dict keyed by `example_key(example)`.
+
+    dspy.Evaluate reports the `primary` metric, which must score in [0, 1].
+    When it is not one of `metrics` (e.g. a batch metric, scored after the
+    pass), every answered example scores 1.0, so Evaluate reports the share
+    of examples that produced a prediction.
+    """
+
+    def __init__(self, devset, metrics, batch_metrics=None, primary=None, num_threads=1, display_progress=True):
+        self.devset = devset
+        self.metrics = metrics
+        self.batch_metrics = batch_metrics or {}
+        self.primary = primary
+        self.num_threads = num_threads
+        self.display_progress = display_progress
+        self.results = {}
+
+    def _score(self, example, prediction, trace=None):
+        scores = {name: metric(example, prediction) for name, metric in self.metrics.items()}
+        self.results[example_key(example)] = {
+            'example': example,
+            'prediction': prediction,
+            'scores': scores,
+        }
+        if self.primary in scores:
+            return scores[self.primary]
+        return 1.0
+
+    def __call__(self, program):
+        self.results = {}
+        evaluator = dspy.Evaluate(
+            devset=self.devset,
+            metric=self._score,
+            num_threads=self.num_threads,
+            display_progress=self.display_progress,
+            display_table=0,
+        )
+        evaluator(program)
+
+        results = list(self.results.values())
+        examples = [r['example'] for r in results]
+        predictions = [r['prediction'] for r in results]
+        for name, batch_metric in self.batch_metrics.items():
+            for result, score in zip(results, batch_metric(examples, predictions)):
+                result['scores'][name] = score
+        return self.averages()
+
+    def averages(self):
+        """Return the mean of every metric over the scored examples."""
+        averages = {}
+        for name in [*self.metrics, *self.batch_metrics]:
+            values = [r['scores'][name] for r in self.results.values() if r['scores'][name] is not None]
+            averages[name] = sum(values) / len(values) if values else None
+        return averages
+
+# Default number of answers the style judge scores per call (1 = one judge call per example)
+JUDGE_BATCH_SIZE = 4
 
 # Sample data
 examples = [
@@ -116,46 +266,156 @@ examples = [
     {"question": "How can i cook soup?", "style": "neutral"},
 ]
 
-# Initialize predictor
-predictor = StylePredictor()
+def make_lm(model):
+    """Create the LM for a provider/model name, with the provider's API key from the environment."""
+    env = "CLAUDE_API_KEY" if model.startswith("anthropic/") else "OPENAI_API_KEY"
+    api_key = os.environ.get(env)
+    if not api_key:
+        print(f"API key not found. Please set the {env} environment variable.")
+        exit(1)
+    return dspy.LM(model, api_key=api_key)
 
-# Convert examples to DSPy format
-dspy_examples = [
-    dspy.Example(question=ex["question"], style=ex["style"]).with_inputs("question", "style") 
-    for ex in examples
-]
+def evaluate_examples(todo, judge_lm, judge_batch_size=JUDGE_BATCH_SIZE, num_threads=1, display_progress=True):
+    """
+    Answer the (question, style) examples in `todo` with StylePredictor on
+    the configured LM and score them with `judge_lm`, `judge_batch_size`
+    answers per judge call.
+
+    Returns the MultiMetricEvaluate with the per-example results, and the
+    BatchStyleJudge (None when judge_batch_size is 1).
+    """
+    # Initialize predictor
+    predictor = StylePredictor()
+
+    # Convert examples to DSPy format
+    dspy_examples = [
+        dspy.Example(question=ex["question"], style=ex["style"]).with_inputs("question", "style") 
+        for ex in todo
+    ]
+
+    # Create one DSPy evaluator for all metrics, so each answer is generated only once
+    if judge_batch_size > 1:
+        judge = BatchStyleJudge(batch_size=judge_batch_size, lm=judge_lm)
+        evaluator = MultiMetricEvaluate(
+            devset=dspy_examples,
+            metrics={'length': length_metric},
+            batch_metrics={'style_score': judge},
+            primary='style_score',
+            num_threads=num_threads,
+            display_progress=display_progress,
+        )
+    else:
+        judge = None
+        evaluator = MultiMetricEvaluate(
+            devset=dspy_examples,
+            metrics={'style_score': lambda ex, pred: style_metric(ex, pred, lm=judge_lm), 'length': length_metric},
+            primary='style_score',
+            num_threads=num_threads,
+            display_progress=display_progress,
+        )
+
+    # Run evaluations using DSPy - this handles everything automatically
+    evaluator(predictor)
+    return evaluator, judge
+
+def per_example_tokens(judge, evaluator):
+    """
+    Judge every answer of `evaluator` once more, one call per answer, and
+    return the tokens that took. The calls run on an uncached copy of the
+    judge's LM, so a rerun measures the per-example path instead of replaying it.
+    """
+    lm = (judge.lm or dspy.settings.lm).copy(cache=False)
+    for result in evaluator.results.values():
+        style_metric(result['example'], result['prediction'], lm=lm)
+    return lm_usage(lm)[1]
+
+def result_rows(evaluator):
+    """Rows for the ResultsStore from an evaluator's per-example results."""
+    return [
+        {
+            'question': result['example'].question,
+            'style': result['example'].style,
+            'answer': result['prediction'].answer,
+            'style_score': result['scores']['style_score'],
+            'length': result['scores']['length'],
+        }
+        for result in evaluator.results.values()
+    ]
+
+def run(argv=None):
+    """Generate styled answers and score them with the LM judge, reusing stored results."""
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Evaluate how well a model answers in a requested style.")
+    parser.add_argument("--model", default="openai/gpt-4.1-mini",
+                        help="predictor model, e.g. openai/gpt-4o or anthropic/claude-sonnet-4-20250514")
+    parser.add_argument("--judge-model", help="judge model (default: the predictor model)")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="SQLite results store")
+    parser.add_argument("--force", action="store_true", help="recompute every result instead of reusing stored ones")
+    parser.add_argument("--judge-batch-size", type=int, default=JUDGE_BATCH_SIZE,
+                        help="answers the style judge scores per call (1 = one judge call per answer)")
+    parser.add_argument("--compare-judge", action="store_true",
+                        help="also judge every answer one call at a time, to measure the tokens batching saves")
+    args = parser.parse_args(argv)
+    judge_model = args.judge_model or args.model
+
+    store = ResultsStore(args.store)
+    run_hash = prompt_hash(args.judge_batch_size)
+    todo = examples if args.force else store.missing(examples, args.model, judge_model, run_hash)
+    print(f"=== Style evaluation: {args.model} judged by {judge_model} (prompt {run_hash[:8]}) ===")
+    print(f"{len(examples) - len(todo)} of {len(examples)} results reused from {args.store}")
+
+    judge = None
+    if todo:
+        # LMs are only needed for the missing results
+        lm = make_lm(args.model)
+        judge_lm = lm if judge_model == args.model else make_lm(judge_model)
+        if args.compare_judge:
+            # Both judge paths pay for their calls, so cached judgments do not count as tokens saved
+            judge_lm = judge_lm.copy(cache=False)
+        dspy.settings.configure(lm=lm)
+
+        print("\nRunning evaluations...")
+        evaluator, judge = evaluate_examples(todo, judge_lm, judge_batch_size=args.judge_batch_size)
+        store.put(args.model, judge_model, run_hash, result_rows(evaluator))
+
+    stored = store.get(args.model, judge_model, run_hash)
+    store.close()
+
+    # Display results table
+    print(f"\n{'='*120}")
+    print("RESULTS TABLE")
+    print(f"{'='*120}")
+    print(f"{'Query':<25} | {'Style':<8} | {'Prediction':<50} | {'Style Score':<11} | {'Length':<6}")
+    print("-" * 120)
+
+    rows = [stored[key] for key in (example_id(ex["question"], ex["style"]) for ex in examples) if key in stored]
+    for row in rows:
+        answer = row['answer'] or ""
+        question = row['question'][:22] + "..." if len(row['question']) > 22 else row['question']
+        prediction = answer[:47] + "..." if len(answer) > 47 else answer
+        style_score = f"{row['style_score']:.2f}" if row['style_score'] is not None else "N/A"
+        length = str(row['length']) if row['length'] is not None else "N/A"
+        print(f"{question:<25} | {row['style']:<8} | {prediction:<50} | {style_score:<11} | {length:<6}")
+
+    print("-" * 120)
+
+    scores = [row['style_score'] for row in rows if row['style_score'] is not None]
+    lengths = [row['length'] for row in rows if row['length'] is not None]
+    print(f"\n{'='*50}")
+    print("FINAL RESULTS")
+    print(f"{'='*50}")
+    print(f"Average Style Score: {sum(scores) / len(scores):.2f}" if scores else "Average Style Score: N/A")
+    print(f"Average Length: {sum(lengths) / len(lengths):.0f} words" if lengths else "Average Length: N/A")
+    if judge is not None:
+        report = judge.report(per_example_tokens(judge, evaluator) if args.compare_judge else None)
+        print(f"Judge calls: {report['calls']} for {report['items']} answers "
+              f"({report['calls_saved']} saved vs. per-example, {report['fallback_calls']} fallback, "
+              f"{report['failed_items']} unscored)")
+        tokens_saved = f"{report['tokens_saved']:.0f}" if report['tokens_saved'] is not None else "N/A"
+        print(f"Judge tokens: {report['tokens']} (saved vs. per-example: {tokens_saved})")
+    print(f"{'='*50}")
+    print("Done!")
 
-# Create DSPy evaluators
-style_evaluator_obj = dspy.Evaluate(devset=dspy_examples, metric=style_metric_with_storage, display_progress=True, display_table=0)
-length_evaluator_obj = dspy.Evaluate(devset=dspy_examples, metric=length_metric_with_storage, display_progress=True, display_table=0)
-
-print("=== DSPy Built-in Evaluation ===")
-
-# Run evaluations using DSPy - this handles everything automatically
-print("\nRunning evaluations...")
-avg_style_score = style_evaluator_obj(predictor)
-avg_length_score = length_evaluator_obj(predictor)
-
-# Display results table
-print(f"\n{'='*120}")
-print("RESULTS TABLE")
-print(f"{'='*120}")
-print(f"{'Query':<25} | {'Style':<8} | {'Prediction':<50} | {'Style Score':<11} | {'Length':<6}")
-print("-" * 120)
-
-for result in table_results:
-    question = result['question'][:22] + "..." if len(result['question']) > 22 else result['question']
-    prediction = result['prediction'][:47] + "..." if len(result['prediction']) > 47 else result['prediction']
-    style_score = f"{result['style_score']:.2f}" if result['style_score'] is not None else "N/A"
-    length = str(result['length']) if result['length'] is not None else "N/A"
-    print(f"{question:<25} | {result['style']:<8} | {prediction:<50} | {style_score:<11} | {length:<6}")
-
-print("-" * 120)
-
-print(f"\n{'='*50}")
-print("FINAL RESULTS")
-print(f"{'='*50}")
-print(f"Average Style Score: {avg_style_score:.2f}")
-print(f"Average Length: {avg_length_score:.0f} words")
-print(f"{'='*50}")
-print("Done!")
\ No newline at end of file
+if __name__ == "__main__":
+    run()
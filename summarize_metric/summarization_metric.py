@@ -1,9 +1,25 @@
 import json
-import sys, os
+import os
+import re
+import sys
+import time
+import zlib
+import hashlib
+import queue
+import argparse
+import tempfile
+import threading
 import dspy
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 
-load_dotenv()
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.dirname(HERE))
+
+from fingerprint import signature_fingerprint
+from rate_limit import AdaptiveLimiter, format_stats, rate_limited
 
 class Breakdown(dspy.Signature):
     """
@@ -40,62 +56,777 @@ class SummaryCorrectness(dspy.Signature):
     overall_score: float = dspy.OutputField(
         desc="overall score for the summary out of 1.0")
 
+class KeyIdeaCache:
+    """
+    Persistent, content-addressed cache for the Breakdown step.
+
+    Entries are keyed on the passage text, the model name and the
+    signature fingerprint, and hold the `key_ideas` and `importance_grades`
+    of a passage as one small JSON file each. When the files on disk exceed
+    `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    def key(self, passage, model, signature):
+        """Return the content address of a (passage, model, signature) triple."""
+        digest = hashlib.sha256()
+        for part in (passage, model, signature_fingerprint(signature)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entries(self):
+        """Yield (path, last access time, size) for every cached entry."""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """Return the cached breakdown for `key`, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Touch the entry so eviction treats it as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store a breakdown and evict old entries if the cache is too big."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value).encode("utf-8")
+
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.total_bytes += len(data) - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits its budget."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self.total_bytes = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Return hit/miss counters; every hit is one Breakdown LM call saved."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "lm_calls_saved": self.hits,
+            "evictions": self.evictions,
+            "bytes": self.total_bytes,
+        }
+
+# Weight of a key idea by its importance grade; any other grade counts as Low
+GRADE_WEIGHTS = {'High': 1.0, 'Medium': 0.7}
+LOW_WEIGHT = 0.2
+
+def weighted_scores(importance_grades, binary_scores, overall_scores):
+    """
+    Score a batch of assessments at once: the weighted share of key ideas
+    each summary contains, where every key idea counts with the weight of its
+    importance grade. A row whose binary scores cannot be used, or that has
+    no key ideas, falls back to its overall score. Returns a NumPy array.
+    """
+    rows = len(importance_grades)
+    grades, hits, grade_rows, fallback = [], [], [], []
+    for row, (row_grades, row_hits) in enumerate(zip(importance_grades, binary_scores)):
+        try:
+            row_grades = list(row_grades)
+            row_hits = [int(hit) for hit in list(row_hits)[:len(row_grades)]]
+        except (TypeError, ValueError):
+            fallback.append(row)
+            continue
+        # Key ideas without a binary score count as missing
+        grades.extend(row_grades)
+        hits.extend(row_hits + [0] * (len(row_grades) - len(row_hits)))
+        grade_rows.extend([row] * len(row_grades))
+
+    grade_array = np.array(grades, dtype=object)
+    weights = np.full(len(grades), LOW_WEIGHT)
+    for grade, weight in GRADE_WEIGHTS.items():
+        weights[grade_array == grade] = weight
+    grade_rows = np.array(grade_rows, dtype=np.intp)
+    found = np.bincount(grade_rows, weights=weights * np.array(hits, dtype=np.float64), minlength=rows)
+    total = np.bincount(grade_rows, weights=weights, minlength=rows)
+
+    scores = np.divide(found, total, out=np.zeros(rows), where=total > 0)
+    fallback = set(fallback) | set(np.flatnonzero(total == 0).tolist())
+    for row in fallback:
+        scores[row] = float(overall_scores[row])
+    return scores
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the their this to was were "
+    "which with".split())
+
+def split_key_ideas(key_ideas):
+    """Split a Breakdown's numbered key ideas into idea texts, without numbering and importance grade."""
+    ideas = []
+    for line in str(key_ideas).splitlines():
+        match = re.match(r'\s*\d+[.)]\s*(.+)', line)
+        if match:
+            ideas.append(re.sub(r'[\s.,;:-]*\b(?:High|Medium|Low)\b\.?\s*$', '', match.group(1), flags=re.I).strip())
+    return ideas
+
+def shingles(text):
+    """Hashes of the content words of `text` (kind 1) and of its adjacent word pairs (kind 2)."""
+    words = [word[:-1] if len(word) > 3 and word.endswith('s') else word
+             for word in re.findall(r'[a-z0-9]+', text.lower()) if len(word) > 1 and word not in STOPWORDS]
+    hashed = {(zlib.crc32(word.encode()), 1) for word in words}
+    hashed.update((zlib.crc32(f"{a} {b}".encode()), 2) for a, b in zip(words, words[1:]))
+    return hashed
+
+class LexicalMatcher:
+    """
+    Settle the clear-cut key ideas of a summary without the LM.
+
+    An idea is present when the summary contains at least `present` of its
+    content words and `present_pairs` of its adjacent word pairs (hashed
+    shingles), and absent when it contains at most `absent` of its words
+    (by default none of a short idea's words, since paraphrases share few);
+    ideas shorter than `min_words` and everything in between are ambiguous
+    and left to the LM. Counters track how many ideas were settled.
+    """
+
+    PRESENT, ABSENT, AMBIGUOUS = 1, 0, -1
+
+    def __init__(self, present=0.8, present_pairs=0.5, absent=0.1, min_words=3):
+        self.present = present
+        self.present_pairs = present_pairs
+        self.absent = absent
+        self.min_words = min_words
+        self.ideas = 0
+        self.settled_present = 0
+        self.settled_absent = 0
+        self.lm_calls_skipped = 0
+        self._lock = threading.Lock()
+
+    def match_batch(self, ideas, rows, summaries):
+        """
+        Decide every idea of a batch at once: `ideas[i]` belongs to summary
+        `summaries[rows[i]]`. Returns an array of PRESENT, ABSENT or AMBIGUOUS.
+        """
+        keys, owners, kinds = [], [], []
+        for i, (idea, row) in enumerate(zip(ideas, rows)):
+            for digest, kind in shingles(idea):
+                keys.append((row << 32) | digest)
+                owners.append(i)
+                kinds.append(kind)
+        summary_keys = np.fromiter(((row << 32) | digest for row, summary in enumerate(summaries)
+                                    for digest, _ in shingles(summary)), dtype=np.int64)
+
+        found = np.isin(np.array(keys, dtype=np.int64), summary_keys).astype(np.float64)
+        owners, kinds = np.array(owners, dtype=np.intp), np.array(kinds)
+        n = len(ideas)
+        words = np.bincount(owners[kinds == 1], minlength=n)
+        pairs = np.bincount(owners[kinds == 2], minlength=n)
+        word_share = np.bincount(owners[kinds == 1], weights=found[kinds == 1], minlength=n) / np.maximum(words, 1)
+        pair_share = np.bincount(owners[kinds == 2], weights=found[kinds == 2], minlength=n) / np.maximum(pairs, 1)
+
+        decisions = np.full(n, self.AMBIGUOUS, dtype=np.int8)
+        long_enough = words >= self.min_words
+        decisions[long_enough & (word_share >= self.present) & ((pairs == 0) | (pair_share >= self.present_pairs))] = self.PRESENT
+        decisions[long_enough & (word_share <= self.absent)] = self.ABSENT
+        with self._lock:
+            self.ideas += n
+            self.settled_present += int((decisions == self.PRESENT).sum())
+            self.settled_absent += int((decisions == self.ABSENT).sum())
+        return decisions
+
+    def match(self, ideas, summary):
+        return self.match_batch(ideas, [0] * len(ideas), [summary])
+
+    def skipped_lm_call(self):
+        with self._lock:
+            self.lm_calls_skipped += 1
+
+    def stats(self):
+        settled = self.settled_present + self.settled_absent
+        return {
+            "ideas": self.ideas,
+            "present": self.settled_present,
+            "absent": self.settled_absent,
+            "local_share": settled / self.ideas if self.ideas else 0.0,
+            "lm_calls_skipped": self.lm_calls_skipped,
+        }
+
 class Metric(dspy.Module):
     """
     Compute a score for the correctness of a summary.
     """
 
-    def __init__(self):
+    def __init__(self, cache=None, matcher=None):
+        super().__init__()
         self.breakdown = dspy.ChainOfThought(Breakdown)
         self.assess = dspy.ChainOfThought(SummaryCorrectness)
+        self.cache = cache
+        self.matcher = matcher
+
+    def break_down(self, passage):
+        """
+        Return (key_ideas, importance_grades) for a passage, reusing the
+        cached breakdown when the same passage was already scored.
+        """
+        if self.cache is None:
+            breakdown = self.breakdown(passage=passage)
+            return breakdown.key_ideas, breakdown.importance_grades
+
+        key = self.cache.key(passage, dspy.settings.lm.model, Breakdown)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached["key_ideas"], cached["importance_grades"]
+
+        breakdown = self.breakdown(passage=passage)
+        self.cache.put(key, {
+            "key_ideas": breakdown.key_ideas,
+            "importance_grades": list(breakdown.importance_grades),
+        })
+        return breakdown.key_ideas, breakdown.importance_grades
+
+    def assess_ideas(self, key_ideas, importance_grades, summary):
+        """
+        Return (binary_scores, overall_score) of a summary against the key
+        ideas. With a matcher, the ideas the summary clearly contains or
+        clearly lacks are settled locally and only the others go to the LM,
+        renumbered; when every idea is settled the LM is not called.
+        """
+        ideas = split_key_ideas(key_ideas) if self.matcher is not None else []
+        if not ideas or len(ideas) != len(importance_grades):
+            scores = self.assess(key_ideas=key_ideas, summary=summary)
+            return scores.binary_scores, scores.overall_score
+        return self.complete_assessment(ideas, importance_grades, self.matcher.match(ideas, summary), summary)
+
+    def complete_assessment(self, ideas, importance_grades, decisions, summary):
+        """Ask the LM about the ideas the matcher left AMBIGUOUS and merge its scores with the settled ones."""
+        binary = (decisions == LexicalMatcher.PRESENT).tolist()
+        ambiguous = np.flatnonzero(decisions == LexicalMatcher.AMBIGUOUS)
+        if len(ambiguous) == 0:
+            self.matcher.skipped_lm_call()
+            return binary, sum(binary) / len(binary)
+
+        subset = "\n".join(f"{n}. {ideas[i]}. {importance_grades[i]}." for n, i in enumerate(ambiguous, 1))
+        scores = self.assess(key_ideas=subset, summary=summary)
+        # Ambiguous ideas the LM gives no score for count as missing
+        for i, hit in zip(ambiguous, scores.binary_scores):
+            binary[i] = bool(hit)
+        return binary, scores.overall_score
 
     def forward(self, example, pred, trace=None):
-        breakdown = self.breakdown(passage=example.passage)
-        key_ideas = breakdown.key_ideas
-        importance_grades = breakdown.importance_grades
+        key_ideas, importance_grades = self.break_down(example.passage)
+
+        binary_scores, overall_score = self.assess_ideas(key_ideas, importance_grades, pred.summary)
+
+        score = float(weighted_scores([importance_grades], [binary_scores], [overall_score])[0])
+
+        return score if trace is None else score >= 0.75
+
+def iter_rows(path, skip=()):
+    """
+    Lazily yield (row index, record) pairs from a JSONL file,
+    skipping blank lines and the rows listed in `skip`.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for row, line in enumerate(f):
+            if row in skip or not line.strip():
+                continue
+            yield row, json.loads(line)
+
+def load_checkpoint(output_path):
+    """
+    Read the results already written to `output_path`.
+
+    The output JSONL doubles as the checkpoint: every scored row is appended
+    and flushed as soon as it completes. A line cut short by a crash is
+    truncated away so the file can be appended to again.
+    Returns a dict of row index -> result record.
+    """
+    done = {}
+    if not os.path.exists(output_path):
+        return done
+
+    good_bytes = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            done[record["row"]] = record
+            good_bytes += len(line)
+
+    if good_bytes < os.path.getsize(output_path):
+        with open(output_path, 'r+b') as f:
+            f.truncate(good_bytes)
+    return done
+
+def score_row(metric, row, data):
+    """Score one dataset record and return its result record."""
+    passage = data.get("passage", "")
+    summary = data.get("summary", "")
+    example = dspy.Example(passage=passage, summary=summary)
+    pred = dspy.Example(passage=passage, summary=summary)
+
+    start = time.perf_counter()
+    score = metric(example=example, pred=pred)
+    return {
+        "row": row,
+        "score": float(score),
+        "reference": float(data.get("score", "0")),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+def agreement(records, threshold=0.75):
+    """
+    Compare metric scores with the dataset's reference scores: mean absolute
+    error, share of rows on the same side of the pass `threshold`, and the
+    Pearson correlation.
+    """
+    pairs = [(r["score"], r["reference"]) for r in records]
+    if not pairs:
+        return {"rows": 0, "mae": None, "threshold_agreement": None, "pearson": None}
+
+    n = len(pairs)
+    mae = sum(abs(s - ref) for s, ref in pairs) / n
+    same_side = sum((s >= threshold) == (ref >= threshold) for s, ref in pairs) / n
+
+    mean_s = sum(s for s, _ in pairs) / n
+    mean_ref = sum(ref for _, ref in pairs) / n
+    cov = sum((s - mean_s) * (ref - mean_ref) for s, ref in pairs)
+    var_s = sum((s - mean_s) ** 2 for s, _ in pairs)
+    var_ref = sum((ref - mean_ref) ** 2 for _, ref in pairs)
+    pearson = cov / (var_s * var_ref) ** 0.5 if var_s > 1e-12 and var_ref > 1e-12 else None
+
+    return {"rows": n, "mae": mae, "threshold_agreement": same_side, "pearson": pearson}
+
+def score_dataset(metric, input_path, output_path, workers=8):
+    """
+    Score every row of `input_path` with `workers` concurrent threads and
+    append results to `output_path` as they complete.
+
+    Rows already present in `output_path` are skipped, so an interrupted
+    run resumes where it stopped. At most `2 * workers` rows are in flight,
+    which keeps memory flat however large the input is.
+    """
+    done = load_checkpoint(output_path)
+    if done:
+        print(f"Resuming: {len(done)} rows already scored in {output_path}")
+
+    rows = iter_rows(input_path, skip=done)
+    scored = failed = 0
+    start = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+
+        def submit_next():
+            for row, data in rows:
+                pending[pool.submit(score_row, metric, row, data)] = row
+                return True
+            return False
+
+        for _ in range(2 * workers):
+            if not submit_next():
+                break
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                row = pending.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # Failed rows are not checkpointed, so a rerun retries them
+                    failed += 1
+                    print(f"Row {row} failed: {e}")
+                else:
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    os.fsync(out.fileno())
+                    done[row] = record
+                    scored += 1
+                submit_next()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "scored": scored,
+        "failed": failed,
+        "seconds": elapsed,
+        "rows_per_sec": scored / elapsed if elapsed else 0.0,
+        "agreement": agreement(list(done.values())),
+    }
 
-        scores = self.assess(key_ideas=key_ideas, summary=pred.summary,)
+def score_pipelined(metric, input_path, output_path, breakdown_workers=4, assess_workers=4,
+                    queue_size=16, flush_rows=32):
+    """
+    Score the dataset like score_dataset(), with the two LM stages of the
+    Metric pipelined instead of run back to back per row.
+
+    `breakdown_workers` threads break passages down and hand them to
+    `assess_workers` threads through a queue of at most `queue_size` rows,
+    so the breakdown of upcoming rows overlaps the assessment of earlier
+    ones and a slow stage holds the other back instead of piling up rows.
+    Assessed rows are scored `flush_rows` at a time with weighted_scores()
+    and then appended to `output_path`, which stays the resume checkpoint.
+    """
+    done = load_checkpoint(output_path)
+    if done:
+        print(f"Resuming: {len(done)} rows already scored in {output_path}")
+
+    rows = iter_rows(input_path, skip=done)
+    rows_lock = threading.Lock()
+    handoff = queue.Queue(maxsize=queue_size)
+    results = queue.Queue()
+    stats = {"breakdown_seconds": 0.0, "assess_seconds": 0.0, "handoff_wait_seconds": 0.0}
+    stats_lock = threading.Lock()
+
+    def add_seconds(name, seconds):
+        with stats_lock:
+            stats[name] += seconds
+
+    def break_down():
+        while True:
+            with rows_lock:
+                item = next(rows, None)
+            if item is None:
+                return
+            row, data = item
+            start = time.perf_counter()
+            try:
+                key_ideas, grades = metric.break_down(data.get("passage", ""))
+            except Exception as e:
+                results.put((row, data, None, None, e, start))
+                continue
+            add_seconds("breakdown_seconds", time.perf_counter() - start)
+            waiting = time.perf_counter()
+            handoff.put((row, data, key_ideas, grades, start))
+            add_seconds("handoff_wait_seconds", time.perf_counter() - waiting)
+
+    def assess():
+        while True:
+            item = handoff.get()
+            if item is None:
+                return
+            row, data, key_ideas, grades, start = item
+            stage_start = time.perf_counter()
+            try:
+                scores = metric.assess_ideas(key_ideas, grades, data.get("summary", ""))
+            except Exception as e:
+                results.put((row, data, None, None, e, start))
+                continue
+            add_seconds("assess_seconds", time.perf_counter() - stage_start)
+            results.put((row, data, grades, scores, None, start))
 
+    scored = failed = 0
+    batch = []
+    start = time.perf_counter()
+
+    def flush(out):
+        nonlocal scored
+        if not batch:
+            return
+        nonlocal failed
+        grades = [grades for _, _, grades, _, _ in batch]
+        binary = [binary_scores for _, _, _, (binary_scores, _), _ in batch]
+        overall = [overall_score for _, _, _, (_, overall_score), _ in batch]
         try:
-            weight_map = {'High': 1.0, 'Medium': 0.7}
-            score = sum(
-                weight_map.get(g, 0.2) * int(b)
-                for g, b in zip(importance_grades, scores.binary_scores)
-            )
-            score /= sum(weight_map.get(g, 0.2) for g in importance_grades)
+            scores = weighted_scores(grades, binary, overall)
+        except (TypeError, ValueError):
+            # An unusable overall score fails its own row only
+            scores = []
+            for i in range(len(batch)):
+                try:
+                    scores.append(weighted_scores(grades[i:i + 1], binary[i:i + 1], overall[i:i + 1])[0])
+                except (TypeError, ValueError) as e:
+                    print(f"Row {batch[i][0]} failed: {e}")
+                    scores.append(None)
+        for (row, data, _, _, seconds), score in zip(batch, scores):
+            if score is None:
+                failed += 1
+                continue
+            record = {
+                "row": row,
+                "score": float(score),
+                "reference": float(data.get("score", "0")),
+                "seconds": round(seconds, 3),
+            }
+            out.write(json.dumps(record) + "\n")
+            done[row] = record
+            scored += 1
+        out.flush()
+        os.fsync(out.fileno())
+        batch.clear()
 
-        except Exception:
-            score = float(scores.overall_score)
+    breakdown_threads = [threading.Thread(target=break_down, daemon=True) for _ in range(breakdown_workers)]
+    assess_threads = [threading.Thread(target=assess, daemon=True) for _ in range(assess_workers)]
+    for thread in breakdown_threads + assess_threads:
+        thread.start()
 
-        return score if trace is None else score >= 0.75
+    def close_stages():
+        for thread in breakdown_threads:
+            thread.join()
+        for _ in assess_threads:
+            handoff.put(None)
+        for thread in assess_threads:
+            thread.join()
+        results.put(None)
+
+    threading.Thread(target=close_stages, daemon=True).start()
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        while (item := results.get()) is not None:
+            row, data, grades, assessment, error, row_start = item
+            if error is not None:
+                # Failed rows are not checkpointed, so a rerun retries them
+                failed += 1
+                print(f"Row {row} failed: {error}")
+                continue
+            batch.append((row, data, grades, assessment, time.perf_counter() - row_start))
+            if len(batch) >= flush_rows:
+                flush(out)
+        flush(out)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "scored": scored,
+        "failed": failed,
+        "seconds": elapsed,
+        "rows_per_sec": scored / elapsed if elapsed else 0.0,
+        "agreement": agreement(list(done.values())),
+        **stats,
+    }
+
+def precheck_report(metric, matcher, input_path, workers=8):
+    """
+    Measure the lexical pre-check against LM-only assessment on a dataset.
+
+    Every row is assessed by the LM over all its key ideas, and again with
+    `matcher` settling what it can and the LM scoring the rest. Returns the
+    share of ideas settled locally, how often a settled idea agrees with the
+    LM-only binary score, and how far the combined scores are from the
+    LM-only scores.
+    """
+    hybrid = Metric(cache=metric.cache, matcher=matcher)
+    hybrid.breakdown, hybrid.assess = metric.breakdown, metric.assess
+
+    def compare(data):
+        passage, summary = data.get("passage", ""), data.get("summary", "")
+        key_ideas, grades = metric.break_down(passage)
+        lm_only = metric.assess(key_ideas=key_ideas, summary=summary)
+        lm_score = weighted_scores([grades], [lm_only.binary_scores], [lm_only.overall_score])[0]
+        ideas = split_key_ideas(key_ideas)
+        if not ideas or len(ideas) != len(grades):
+            return lm_score, lm_score, 0, 0, 0
+        decisions = matcher.match(ideas, summary)
+        settled = decisions != LexicalMatcher.AMBIGUOUS
+        lm_hits = np.zeros(len(ideas), dtype=bool)
+        lm_binary = [bool(hit) for hit in lm_only.binary_scores][:len(ideas)]
+        lm_hits[:len(lm_binary)] = lm_binary
+        agree = int(((decisions == LexicalMatcher.PRESENT) == lm_hits)[settled].sum())
+        binary, overall = hybrid.complete_assessment(ideas, grades, decisions, summary)
+        score = weighted_scores([grades], [binary], [overall])[0]
+        return lm_score, score, len(ideas), int(settled.sum()), agree
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(compare, (data for _, data in iter_rows(input_path))))
+
+    lm_scores = np.array([r[0] for r in results])
+    scores = np.array([r[1] for r in results])
+    ideas, settled, agree = (sum(r[i] for r in results) for i in (2, 3, 4))
+    return {
+        "rows": len(results),
+        "ideas": ideas,
+        "local_share": settled / ideas if ideas else 0.0,
+        "idea_agreement": agree / settled if settled else None,
+        "lm_calls_skipped": matcher.lm_calls_skipped,
+        "score_mae": float(np.abs(scores - lm_scores).mean()) if results else None,
+        "same_side": float(((scores >= 0.75) == (lm_scores >= 0.75)).mean()) if results else None,
+    }
+
+def compare_throughput(input_path, workers=8):
+    """
+    Score `input_path` three ways and return [(label, report)]: one row at a
+    time, `workers` rows at a time, and pipelined with the same `workers`
+    threads split between the two stages. Each path runs on its own
+    uncached copy of the configured LM and without the breakdown cache, so
+    every path pays for every LM call instead of replaying the previous
+    path's responses.
+    """
+    breakdown_workers = max(1, workers // 2)
+    assess_workers = max(1, workers - breakdown_workers)
+    paths = [
+        ("sequential", lambda metric, out: score_dataset(metric, input_path, out, workers=1)),
+        (f"row-parallel ({workers} workers)", lambda metric, out: score_dataset(metric, input_path, out, workers=workers)),
+        (f"pipelined ({breakdown_workers}+{assess_workers} workers)", lambda metric, out: score_pipelined(
+            metric, input_path, out, breakdown_workers=breakdown_workers, assess_workers=assess_workers)),
+    ]
+    # The scoring threads read the global settings, not a dspy.context of this thread
+    lm = dspy.settings.lm
+    reports = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, (label, score) in enumerate(paths):
+                dspy.settings.configure(lm=lm.copy(cache=False))
+                reports.append((label, score(Metric(), os.path.join(tmp, f"scores{i}.jsonl"))))
+    finally:
+        dspy.settings.configure(lm=lm)
+    return reports
+
+def run(argv=None):
+    """Score the demo examples, or the whole dataset with --batch."""
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Score summaries with the key-idea Metric.")
+    parser.add_argument("--batch", action="store_true",
+                        help="score the whole dataset concurrently instead of the two-example demo")
+    parser.add_argument("--input", default=os.path.join(HERE, 'dataset.jsonl'))
+    parser.add_argument("--output", default=os.path.join(HERE, 'scores.jsonl'),
+                        help="results JSONL, also used as the resume checkpoint")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--adaptive", action="store_true",
+                        help="adapt the in-flight LM calls (up to --workers) to 429s and latency, and retry 429s")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="with --batch, pipeline the breakdown and assessment stages (--workers threads each)")
+    parser.add_argument("--compare", action="store_true",
+                        help="time the sequential, row-parallel and pipelined batch paths on --input, "
+                             "each on an uncached LM and with --workers threads in total")
+    parser.add_argument("--precheck", action="store_true",
+                        help="settle clear-cut key ideas with a local lexical match and ask the LM only about the rest")
+    parser.add_argument("--precheck-report", action="store_true",
+                        help="compare the lexical pre-check with LM-only assessment on --input")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+        exit(1)
+
+    lm = dspy.LM('openai/gpt-4o', api_key=api_key)
+    limiter = None
+    if args.adaptive:
+        limiter = AdaptiveLimiter("openai", max_concurrency=args.workers)
+        lm = rate_limited(lm, limiter)
+    dspy.settings.configure(lm=lm)
 
-api_key = os.environ.get("OPENAI_API_KEY")
-if not api_key:
-    print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
-    exit(1)
+    # create evaluation program - metric
+    # the breakdown of a passage is cached on disk, so scoring more summaries
+    # of the same passage only pays for the SummaryCorrectness call
+    cache = KeyIdeaCache(os.path.join(HERE, '.cache', 'key_ideas'))
+    matcher = LexicalMatcher() if args.precheck or args.precheck_report else None
+    metric = Metric(cache=cache, matcher=matcher if args.precheck else None)
 
-lm = dspy.LM('openai/gpt-4o', api_key=api_key)
-dspy.settings.configure(lm=lm)
+    if args.precheck_report:
+        report = precheck_report(metric, matcher, args.input, workers=args.workers)
+        agreement_text = f"{report['idea_agreement']:.0%}" if report["idea_agreement"] is not None else "N/A"
+        print(f"{report['rows']} rows, {report['ideas']} key ideas: {report['local_share']:.0%} settled locally, "
+              f"{agreement_text} of them agree with the LM-only binary score; "
+              f"{report['lm_calls_skipped']} assessment calls skipped")
+        if report["score_mae"] is None:
+            print("No rows to compare.")
+        else:
+            print(f"Scores with the pre-check vs. LM-only: MAE {report['score_mae']:.3f}, "
+                  f"same side of 0.75 {report['same_side']:.0%}")
+    elif args.compare:
+        print(f"{'Path':<32} | {'Rows':>5} | {'Seconds':>7} | {'Rows/s':>7}")
+        for label, report in compare_throughput(args.input, args.workers):
+            print(f"{label:<32} | {report['scored']:>5} | {report['seconds']:>7.1f} | {report['rows_per_sec']:>7.2f}")
+    elif args.batch:
+        if args.pipeline:
+            report = score_pipelined(metric, args.input, args.output,
+                                     breakdown_workers=args.workers, assess_workers=args.workers)
+        else:
+            report = score_dataset(metric, args.input, args.output, workers=args.workers)
+        quality = report["agreement"]
+        print(f"Scored {report['scored']} rows ({report['failed']} failed) in {report['seconds']:.1f}s "
+              f"- {report['rows_per_sec']:.2f} rows/sec")
+        if quality["rows"]:
+            pearson = f"{quality['pearson']:.3f}" if quality["pearson"] is not None else "N/A"
+            print(f"Agreement with dataset score over {quality['rows']} rows: "
+                  f"MAE {quality['mae']:.3f}, same side of 0.75 {quality['threshold_agreement']:.0%}, "
+                  f"Pearson {pearson}")
+        if args.pipeline:
+            print(f"Stage time: breakdown {report['breakdown_seconds']:.1f}s, assessment {report['assess_seconds']:.1f}s, "
+                  f"breakdowns waiting on a full queue {report['handoff_wait_seconds']:.1f}s")
+        if limiter is not None:
+            print(format_stats(limiter))
+    else:
+        # load data
+        dataset = []
+        with open(args.input, 'r', encoding='utf-8') as f:
+            for line in f:
+                data = json.loads(line)
 
-# load data
-dataset = []
-with open(os.path.join(sys.path[0], 'dataset.jsonl'), 'r', encoding='utf-8') as f:
-    for line in f:
-        data = json.loads(line)
+                passage = data.get("passage", "")
+                summary = data.get("summary", "")
 
-        passage = data.get("passage", "")
-        summary = data.get("summary", "")
+                example = dspy.Example(passage=passage, summary=summary)
+                pred = dspy.Example(passage=passage, summary=summary)
+                score = data.get("score", "0")
+                dataset.append(dspy.Example(example=example, pred=pred, score=score))
 
-        example = dspy.Example(passage=passage, summary=summary)
-        pred = dspy.Example(passage=passage, summary=summary)
-        score = data.get("score", "0")
-        dataset.append(dspy.Example(example=example, pred=pred, score=score))
+        result = metric(example=dataset[0].example, pred=dataset[0].pred)
+        print('Passage 0: ', dataset[0].example.passage, '\nSummary 0: ', dataset[0].example.summary, '\nResult 0: ', result)
 
-# create evaluation program - metric
-metric = Metric()
+        result = metric(example=dataset[1].example, pred=dataset[0].pred)
+        print('Passage 1: ', dataset[1].example.passage, '\nSummary 1: ', dataset[1].example.summary, '\nResult 1: ', result)
 
-result = metric(example=dataset[0].example, pred=dataset[0].pred)
-print('Passage 0: ', dataset[0].example.passage, '\nSummary 0: ', dataset[0].example.summary, '\nResult 0: ', result)
+    if args.precheck:
+        stats = matcher.stats()
+        print(f"Lexical pre-check: {stats['ideas']} key ideas, {stats['local_share']:.0%} settled locally "
+              f"({stats['present']} present, {stats['absent']} absent), {stats['lm_calls_skipped']} LM calls skipped")
+    stats = cache.stats()
+    print(f"Key idea cache: {stats['hits']} hits, {stats['misses']} misses "
+          f"({stats['hit_rate']:.0%} hit rate, {stats['lm_calls_saved']} LM calls saved)")
 
-result = metric(example=dataset[1].example, pred=dataset[0].pred)
-print('Passage 1: ', dataset[1].example.passage, '\nSummary 1: ', dataset[1].example.summary, '\nResult 1: ', result)
\ No newline at end of file
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,23 @@
+import os
+import sys
+import pytest
+
+# The tests run offline; litellm would otherwise retry fetching its model cost map on a background thread
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'style_evaluation'), os.path.join(ROOT, 'summarize_metric')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import dspy
+
+@pytest.fixture
+def configure():
+    """
+    dspy.configure for one test. The settings are global, so worker threads
+    see them too; the LM, adapter and callbacks are restored afterwards.
+    """
+    previous = {name: dspy.settings.get(name) for name in ('lm', 'adapter', 'callbacks')}
+    yield dspy.configure
+    dspy.configure(**previous)
@@ -0,0 +1,51 @@
+import io
+
+import pytest
+
+from chunking import CHARS_PER_TOKEN, estimate_tokens, iter_chunks, iter_words, map_bounded
+
+TEXT = " ".join(f"word{i:03d}" for i in range(200))
+
+def test_iter_words_joins_words_split_across_blocks():
+    assert list(iter_words(io.StringIO(TEXT), block_size=5)) == TEXT.split()
+    assert list(iter_words("  two\n words ")) == ["two", "words"]
+
+def test_chunks_fit_the_budget_and_overlap():
+    chunks = list(iter_chunks(io.StringIO(TEXT), max_tokens=20, overlap_tokens=5))
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 20 * CHARS_PER_TOKEN for chunk in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # The next chunk starts inside the previous one
+        assert chunk.split()[0] in previous.split()[1:]
+    assert sorted({word for chunk in chunks for word in chunk.split()}) == TEXT.split()
+
+def test_text_within_the_budget_is_one_chunk():
+    assert list(iter_chunks("a short text", max_tokens=512)) == ["a short text"]
+    assert estimate_tokens("a short text") == 3
+
+def test_overlap_must_be_smaller_than_the_chunk():
+    with pytest.raises(ValueError):
+        list(iter_chunks(TEXT, max_tokens=10, overlap_tokens=10))
+
+def test_map_bounded_reports_errors_and_reads_ahead_only_a_little():
+    pulled = []
+
+    def items():
+        for i in range(100):
+            pulled.append(i)
+            yield i
+
+    def work(i):
+        if i == 3:
+            raise RuntimeError("bad item")
+        return i * 2
+
+    results = map_bounded(work, items(), workers=2)
+    first = next(results)
+    assert len(pulled) <= 2 * 2 + 1
+    results = [first] + list(results)
+
+    assert sorted(index for index, _, _ in results) == list(range(100))
+    assert {index: result for index, result, error in results if error is None}[10] == 20
+    assert [(index, str(error)) for index, _, error in results if error is not None] == [(3, "bad item")]
@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+
+import pytest
+
+from classify import (CascadeClassifier, Classifier, LexiconClassifier, RowWriter, classify_stream,
+                      evaluate_cascade, read_records)
+from fake_lm import FakeLM
+
+LINES = [
+    json.dumps({"id": 1, "sentence": "I loved it"}),
+    "{not json",
+    json.dumps(["a", "list"]),
+    json.dumps({"id": 4, "sentence": "Great value"}),
+]
+
+POSITIVE = ("Classify sentiment", {"sentiment": "positive", "confidence": 0.85})
+
+class ListWriter:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+def test_read_records_turns_unreadable_lines_into_error_records():
+    records = list(read_records(io.StringIO("\n".join(LINES) + "\n"), 'jsonl'))
+
+    assert [sentence for _, sentence in records] == ["I loved it", None, None, "Great value"]
+    assert records[1][0]['line'] == 2 and records[1][0]['error'].startswith("invalid JSON")
+    assert records[2][0] == {'line': 3, 'error': "expected a JSON object, got list"}
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_classify_stream_writes_error_rows_and_keeps_going(configure, ordered):
+    lm = FakeLM([POSITIVE])
+    configure(lm=lm)
+    out = io.StringIO()
+    stats = classify_stream(Classifier(), read_records(io.StringIO("\n".join(LINES)), 'jsonl'),
+                            RowWriter(out, 'jsonl'), workers=2, queue_size=2, ordered=ordered)
+
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert stats['lines'] == 4 and stats['errors'] == 2
+    assert lm.calls == 2
+    if ordered:
+        assert [row.get('id', row.get('line')) for row in rows] == [1, 2, 3, 4]
+    assert sorted(row['sentiment'] or '' for row in rows) == ['', '', 'positive', 'positive']
+
+def test_csv_output_keeps_error_rows_after_the_first_row(configure):
+    configure(lm=FakeLM([POSITIVE]))
+    out = io.StringIO()
+    stats = classify_stream(Classifier(), read_records(io.StringIO("\n".join(LINES)), 'jsonl'),
+                            RowWriter(out, 'csv'), workers=1, queue_size=2, ordered=True)
+
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert stats['errors'] == 2 and len(rows) == 4
+    assert rows[0]['id'] == '1' and rows[0]['sentiment'] == 'positive' and rows[0]['error'] == ''
+    assert rows[1]['id'] == '' and rows[1]['line'] == '2' and rows[1]['error'].startswith("invalid JSON")
+
+def test_only_failed_sentences_count_as_errors(configure):
+    lm = FakeLM([("Fine", {"sentiment": "neutral", "confidence": 0.5})])
+    configure(lm=lm)
+    records = [({"error": "carried over from upstream"}, "Fine weather"), ({"id": 2}, "Unknown prompt")]
+    writer = ListWriter()
+    stats = classify_stream(Classifier(), iter(records), writer, workers=2, ordered=True)
+
+    assert stats['lines'] == 2 and stats['errors'] == 1
+    assert writer.rows[0]['error'] == "carried over from upstream" and writer.rows[0]['sentiment'] == 'neutral'
+    assert writer.rows[1]['sentiment'] is None and writer.rows[1]['error']
+
+def test_classify_stream_raises_a_failing_reader_after_writing_what_it_read(configure):
+    configure(lm=FakeLM([POSITIVE]))
+
+    def records():
+        for i in range(3):
+            yield {"id": i}, f"Sentence {i}"
+        raise OSError("input went away")
+
+    writer = ListWriter()
+    with pytest.raises(OSError, match="input went away"):
+        classify_stream(Classifier(), records(), writer, workers=4, queue_size=2)
+    assert sorted(row['id'] for row in writer.rows) == [0, 1, 2]
+
+def test_lexicon_classifier_scores_a_batch_with_negation():
+    labels, confidences = LexiconClassifier().predict(
+        ["I loved it, excellent", "This was not good", "The weather on Tuesday"])
+
+    assert labels == ['positive', 'negative', 'neutral']
+    assert confidences == pytest.approx([0.8, 0.5, 0.0])
+
+def test_cascade_escalates_only_unconfident_sentences(configure):
+    lm = FakeLM([("Classify sentiment", {"sentiment": "negative", "confidence": 0.9})])
+    configure(lm=lm)
+    cascade = CascadeClassifier(threshold=0.75)
+
+    local = cascade("I loved it, excellent")
+    escalated = cascade("This was not good")
+
+    assert (local.source, local.sentiment) == ('local', 'positive')
+    assert (escalated.source, escalated.sentiment) == ('lm', 'negative')
+    assert lm.calls == 1
+    assert cascade.stats() == {'sentences': 2, 'local_answers': 1, 'escalations': 1, 'escalation_rate': 0.5}
+    assert cascade.calibration == [{
+        'sentence': "This was not good", 'local_sentiment': 'negative', 'local_confidence': 0.5,
+        'lm_sentiment': 'negative', 'lm_confidence': 0.9,
+    }]
+
+def test_cascade_in_the_stream_marks_each_row_with_its_source(configure):
+    lm = FakeLM([("Classify sentiment", {"sentiment": "neutral", "confidence": 0.6})])
+    configure(lm=lm)
+    records = [({"id": 1}, "Amazing, wonderful food"), ({"id": 2}, "The weather on Tuesday")]
+    writer = ListWriter()
+    classify_stream(CascadeClassifier(), iter(records), writer, workers=2, ordered=True)
+
+    assert [(row['source'], row['sentiment']) for row in writer.rows] == [('local', 'positive'), ('lm', 'neutral')]
+    assert lm.calls == 1
+
+def test_evaluate_cascade_sweeps_thresholds_with_one_lm_pass(configure):
+    lm = FakeLM([("Classify sentiment", {"sentiment": "neutral", "confidence": 0.6})])
+    configure(lm=lm)
+    records = [
+        ({"label": "positive"}, "Amazing, wonderful food"),
+        ({"label": "neutral"}, "The weather on Tuesday"),
+        ({"line": 3, "error": "invalid JSON"}, None),
+    ]
+    report = evaluate_cascade(CascadeClassifier(), iter(records), workers=2, thresholds=(0.0, 0.75, 1.01))
+
+    assert report['sentences'] == 2 and lm.calls == 2
+    assert report['lm_accuracy'] == 0.5
+    assert [row['escalation_rate'] for row in report['sweep']] == [0.0, 0.5, 1.0]
+    assert [row['accuracy'] for row in report['sweep']] == [1.0, 1.0, 0.5]
@@ -0,0 +1,28 @@
+import types
+
+import pytest
+
+import cli
+
+def test_importing_the_cli_loads_no_heavy_module():
+    report = cli.measure_import("cli")
+    assert report["heavy"] == [] and not report["configures_lm"] and not report["printed"]
+
+@pytest.mark.parametrize("name", list(cli.COMMANDS))
+def test_command_modules_have_no_import_time_side_effects(name):
+    module, directory, _ = cli.COMMANDS[name]
+    report = cli.measure_import(module, directory)
+    assert not report["configures_lm"] and not report["printed"]
+
+def test_main_passes_the_remaining_arguments_to_the_command(monkeypatch):
+    calls = []
+    fake = types.SimpleNamespace(run=calls.append)
+    monkeypatch.setattr(cli, "load_command", lambda name: fake if name == "classify" else None)
+    monkeypatch.setattr(cli.sys, "argv", ["cli.py"])
+
+    cli.main(["classify", "input.jsonl", "--ordered"])
+
+    assert calls == [["input.jsonl", "--ordered"]]
+
+def test_load_command_imports_modules_from_their_directory():
+    assert callable(cli.load_command("eval-summary").run)
@@ -0,0 +1,42 @@
+import pytest
+
+from cot_cascade import CascadeCoT, call_cost
+from fake_lm import FakeLM
+
+def slm_and_remote():
+    slm = FakeLM([
+        ("dice", {"reasoning": "One outcome of 36.", "answer": "0.0278"}),
+        ("train", {"reasoning": "It goes fast.", "answer": "very fast"}),
+    ])
+    remote = FakeLM([("train", {"reasoning": "120 km / 1.5 h.", "answer": "80"})])
+    return slm, remote
+
+def test_agreeing_slm_samples_are_accepted_without_the_remote_model(configure):
+    slm, remote = slm_and_remote()
+    configure(lm=slm)
+    cascade = CascadeCoT(slm, remote, samples=3)
+
+    result = cascade(question="Two dice are tossed. What is the probability that the sum equals two?")
+
+    assert result.tier == 'slm' and result.answer == pytest.approx(0.0278)
+    assert result.slm_answers == [pytest.approx(0.0278)] * 3
+    assert slm.calls == 3 and remote.calls == 0
+
+def test_an_unparseable_slm_answer_escalates_to_the_remote_model(configure):
+    slm, remote = slm_and_remote()
+    configure(lm=slm)
+    cascade = CascadeCoT(slm, remote, samples=2)
+
+    cascade(question="Two dice are tossed. What is the probability that the sum equals two?")
+    result = cascade(question="A train travels 120 km in 1.5 hours. What is its average speed in km/h?")
+
+    assert result.tier == 'remote' and result.answer == 80.0
+    assert result.slm_answers == [None, None]
+    assert remote.calls == 1
+    stats = cascade.stats()
+    assert stats['questions'] == 2 and stats['escalations'] == 1 and stats['escalation_rate'] == 0.5
+    assert stats['cost'] == pytest.approx(call_cost(remote.history[-1])) and stats['cost'] > 0
+
+def test_call_cost_prefers_the_reported_cost():
+    assert call_cost({'cost': 0.25, 'usage': {'prompt_tokens': 1_000_000}}) == 0.25
+    assert call_cost({'usage': {'prompt_tokens': 1_000_000, 'completion_tokens': 100_000}}) == pytest.approx(3.5)
@@ -0,0 +1,50 @@
+import uuid
+import asyncio
+
+import dspy
+import pytest
+
+from fake_lm import FakeLM
+
+RESPONSES = [
+    ("Classify sentiment", {"sentiment": "positive", "confidence": 0.85}),
+    ("Say Hello World!", "Hello World!"),
+]
+
+def test_fake_lm_answers_through_the_adapter(configure):
+    lm = FakeLM(RESPONSES)
+    configure(lm=lm)
+
+    result = dspy.Predict(dspy.Signature("sentence -> sentiment, confidence: float", "Classify sentiment"))(sentence="Fine")
+    assert result.sentiment == "positive" and result.confidence == 0.85
+    assert lm.calls == 1
+    assert lm.history[-1]["usage"]["total_tokens"] > 0
+
+def test_fake_lm_copies_share_the_counters():
+    lm = FakeLM(RESPONSES)
+    copy = lm.copy(temperature=0.7)
+    assert lm("Say Hello World!") == ["Hello World!"]
+    assert asyncio.run(copy.acall("Say Hello World!")) == ["Hello World!"]
+    assert lm.calls == copy.calls == 2
+    assert len(lm.history) == 1 and len(copy.history) == 1
+
+    lm.reset()
+    assert copy.calls == 0 and lm.history == []
+
+def test_fake_lm_caches_only_when_asked():
+    # dspy's cache persists across runs, so the prompt is new each time
+    prompt = f"Say Hello World! ({uuid.uuid4()})"
+    cached = FakeLM(RESPONSES, model="fake/cached", cache=True)
+    for _ in range(2):
+        cached(prompt)
+    assert cached.calls == 1
+
+    uncached = FakeLM(RESPONSES, model="fake/uncached")
+    for _ in range(2):
+        uncached("Say Hello World!")
+    assert uncached.calls == 2
+
+def test_fake_lm_rejects_unknown_prompts():
+    lm = FakeLM(RESPONSES)
+    with pytest.raises(Exception, match="no canned response"):
+        lm("Something else")
@@ -0,0 +1,39 @@
+from fake_lm import FakeLM
+from followuptask import dedupe_tasks, map_reduce, parse_tasks
+
+MAP_REPLY = "1. Fix the supply chain delays in the northeast.\n2. Replace the three team members who resigned."
+REDUCE_REPLY = "1. Replace the team members who resigned.\n2. Fix the supply chain delays."
+
+def test_parse_tasks_drops_bullets_numbering_and_none():
+    assert parse_tasks("1. Call Ann.\n- Email Bob\n* NONE\n\n2) Ship it") == ["Call Ann.", "Email Bob", "Ship it"]
+    assert parse_tasks("NONE.") == []
+
+def test_dedupe_tasks_merges_near_duplicates_and_counts_support():
+    ranked = dedupe_tasks(["Email the team", "Fix the build", "fix the build.", "Fix the  build"])
+    assert ranked == [("Fix the build", 3), ("Email the team", 1)]
+
+def test_map_reduce_asks_each_chunk_then_merges_the_candidates():
+    lm = FakeLM([("excerpt", MAP_REPLY), ("candidate follow up tasks", REDUCE_REPLY)])
+    text = " ".join(["Supply chain delays hit the northeast and three people resigned."] * 60)
+
+    report = map_reduce(lm, text, k=1, chunk_tokens=64, workers=3)
+
+    assert report['chunks'] > 1 and report['failed'] == 0
+    assert report['candidates'] == 2 * report['chunks']
+    assert report['reduce_calls'] == 1 and lm.calls == report['chunks'] + 1
+    assert report['tasks'] == ["Replace the team members who resigned."]
+
+def test_a_failed_chunk_is_reported_on_stderr_and_skipped(capsys):
+    fake = FakeLM([("excerpt", MAP_REPLY)])
+
+    def lm(messages, **kwargs):
+        if "BROKEN" in messages[0]["content"]:
+            raise RuntimeError("chunk too weird")
+        return fake(messages=messages, **kwargs)
+
+    report = map_reduce(lm, "BROKEN " + " ".join(["filler"] * 400), k=2, chunk_tokens=64)
+
+    assert report['failed'] == 1 and report['chunks'] > 1
+    assert report['tasks'] == parse_tasks(MAP_REPLY)
+    captured = capsys.readouterr()
+    assert "Chunk 0 failed: chunk too weird" in captured.err and captured.out == ""
@@ -0,0 +1,44 @@
+import dspy
+
+from fake_lm import FakeLM
+from infoextraction import ChunkedExtractor, ExtractionMerger
+
+def prediction(title="", headings=(), entities=()):
+    return dspy.Prediction(title=title, headings=list(headings), entities=list(entities))
+
+def test_merger_deduplicates_by_normalized_name_in_document_order():
+    merger = ExtractionMerger()
+    # Chunks finish out of order
+    merger.add(1, prediction("Energy Storage", ["Results"], [{"name": "Google's team", "type": "org"},
+                                                             {"name": "Tesla", "role": "partner"}]))
+    merger.add(0, prediction("Energy storage", ["Introduction", "results"], [{"name": "TESLA", "type": "org"}]))
+    merger.add(2, prediction("Other", [], ["not a dict", {"name": "google team"}]))
+
+    result = merger.result()
+    assert result.title == "Energy storage"
+    assert result.headings == ["Introduction", "results"]
+    assert result.entities == [{"name": "TESLA", "type": "org", "role": "partner"},
+                               {"name": "Google's team", "type": "org"}]
+
+def test_title_is_the_most_proposed_one():
+    merger = ExtractionMerger()
+    merger.add(0, prediction("Intro"))
+    merger.add(1, prediction("Main Title"))
+    merger.add(2, prediction("main title"))
+    assert merger.result().title == "Main Title"
+
+def test_chunked_extractor_merges_chunks_and_counts_failures(configure, capsys):
+    lm = FakeLM([
+        ("BROKEN", "not the expected format"),
+        ("Extract structured information", {
+            "title": "Storage", "headings": ["Batteries"], "entities": [{"name": "Sarah Chen", "type": "person"}]}),
+    ])
+    configure(lm=lm)
+    text = " ".join(["Sarah Chen studies batteries."] * 40 + ["BROKEN"] + ["filler"] * 200)
+
+    result, stats = ChunkedExtractor(max_tokens=64, overlap_tokens=8, workers=3)(text)
+
+    assert stats["chunks"] > 2 and stats["failed"] >= 1
+    assert result.title == "Storage" and result.headings == ["Batteries"]
+    assert result.entities == [{"name": "Sarah Chen", "type": "person"}]
+    assert "failed" in capsys.readouterr().err
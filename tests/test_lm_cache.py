@@ -0,0 +1,50 @@
+from fake_lm import FakeLM
+from lm_cache import CachedLM, ResponseCache
+
+RESPONSE = ["x" * 100]
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    size = len('["' + RESPONSE[0] + '"]')
+    cache = ResponseCache(str(tmp_path / "responses.db"), max_bytes=2 * size)
+    first, second, third = (cache.key("fake/lm", [{"role": "user", "content": text}], {})
+                            for text in ("one", "two", "three"))
+    cache.put(first, "fake/lm", RESPONSE, 0.5)
+    cache.put(second, "fake/lm", RESPONSE, 0.5)
+    assert cache.get(first) == RESPONSE
+
+    cache.put(third, "fake/lm", RESPONSE, 0.5)
+    assert cache.get(second) is None
+    assert cache.get(first) == RESPONSE and cache.get(third) == RESPONSE
+    assert cache.saved_seconds == 1.5
+
+def test_response_cache_expires_old_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.db"))
+    key = cache.key("fake/lm", [{"role": "user", "content": "one"}], {})
+    cache.put(key, "fake/lm", RESPONSE, 0.5)
+    cache.ttl = 0
+    assert cache.get(key) is None
+
+def test_cached_lm_bypasses_sampled_requests_unless_allowed(tmp_path):
+    lm = FakeLM([("hello", "Hi")])
+    cache = ResponseCache(str(tmp_path / "responses.db"))
+
+    sampled = CachedLM(lm, cache)
+    for _ in range(2):
+        assert sampled("hello", temperature=0.7) == ["Hi"]
+    assert lm.calls == 2 and cache.skipped == 2 and cache.hits == 0
+
+    allowed = CachedLM(lm, cache, allow_nondeterministic=True)
+    for _ in range(2):
+        assert allowed("hello", temperature=0.7) == ["Hi"]
+    assert lm.calls == 3 and cache.hits == 1
+
+    for _ in range(2):
+        assert sampled("hello") == ["Hi"]
+    assert lm.calls == 4 and cache.hits == 2 and cache.skipped == 2
+
+def test_cosmetically_different_messages_share_a_key(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.db"))
+    key = cache.key("fake/lm", [{"role": "User", "content": "  hello\n  world "}], {"temperature": 0})
+    assert key == cache.key("fake/lm", [{"role": "user", "content": "hello world"}], {"temperature": 0})
+    assert key != cache.key("fake/lm", [{"role": "user", "content": "hello world"}], {"temperature": 0.5})
+    assert key != cache.key("other/lm", [{"role": "user", "content": "hello world"}], {"temperature": 0})
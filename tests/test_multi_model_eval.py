@@ -0,0 +1,57 @@
+import pytest
+
+import multi_model_eval
+from fake_lm import FakeLM
+from rate_limit import ProviderLimits
+from results_store import ResultsStore
+
+EXAMPLES = [{"question": f"Question {i}?", "style": style} for i, style in enumerate(["formal", "casual", "neutral"])]
+
+RESPONSES = [
+    ("produce the fields `answer`", {"reasoning": "Short.", "answer": "Four words are enough"}),
+    ("Evaluate if each answer matches its requested style",
+     {"style_matches": [True, True, True], "confidences": [0.9, 0.9, 0.9]}),
+]
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    lms = {}
+
+    def make_lm(model):
+        lms[model] = FakeLM(RESPONSES, latency=0.01, model=model)
+        return lms[model]
+
+    monkeypatch.setattr(multi_model_eval, "make_lm", make_lm)
+    monkeypatch.setattr(multi_model_eval, "examples", EXAMPLES)
+    return lms
+
+def test_parse_limit_reads_concurrency_and_optional_rpm():
+    assert multi_model_eval.parse_limit("openai=16:1000") == ("openai", (16, 1000.0))
+    assert multi_model_eval.parse_limit("ollama_chat=2") == ("ollama_chat", (2, None))
+
+def test_run_models_evaluates_each_model_under_its_providers_limit(fake_models, tmp_path, configure):
+    configure(lm=None)
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    limits = ProviderLimits({"openai": (2, None), "anthropic": (1, None)})
+    models = ["openai/a", "openai/b", "anthropic/c"]
+
+    reports = multi_model_eval.run_models(models, store=store, limits=limits)
+
+    assert sorted(report['model'] for report in reports) == sorted(models)
+    assert all(report['examples'] == 3 and report['lm_calls'] >= 3 for report in reports)
+    assert limits.limiters["openai"].requests == fake_models["openai/a"].calls + fake_models["openai/b"].calls
+    assert limits.limiters["anthropic"].requests == fake_models["anthropic/c"].calls
+    assert limits.limiters["openai"].max_concurrency == 2
+    run_hash = multi_model_eval.prompt_hash(multi_model_eval.JUDGE_BATCH_SIZE)
+    assert all(store.missing(EXAMPLES, model, model, run_hash) == [] for model in models)
+
+def test_stored_models_are_skipped_on_a_rerun(fake_models, tmp_path, configure):
+    configure(lm=None)
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    multi_model_eval.run_models(["openai/a"], store=store)
+    fake_models.clear()
+
+    reports = multi_model_eval.run_models(["openai/a"], store=store)
+
+    assert reports == [{'model': "openai/a", 'rows': [], 'examples': 0, 'seconds': 0.0, 'lm_calls': 0}]
+    assert fake_models == {}
@@ -0,0 +1,74 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import dspy
+import pytest
+from dspy.utils.exceptions import LMRateLimitError
+
+from rate_limit import AdaptiveLimiter, TokenBucket, classify_error, rate_limited
+from stub_server import StubConfig, start_stub_server
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**config):
+        server = start_stub_server(StubConfig(**config))
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def stub_lm(server, limiter):
+    lm = dspy.LM("openai/stub", api_base=f"http://127.0.0.1:{server.server_address[1]}/v1",
+                 api_key="stub", cache=False)
+    return rate_limited(lm, limiter)
+
+def test_token_bucket_makes_callers_wait_off_their_debt():
+    bucket = TokenBucket(per_minute=600, burst=2)
+    assert bucket.reserve() == 0.0 and bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    # A request larger than the bucket drains it rather than waiting forever
+    assert bucket.reserve(100) == pytest.approx(0.3, abs=0.01)
+
+def test_backoff_honours_retry_after():
+    limiter = AdaptiveLimiter("openai", max_concurrency=4, initial=4)
+    error = LMRateLimitError("slow down", status=429, retry_after=0.2)
+
+    assert classify_error(error) == "rate_limited"
+    delays = [limiter._backoff(error, attempt) for attempt in range(3)]
+    assert all(0.2 <= delay <= 0.24 for delay in delays)
+    assert limiter.retries == 3
+    assert limiter.backoff_seconds == pytest.approx(sum(delays))
+
+def test_rate_limited_calls_back_off_and_cut_the_limit(stub):
+    server = stub(latency=0.1, capacity=1, retry_after=0.2)
+    limiter = AdaptiveLimiter("openai", max_concurrency=4, initial=4, max_retries=10)
+    lm = stub_lm(server, limiter)
+    assert lm.num_retries == 0
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        replies = list(pool.map(lambda i: lm(f"Request {i}"), range(4)))
+
+    assert replies == [["Hello World!"]] * 4
+    with server.state.lock:
+        assert server.state.rate_limited > 0
+    assert limiter.successes == 4
+    assert limiter.rate_limited > 0 and limiter.retries == limiter.rate_limited
+    assert limiter.decreases >= 1 and limiter.limit < 4
+    assert limiter.backoff_seconds >= 0.2 * limiter.retries
+    assert limiter.failures == 0
+
+def test_async_calls_give_up_after_max_retries(stub):
+    server = stub(latency=0.0, error_rate=1.0, retry_after=0.05)
+    limiter = AdaptiveLimiter("openai", max_concurrency=4, initial=4, max_retries=2)
+    lm = stub_lm(server, limiter)
+
+    with pytest.raises(Exception) as raised:
+        asyncio.run(lm.acall("Request"))
+    assert classify_error(raised.value) == "rate_limited"
+    assert limiter.rate_limited == 3 and limiter.retries == 2
+    assert limiter.failures == 1 and limiter.successes == 0
@@ -0,0 +1,57 @@
+from fake_lm import FakeLM
+from fingerprint import signature_fingerprint
+from results_store import ResultsStore, example_id
+from style_evaluation_metric import StyleEvaluation, evaluate_examples, prompt_hash, result_rows
+
+EXAMPLES = [{"question": f"Question {i}?", "style": style} for i, style in enumerate(["formal", "casual", "neutral"])]
+
+def row(example, score=1.0, length=5):
+    return {**example, "answer": "An answer", "style_score": score, "length": length}
+
+def test_missing_returns_only_examples_without_a_row_for_the_key(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    store.put("openai/a", "openai/a", "hash1", [row(EXAMPLES[0]), row(EXAMPLES[2])])
+
+    assert store.missing(EXAMPLES, "openai/a", "openai/a", "hash1") == [EXAMPLES[1]]
+    assert store.missing(EXAMPLES, "openai/a", "openai/a", "hash2") == EXAMPLES
+    assert store.missing(EXAMPLES, "openai/a", "openai/judge", "hash1") == EXAMPLES
+    stored = store.get("openai/a", "openai/a", "hash1")
+    assert stored[example_id("Question 0?", "formal")]["style_score"] == 1.0
+
+def test_compare_lines_up_each_models_latest_run(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    store.put("openai/a", "openai/a", "old", [row(EXAMPLES[0], score=0.0)])
+    store.put("openai/a", "openai/a", "new", [row(EXAMPLES[0], score=1.0)])
+    store.put("openai/b", "openai/b", "new", [row(EXAMPLES[0], score=0.5), row(EXAMPLES[1], score=0.7)])
+
+    examples, models = store.compare(["openai/a", "openai/b", "openai/c"])
+
+    assert models == ["openai/a", "openai/b", "openai/c"]
+    assert [(e["question"], sorted(e["cells"])) for e in examples] == [
+        ("Question 0?", ["openai/a", "openai/b"]), ("Question 1?", ["openai/b"])]
+    assert examples[0]["cells"]["openai/a"]["style_score"] == 1.0
+    assert {run["prompt_hash"] for run in store.runs()} == {"old", "new"}
+
+def test_the_prompt_hash_follows_the_signatures():
+    assert prompt_hash(1) != prompt_hash(4)
+    assert prompt_hash(4) == prompt_hash(4)
+    changed = StyleEvaluation.with_instructions("Evaluate the style strictly.")
+    assert signature_fingerprint(changed) != signature_fingerprint(StyleEvaluation)
+
+def test_evaluated_rows_are_stored_and_not_recomputed(configure, tmp_path):
+    lm = FakeLM([
+        ("produce the fields `answer`", {"reasoning": "Short.", "answer": "Four words are enough"}),
+        ("Evaluate if answer matches requested style", {"style_match": True, "confidence": 0.9}),
+    ])
+    configure(lm=lm)
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    run_hash = prompt_hash(1)
+
+    todo = store.missing(EXAMPLES[:2], "fake/lm", "fake/lm", run_hash)
+    evaluator, _ = evaluate_examples(todo, lm, judge_batch_size=1, display_progress=False)
+    store.put("fake/lm", "fake/lm", run_hash, result_rows(evaluator))
+
+    assert store.missing(EXAMPLES, "fake/lm", "fake/lm", run_hash) == [EXAMPLES[2]]
+    stored = store.get("fake/lm", "fake/lm", run_hash)
+    assert {r["length"] for r in stored.values()} == {4}
+    assert all(r["style_score"] > 0 for r in stored.values())
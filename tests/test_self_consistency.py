@@ -0,0 +1,36 @@
+import pytest
+
+from fake_lm import FakeLM
+from self_consistency import SelfConsistentCoT, compare_voting
+
+def math_lm(answer="0.0278"):
+    return FakeLM([("question", {"reasoning": "One outcome of 36.", "answer": answer})], latency=0.01)
+
+QUESTION = "Two dice are tossed. What is the probability that the sum equals two?"
+
+def test_voting_stops_once_enough_samples_agree():
+    lm = math_lm()
+    result = SelfConsistentCoT(lm, samples=5, agree=3, concurrency=1)(question=QUESTION)
+
+    assert result.answer == pytest.approx(0.0278) and result.agreed
+    assert result.samples_used == result.launched == 3 and result.cancelled == 0
+    assert list(result.votes.values()) == [3]
+    assert lm.calls == 3
+
+def test_in_flight_samples_are_cancelled_when_the_vote_is_settled():
+    result = SelfConsistentCoT(math_lm(), samples=9, agree=2, concurrency=4)(question=QUESTION)
+
+    assert result.agreed and 2 <= result.samples_used < 9
+    assert result.launched == result.samples_used + result.cancelled
+
+def test_voting_gives_up_when_no_answer_can_reach_agreement():
+    lm = math_lm(answer="many")
+    with pytest.raises(ValueError, match="none of the 3 samples"):
+        SelfConsistentCoT(lm, samples=5, agree=3, concurrency=1)(question=QUESTION)
+
+def test_fixed_k_voting_uses_every_sample():
+    reports = compare_voting(math_lm(), [QUESTION], samples=5, agree=3, concurrency=1)
+
+    assert reports["early stop"]["mean_samples"] == 3
+    assert reports["fixed k"]["mean_samples"] == 5
+    assert reports["early stop"]["answers"] == reports["fixed k"]["answers"]
@@ -0,0 +1,39 @@
+import pytest
+
+from slm_client import WarmupClient, get_slm_lm, measure_cold_warm
+from stub_server import StubConfig, start_stub_server
+
+@pytest.fixture
+def stub():
+    server = start_stub_server(StubConfig(load_delay=0.2, token_delay=0.0))
+    yield server
+    server.shutdown()
+    # Refuse, rather than queue, litellm's late /api/show lookups
+    server.server_close()
+
+def api_base(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def test_get_slm_lm_preloads_once_and_keeps_the_model_resident(stub):
+    lm = get_slm_lm(api_base=api_base(stub), max_tokens=100)
+    assert stub.state.loads == 1
+    assert get_slm_lm(api_base=api_base(stub), max_tokens=100) is lm
+
+    assert lm("Say Hello World!", cache=False) == ["Hello World!"]
+    # The LM's requests carry keep_alive, so the preloaded model is not loaded again
+    assert stub.state.loads == 1
+
+def test_get_slm_lm_falls_back_when_the_preload_fails(capsys):
+    lm = get_slm_lm(api_base="http://127.0.0.1:9", max_tokens=101)
+    assert lm.model == "ollama_chat/llama3.2"
+    assert "Could not preload llama3.2" in capsys.readouterr().out
+
+def test_measure_cold_warm_reuses_one_connection(stub):
+    client = WarmupClient(api_base(stub))
+    report = measure_cold_warm(client, warm_runs=3)
+    client.close()
+
+    assert report["cold_ttft"] >= 0.2 > report["warm_ttft"]
+    assert report["connections_opened"] == 1
+    # The cold request loaded the model; the preload after it found it resident
+    assert stub.state.loads == 1
@@ -0,0 +1,57 @@
+import dspy
+import pytest
+
+from fake_lm import FakeLM
+from streaming import StreamStats, stream_lm, stream_predict
+from stub_server import StubConfig, start_stub_server
+
+MESSAGES = [{"role": "user", "content": "Say Hello World!"}]
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**config):
+        server = start_stub_server(StubConfig(**config))
+        servers.append(server)
+        return dspy.LM("openai/stub", api_base=f"http://127.0.0.1:{server.server_address[1]}/v1",
+                       api_key="stub", cache=False)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_stream_lm_yields_chunks_and_measures_ttft(stub):
+    lm = stub(latency=0.05, token_delay=0.01)
+    stream = stream_lm(lm, MESSAGES)
+    assert stream.stats.chunks == 0
+
+    assert list(stream) == ["Hello ", "World!"]
+    assert stream.text == "Hello World!" and stream.stats.chunks == 2
+    assert 0.05 <= stream.stats.ttft < stream.stats.total
+    assert stream.stats.inter_token(50) > 0
+    # The streamed call is a regular LM call, recorded in the history
+    assert len(lm.history) == 1
+
+def test_a_reply_without_chunks_arrives_whole():
+    stream = stream_lm(FakeLM([("Say", "Hello there")]), MESSAGES)
+    assert list(stream) == ["Hello there"] and stream.stats.chunks == 1
+
+def test_stream_predict_streams_field_contents_without_markers(stub):
+    lm = stub(reply="[[ ## reasoning ## ]]\nThirty six outcomes.\n\n[[ ## answer ## ]]\n0.0278\n\n[[ ## completed ## ]]",
+              latency=0.0, token_delay=0.005)
+    chunks = []
+
+    prediction, stats = stream_predict(dspy.ChainOfThought("question -> answer: float"), lm,
+                                       on_chunk=chunks.append, question="Two dice are tossed...")
+
+    assert prediction.answer == pytest.approx(0.0278)
+    assert "".join(chunks) == "Thirty six outcomes.\n0.0278"
+    assert stats.chunks == len(chunks) - 1
+
+def test_inter_token_percentiles_of_the_gaps():
+    stats = StreamStats()
+    stats.gaps = [0.01, 0.03, 0.02]
+    assert stats.inter_token(50) == 0.02
+    assert StreamStats().inter_token(95) == 0.0
@@ -0,0 +1,73 @@
+import json
+from typing import Literal
+
+import dspy
+import pytest
+
+from fake_lm import FakeLM
+from structured_output import (InstrumentedChatAdapter, JSONModeAdapter, format_parse_stats, has_open_mapping,
+                               output_schema)
+
+class Classify(dspy.Signature):
+    """Classify sentiment of a given sentence."""
+    sentence: str = dspy.InputField()
+    sentiment: Literal['positive', 'negative', 'neutral'] = dspy.OutputField()
+    confidence: float = dspy.OutputField()
+
+def classify(adapter, lm, configure):
+    configure(lm=lm, adapter=adapter)
+    return dspy.Predict(Classify)(sentence="I loved it")
+
+def test_output_schema_requires_every_output_field():
+    schema = output_schema(Classify)
+    assert schema["required"] == ["sentiment", "confidence"] and schema["additionalProperties"] is False
+    assert schema["properties"]["sentiment"]["enum"] == ["positive", "negative", "neutral"]
+    assert has_open_mapping(list[dict[str, str]]) and not has_open_mapping(list[str])
+
+def test_a_valid_reply_parses_strictly(configure):
+    adapter = JSONModeAdapter()
+    result = classify(adapter, FakeLM([("Classify", '{"sentiment": "positive", "confidence": 0.85}')]), configure)
+
+    assert (result.sentiment, result.confidence) == ("positive", 0.85)
+    stats = adapter.stats["Classify"]
+    assert (stats.completions, stats.parse_failures, stats.repairs, stats.reasks) == (1, 0, 0, 0)
+
+def test_a_near_miss_is_repaired_without_asking_again(configure):
+    adapter = JSONModeAdapter()
+    lm = FakeLM([("Classify", '```json\n{"Sentiment": "Positive.", "confidence": "85%",}\n```')])
+    result = classify(adapter, lm, configure)
+
+    assert (result.sentiment, result.confidence) == ("positive", 0.85)
+    assert lm.calls == 1
+    stats = adapter.stats["Classify"]
+    assert (stats.parse_failures, stats.repairs, stats.reasks) == (1, 1, 0)
+
+def test_an_unusable_reply_is_asked_again_with_the_error(configure):
+    adapter = JSONModeAdapter(max_reasks=1)
+    lm = FakeLM([
+        ("Reply again with only a JSON object", json.dumps({"sentiment": "negative", "confidence": 0.6})),
+        ("Classify", '{"sentiment": "furious"}'),
+    ])
+    result = classify(adapter, lm, configure)
+
+    assert result.sentiment == "negative" and lm.calls == 2
+    reask = lm.history[-1]["messages"]
+    assert reask[-2]["content"] == '{"sentiment": "furious"}' and "`sentiment`" in reask[-1]["content"]
+    stats = adapter.stats["Classify"]
+    assert (stats.calls, stats.completions, stats.reasks, stats.errors, stats.wasted_calls) == (1, 2, 1, 0, 1)
+
+def test_the_error_is_raised_once_the_reasks_are_used_up(configure):
+    adapter = JSONModeAdapter(max_reasks=1)
+    with pytest.raises(Exception):
+        classify(adapter, FakeLM([("Classify", "no idea")]), configure)
+    assert adapter.stats["Classify"].errors == 1 and adapter.stats["Classify"].reasks == 1
+
+def test_chat_adapter_counts_its_json_fallback(configure):
+    adapter = InstrumentedChatAdapter()
+    lm = FakeLM([("JSON", '{"sentiment": "positive", "confidence": 0.9}'), ("Classify", "positive, I think")])
+    assert classify(adapter, lm, configure).sentiment == "positive"
+
+    stats = adapter.stats["Classify"]
+    assert (stats.calls, stats.completions, stats.parse_failures) == (1, 2, 1)
+    assert format_parse_stats(adapter) == ("Classify: 1 predictions, 2 LM completions (1 wasted), 50% parse failures, "
+                                           "0 repaired locally, 0 re-asks, 0 errors")
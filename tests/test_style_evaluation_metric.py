@@ -0,0 +1,96 @@
+import uuid
+
+import dspy
+
+from fake_lm import FakeLM
+from style_evaluation_metric import (FAILURE_SCORE, BatchStyleJudge, MultiMetricEvaluate, StylePredictor,
+                                     evaluate_examples, length_metric, per_example_tokens, style_metric)
+
+ANSWER = {"reasoning": "Keep it short.", "answer": "Machine learning fits models to data"}
+JUDGMENT = {"style_match": True, "confidence": 0.9}
+
+STYLE_RESPONSES = [
+    ("produce the fields `answer`", ANSWER),
+    ("Evaluate if answer matches requested style", JUDGMENT),
+]
+
+def devset(n):
+    styles = ["formal", "casual", "neutral"]
+    return [dspy.Example(question=f"Question {i}?", style=styles[i % 3]).with_inputs("question", "style")
+            for i in range(n)]
+
+def answer_calls(lm):
+    return sum("produce the fields `answer`" in str(entry["messages"]) for entry in lm.history)
+
+def test_multi_metric_evaluate_generates_each_answer_once(configure):
+    lm = FakeLM(STYLE_RESPONSES)
+    configure(lm=lm)
+    evaluator = MultiMetricEvaluate(devset(4), metrics={'style_score': style_metric, 'length': length_metric},
+                                    primary='style_score', display_progress=False)
+
+    averages = evaluator(StylePredictor())
+    # One answer and one judgment per example
+    assert lm.calls == 8 and answer_calls(lm) == 4
+    assert averages == {'style_score': 0.9, 'length': 6}
+    assert len(evaluator.results) == 4
+    assert evaluator.results[("Question 0?", "formal")]['scores'] == {'style_score': 0.9, 'length': 6}
+
+def test_multi_metric_evaluate_scores_batch_metrics_after_the_pass(configure):
+    lm = FakeLM(STYLE_RESPONSES)
+    configure(lm=lm)
+    batches = []
+
+    def batch_length(examples, predictions):
+        batches.append(len(examples))
+        return [len(prediction.answer) for prediction in predictions]
+
+    evaluator = MultiMetricEvaluate(devset(3), metrics={'length': length_metric},
+                                    batch_metrics={'chars': batch_length}, primary='chars', display_progress=False)
+    averages = evaluator(StylePredictor())
+    assert batches == [3]
+    assert averages == {'length': 6, 'chars': len(ANSWER["answer"])}
+    assert lm.calls == 3
+
+BATCH_RESPONSES = [
+    ("Evaluate if each answer matches", {"style_matches": [True, False], "confidences": [0.8, 0.9]}),
+] + STYLE_RESPONSES
+
+def answered(n):
+    return devset(n), [dspy.Prediction(answer=f"Answer {i}") for i in range(n)]
+
+def test_batch_judge_scores_a_batch_per_call():
+    lm = FakeLM(BATCH_RESPONSES)
+    judge = BatchStyleJudge(batch_size=2, lm=lm)
+
+    assert judge(*answered(4)) == [0.8, 0.2, 0.8, 0.2]
+    report = judge.report()
+    assert report["calls"] == lm.calls == 2 and report["calls_saved"] == 2
+    assert report["tokens"] > 0 and report["tokens_saved"] is None
+    assert judge.report(per_example_tokens=report["tokens"] * 3)["tokens_saved"] == report["tokens"] * 2
+
+def test_batch_judge_falls_back_to_per_item_calls():
+    # Three judgments for a batch of two: the batch is judged again item by item
+    lm = FakeLM([("Evaluate if each answer matches", {"style_matches": [True] * 3, "confidences": [0.5] * 3})]
+                + STYLE_RESPONSES)
+    judge = BatchStyleJudge(batch_size=2, lm=lm)
+
+    assert judge(*answered(2)) == [0.9, 0.9]
+    report = judge.report()
+    assert report["failed_batches"] == 1 and report["fallback_calls"] == 2 and report["failed_items"] == 0
+    assert report["per_example_tokens"] is not None
+
+def test_batch_judge_scores_an_unjudgeable_item_as_a_failure():
+    lm = FakeLM([("Evaluate if each answer matches", "nonsense"), ("Answer 1", "nonsense")] + STYLE_RESPONSES)
+    judge = BatchStyleJudge(batch_size=2, lm=lm)
+
+    assert judge(*answered(2)) == [0.9, FAILURE_SCORE]
+    assert judge.report()["failed_items"] == 1
+
+def test_per_example_tokens_are_measured_without_the_cache(configure):
+    # A shared dspy cache would answer the second measurement for free
+    lm = FakeLM(STYLE_RESPONSES, model="fake/judge", cache=True)
+    configure(lm=lm)
+    evaluator, judge = evaluate_examples([{"question": f"Why {uuid.uuid4()}?", "style": "formal"}], lm,
+                                         judge_batch_size=2, display_progress=False)
+    first = per_example_tokens(judge, evaluator)
+    assert first > 0 and per_example_tokens(judge, evaluator) == first
@@ -0,0 +1,180 @@
+import os
+import json
+
+import dspy
+import pytest
+
+from fake_lm import FakeLM
+from summarization_metric import (Breakdown, KeyIdeaCache, LexicalMatcher, Metric, agreement, load_checkpoint,
+                                  score_dataset, score_pipelined, split_key_ideas, weighted_scores)
+
+PASSAGE = "The river flooded the town in spring. Volunteers rebuilt the bridge within a month."
+
+BREAKDOWN = {
+    "reasoning": "Two events.",
+    "key_ideas": "1. The river flooded the town in spring. High.\n2. Volunteers rebuilt the bridge. Medium.",
+    "importance_grades": ["High", "Medium"],
+}
+
+METRIC_RESPONSES = [
+    ("break down the passage into key ideas", BREAKDOWN),
+    ("Compare a system generated summary", {"reasoning": "Only the flood.", "binary_scores": [True, False],
+                                            "overall_score": 0.5}),
+]
+
+def score(metric, summary, passage=PASSAGE):
+    return metric(example=dspy.Example(passage=passage), pred=dspy.Example(summary=summary))
+
+def test_key_idea_cache_evicts_least_recently_used(tmp_path):
+    value = {"key_ideas": "1. An idea", "importance_grades": ["High"]}
+    probe = KeyIdeaCache(str(tmp_path / "probe"))
+    probe.put("probe", value)
+    size = probe.total_bytes
+
+    cache = KeyIdeaCache(str(tmp_path / "cache"), max_bytes=2 * size)
+    first, second, third = (cache.key(passage, "fake/lm", Breakdown) for passage in ("one", "two", "three"))
+    cache.put(first, value)
+    cache.put(second, value)
+    # File times are coarse on some filesystems, so age the entries explicitly
+    os.utime(cache._path(first), (1_000, 1_000))
+    os.utime(cache._path(second), (2_000, 2_000))
+    assert cache.get(first) == value
+
+    cache.put(third, value)
+    assert cache.evictions == 1
+    assert cache.get(second) is None
+    assert cache.get(first) == value and cache.get(third) == value
+    assert cache.total_bytes == 2 * size
+
+def test_key_idea_cache_keys_on_passage_model_and_signature(tmp_path):
+    cache = KeyIdeaCache(str(tmp_path))
+    key = cache.key("one", "fake/lm", Breakdown)
+    assert key == cache.key("one", "fake/lm", Breakdown)
+    assert key != cache.key("two", "fake/lm", Breakdown)
+    assert key != cache.key("one", "other/lm", Breakdown)
+
+    class Reworded(Breakdown):
+        """Break the passage down into its key ideas."""
+
+    assert key != cache.key("one", "fake/lm", Reworded)
+
+def test_metric_breaks_a_passage_down_once(tmp_path, configure):
+    lm = FakeLM(METRIC_RESPONSES)
+    configure(lm=lm)
+    cache = KeyIdeaCache(str(tmp_path))
+    metric = Metric(cache=cache)
+
+    assert score(metric, "The town flooded.") == score(metric, "A bridge was rebuilt.")
+    # One breakdown and two assessments
+    assert lm.calls == 3
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    # A fresh cache object over the same directory reuses the entry too
+    assert Metric(cache=KeyIdeaCache(str(tmp_path))).break_down(PASSAGE)[1] == ["High", "Medium"]
+    assert lm.calls == 3
+
+def write_dataset(path, passages):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, passage in enumerate(passages):
+            f.write(json.dumps({"passage": passage, "summary": f"Summary {i}.", "score": "0.5"}) + "\n")
+
+def test_score_dataset_checkpoints_and_resumes(tmp_path, configure):
+    # A passage the LM answers with nonsense fails its row, which is left for the next run
+    lm = FakeLM([("BROKEN", "nonsense")] + METRIC_RESPONSES)
+    configure(lm=lm)
+    dataset, output = tmp_path / "dataset.jsonl", tmp_path / "scores.jsonl"
+    write_dataset(dataset, [PASSAGE, "BROKEN passage.", PASSAGE, PASSAGE])
+
+    report = score_dataset(Metric(), str(dataset), str(output), workers=2)
+    assert report["scored"] == 3 and report["failed"] == 1
+    assert report["agreement"]["rows"] == 3
+    assert sorted(json.loads(line)["row"] for line in output.read_text().splitlines()) == [0, 2, 3]
+
+    calls = lm.calls
+    report = score_dataset(Metric(), str(dataset), str(output), workers=2)
+    assert report["scored"] == 0 and report["failed"] == 1
+    assert report["agreement"]["rows"] == 3
+    # Only the failed row was tried again
+    assert lm.calls - calls == 2
+
+def test_load_checkpoint_truncates_a_torn_last_line(tmp_path):
+    output = tmp_path / "scores.jsonl"
+    good = json.dumps({"row": 0, "score": 1.0, "reference": 1.0, "seconds": 0.1}) + "\n"
+    output.write_text(good + '{"row": 1, "sco')
+
+    assert list(load_checkpoint(str(output))) == [0]
+    assert output.read_text() == good
+
+def test_agreement_against_reference_scores():
+    records = [{"score": 0.9, "reference": 1.0}, {"score": 0.2, "reference": 0.0}, {"score": 0.8, "reference": 0.5}]
+    report = agreement(records)
+    assert report["rows"] == 3
+    assert report["mae"] == pytest.approx(0.2)
+    assert report["threshold_agreement"] == pytest.approx(2 / 3)
+    assert report["pearson"] > 0.9
+    assert agreement([])["mae"] is None
+
+def test_weighted_scores_weigh_key_ideas_by_importance():
+    scores = weighted_scores(
+        [["High", "Medium", "Low"], ["High", "High"], ["High"], []],
+        [[True, False, True], [True], "not a list", []],
+        [0.0, 0.0, 0.3, 0.4],
+    )
+    # A missing binary score counts as a missing idea; unusable rows fall back to the overall score
+    assert scores.tolist() == pytest.approx([1.2 / 1.9, 0.5, 0.3, 0.4])
+
+def test_pipelined_scoring_matches_row_by_row_scoring_and_resumes(tmp_path, configure):
+    lm = FakeLM([("BROKEN", "nonsense")] + METRIC_RESPONSES)
+    configure(lm=lm)
+    dataset = tmp_path / "dataset.jsonl"
+    write_dataset(dataset, [PASSAGE, "BROKEN passage.", PASSAGE, PASSAGE])
+
+    serial = score_dataset(Metric(), str(dataset), str(tmp_path / "serial.jsonl"), workers=2)
+    output = tmp_path / "pipelined.jsonl"
+    report = score_pipelined(Metric(), str(dataset), str(output), breakdown_workers=2, assess_workers=2,
+                             queue_size=1, flush_rows=2)
+
+    assert report["scored"] == 3 and report["failed"] == 1
+    assert report["agreement"] == serial["agreement"]
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(record["row"] for record in records) == [0, 2, 3]
+    assert all(record["score"] == pytest.approx(1 / 1.7) for record in records)
+    assert report["breakdown_seconds"] > 0 and report["assess_seconds"] > 0
+
+    calls = lm.calls
+    report = score_pipelined(Metric(), str(dataset), str(output))
+    assert report["scored"] == 0 and report["failed"] == 1
+    assert lm.calls - calls == 2
+
+IDEAS = ["The river flooded the town in spring", "Volunteers rebuilt the bridge"]
+
+def test_split_key_ideas_drops_numbering_and_grades():
+    assert split_key_ideas(BREAKDOWN["key_ideas"]) == IDEAS
+    assert split_key_ideas("Intro line\n1) An idea - LOW\n2. Another idea") == ["An idea", "Another idea"]
+
+def test_lexical_matcher_settles_clear_cut_ideas():
+    matcher = LexicalMatcher()
+    decisions = matcher.match_batch(IDEAS * 2, [0, 0, 1, 1],
+                                    ["The river flooded the town in spring.", "Volunteers fixed a bridge."])
+
+    assert decisions.tolist() == [LexicalMatcher.PRESENT, LexicalMatcher.ABSENT,
+                                  LexicalMatcher.ABSENT, LexicalMatcher.AMBIGUOUS]
+    assert matcher.stats()["local_share"] == 0.75
+
+def test_metric_skips_the_assessment_when_every_idea_is_settled(configure):
+    lm = FakeLM(METRIC_RESPONSES)
+    configure(lm=lm)
+    matcher = LexicalMatcher()
+
+    assert score(Metric(matcher=matcher), "The river flooded the town in spring.") == pytest.approx(1 / 1.7)
+    assert lm.calls == 1 and matcher.stats()["lm_calls_skipped"] == 1
+
+def test_metric_asks_the_lm_only_about_ambiguous_ideas(configure):
+    lm = FakeLM(METRIC_RESPONSES)
+    configure(lm=lm)
+
+    # The LM's first score goes to the only idea it was asked about
+    assert score(Metric(matcher=LexicalMatcher()), "Volunteers fixed a bridge.") == pytest.approx(0.7 / 1.7)
+    assert lm.calls == 2
+    prompt = lm.history[-1]["messages"][-1]["content"]
+    assert "1. Volunteers rebuilt the bridge. Medium." in prompt and "flooded" not in prompt
@@ -0,0 +1,10 @@
+from timing import percentile
+
+def test_percentile_picks_the_nearest_rank():
+    values = [0.5, 0.1, 0.4, 0.2, 0.3]
+    assert percentile(values, 0) == 0.1
+    assert percentile(values, 50) == 0.3
+    assert percentile(values, 99) == 0.5
+
+def test_percentile_of_nothing_is_zero():
+    assert percentile([], 50) == 0.0
@@ -0,0 +1,85 @@
+from fake_lm import FakeLM
+from tool_example import MAX_VALUES, ContextBuilder, FizzBuzzReAct, FizzBuzzTool, parse_numbers
+
+FINAL = {"reasoning": "12 is Fizz, 25 is Buzz and 45 is FizzBuzz."}
+
+def test_execute_many_applies_the_rules_to_numbers_and_ranges():
+    results = FizzBuzzTool().execute_many([12, range(1, 6), "x"])
+    assert [(number, result.result) for number, result in results if result.success] == [
+        (12, "Fizz"), (1, "1"), (2, "2"), (3, "Fizz"), (4, "4"), (5, "Buzz")]
+    assert results[-1][0] == -1 and "Invalid input: x" in results[-1][1].error
+
+def test_execute_many_refuses_too_many_numbers():
+    results = FizzBuzzTool().execute_many([range(1, 10_000_000_000)])
+    assert len(results) == 1
+    assert not results[0][1].success and f"At most {MAX_VALUES}" in results[0][1].error
+
+def test_parse_numbers_reads_lists_and_inclusive_ranges():
+    assert parse_numbers("the numbers 12, 25, and 45") == [12, 25, 45]
+    assert parse_numbers("1 through 15, then 20..22 and 30 - 31") == [range(1, 16), range(20, 23), range(30, 32)]
+    # Hyphens without spaces are not ranges
+    assert parse_numbers("2024-2030 and 8601-style") == [2024, 2030, 8601]
+
+def test_fast_path_answers_in_one_lm_call(configure):
+    lm = FakeLM([("ReAct", FINAL)])
+    configure(lm=lm)
+
+    prediction = FizzBuzzReAct()("What happens when you apply FizzBuzz to the numbers 12, 25, and 45?")
+    assert prediction.lm_calls == lm.calls == 1
+    assert "12=Fizz 25=Buzz 45=FizzBuzz" in lm.history[0]["messages"][-1]["content"]
+    assert prediction.answer == FINAL["reasoning"]
+
+def test_batched_actions_run_in_one_iteration(configure):
+    lm = FakeLM([
+        ("Observations:", FINAL),
+        ("ReAct", {"reasoning": "Action: fizzbuzz(12), fizzbuzz(25), fizzbuzz(40..45)"}),
+    ])
+    configure(lm=lm)
+
+    prediction = FizzBuzzReAct(fast_path=False)("Which of these are FizzBuzz?")
+    assert prediction.lm_calls == 2 and prediction.iterations == 2
+    assert "Action: fizzbuzz(12), fizzbuzz(25), fizzbuzz(40..45)" in prediction.reasoning
+    assert "fizzbuzz(45) = FizzBuzz" in prediction.reasoning
+
+def test_repeated_actions_end_the_loop(configure):
+    # The model only asks for numbers it has already seen, which adds nothing
+    lm = FakeLM([("ReAct", {"reasoning": "Action: fizzbuzz(12)"})])
+    configure(lm=lm)
+
+    prediction = FizzBuzzReAct(max_iterations=3)("What is FizzBuzz of 12?")
+    assert prediction.lm_calls == 1 and prediction.answer == "Action: fizzbuzz(12)"
+
+def test_context_builder_appends_compact_lines_after_the_prefix():
+    context = ContextBuilder("PREFIX")
+    assert context.render() == "PREFIX"
+
+    context.add(FizzBuzzTool().execute_many([12, 25, 7]))
+    assert context.render() == "PREFIX\n\nObservations:\nfizzbuzz 7,12,25: 12=Fizz 25=Buzz"
+
+def test_context_builder_folds_old_steps_into_a_summary():
+    tool = FizzBuzzTool()
+    context = ContextBuilder("PREFIX", budget_tokens=24)
+    context.add(tool.execute_many([12]))
+    context.add(tool.execute_many([25]))
+    context.add(tool.execute_many([7, 8, 11, 13, "x"]))
+
+    assert context.render().splitlines()[3:] == [
+        "earlier steps checked 12,25: Fizz 12; Buzz 25",
+        "fizzbuzz 7..8,11,13: no Fizz or Buzz; errors: Invalid input: x. Must be a number.",
+    ]
+
+def test_every_iteration_starts_with_the_same_prefix(configure):
+    lm = FakeLM([
+        ("Observations:", FINAL),
+        ("ReAct", {"reasoning": "Action: fizzbuzz(12), fizzbuzz(25)"}),
+    ])
+    configure(lm=lm)
+    react = FizzBuzzReAct(fast_path=False)
+
+    react("Which of these are FizzBuzz?")
+    react("And these?")
+
+    prompts = [entry["messages"][-1]["content"] for entry in lm.history]
+    assert len(prompts) == 4
+    assert all(react.context_prefix in prompt for prompt in prompts)
+    assert "fizzbuzz 12,25: 12=Fizz 25=Buzz" in prompts[1]
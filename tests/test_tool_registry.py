@@ -0,0 +1,84 @@
+import time
+import asyncio
+import threading
+
+from fake_lm import FakeLM
+from tool_example import FizzBuzzTool
+from tool_registry import ToolReAct, ToolRegistry, format_call, parse_args
+
+def test_parse_calls_reads_literals_and_ranges():
+    registry = ToolRegistry()
+    registry.register_tool(FizzBuzzTool(), pure=True)
+    registry.register("fetch_status", lambda service: f"{service}: ok")
+
+    calls = registry.parse_calls("Action: fizzbuzz(15), fizzbuzz(1..5), fetch_status('db'), unknown(1)")
+    assert calls == [("fizzbuzz", (15,)), ("fizzbuzz", (range(1, 6),)), ("fetch_status", ("db",))]
+    assert [format_call(name, args) for name, args in calls] == ["fizzbuzz(15)", "fizzbuzz(1..5)", "fetch_status('db')"]
+    assert parse_args("") == () and parse_args("some text") == ("some text",)
+
+def test_calls_in_one_step_run_concurrently_and_pure_results_are_memoized():
+    async def slow_lookup(user_id):
+        await asyncio.sleep(0.2)
+        return f"user {user_id}"
+
+    registry = ToolRegistry()
+    registry.register_tool(FizzBuzzTool(), pure=True)
+    registry.register("lookup_user", slow_lookup)
+
+    start = time.perf_counter()
+    results = registry.run([("lookup_user", (1,)), ("lookup_user", (2,)), ("fizzbuzz", (range(1, 6),)),
+                            ("fizzbuzz", (15,)), ("fizzbuzz", (15,))])
+    assert time.perf_counter() - start < 0.35
+    assert [result.result for result in results] == ["user 1", "user 2", "1, 2, Fizz, 4, Buzz", "FizzBuzz", "FizzBuzz"]
+
+    registry.run([("fizzbuzz", (15,))])
+    assert registry.stats == {"calls": 6, "memo_hits": 2, "timeouts": 0, "errors": 0}
+
+def test_timed_out_thread_keeps_its_concurrency_slot():
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    def slow_status(service):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.3)
+        with lock:
+            running -= 1
+        return f"{service}: ok"
+
+    registry = ToolRegistry()
+    registry.register("fetch_status", slow_status, timeout=0.05, max_concurrency=1)
+
+    results = registry.run([("fetch_status", ("db",)), ("fetch_status", ("cache",))])
+    assert [result.success for result in results] == [False, False]
+    assert "timed out after 0.05s" in results[0].error
+    assert registry.stats["timeouts"] == 2
+    # The second call only started once the first thread had finished
+    assert peak == 1
+
+def test_tool_errors_become_results():
+    def broken(service):
+        raise ConnectionError("refused")
+
+    registry = ToolRegistry()
+    registry.register("fetch_status", broken)
+    (result,) = registry.run([("fetch_status", ("db",))])
+    assert not result.success and result.error == "fetch_status failed: refused"
+    assert registry.run([("missing", ())])[0].error == "Unknown tool: missing"
+
+def test_tool_react_keeps_every_observation(configure):
+    lm = FakeLM([
+        ("fizzbuzz(9) = Fizz", {"reasoning": "Both are known now."}),
+        ("fizzbuzz(5) = Buzz", {"reasoning": "Action: fizzbuzz(9)"}),
+        ("ReAct", {"reasoning": "Action: fizzbuzz(5)"}),
+    ])
+    configure(lm=lm)
+    registry = ToolRegistry()
+    registry.register_tool(FizzBuzzTool(), pure=True)
+
+    prediction = ToolReAct(registry, max_iterations=4)("What are fizzbuzz(5) and fizzbuzz(9)?")
+    assert prediction.iterations == 3 and prediction.answer == "Both are known now."
+    last_prompt = lm.history[-1]["messages"][-1]["content"]
+    assert "fizzbuzz(5) = Buzz" in last_prompt and "fizzbuzz(9) = Fizz" in last_prompt
@@ -0,0 +1,46 @@
+import uuid
+
+import dspy
+
+from fake_lm import FakeLM
+from tracing import Tracer, enable_tracing
+
+def test_spans_nest_predictors_and_lm_calls(configure):
+    configure(lm=FakeLM([("question", {"answer": "4"})]), callbacks=[])
+    tracer = enable_tracing(Tracer())
+
+    dspy.Predict("question -> answer")(question="What is 2 + 2?")
+
+    spans = {span.kind: span for span in tracer.spans}
+    assert set(spans) == {"module", "lm", "adapter"}
+    assert spans["lm"].parent_id == spans["module"].span_id
+    assert spans["lm"].model == "fake/lm" and spans["lm"].prompt_tokens > 0
+    assert not spans["lm"].cache_hit and spans["lm"].retries == 0
+
+def test_a_repeated_call_is_traced_as_a_cache_hit(configure, tmp_path):
+    # dspy's cache outlives the test run, so the question must be new every time
+    question = f"What is 2 + 2? ({uuid.uuid4()})"
+    lm = FakeLM([("question", {"answer": "4"})], cache=True)
+    configure(lm=lm, callbacks=[])
+    tracer = enable_tracing(Tracer())
+
+    for _ in range(2):
+        dspy.Predict("question -> answer")(question=question)
+
+    first, second = [span for span in tracer.spans if span.kind == "lm"]
+    assert lm.calls == 1
+    assert not first.cache_hit and second.cache_hit
+    assert "(cache hit)" in tracer.report()
+    tracer.export_prometheus(str(tmp_path / "spans.prom"))
+    assert 'dspy_span_cache_hits_total{kind="lm",name="FakeLM[fake/lm]"} 1' in (tmp_path / "spans.prom").read_text()
+
+def test_a_second_lm_call_by_the_same_predictor_is_a_retry(configure):
+    # The chat adapter cannot parse this reply and falls back to asking for JSON
+    lm = FakeLM([("JSON", '{"answer": "4"}'), ("question", "just 4")])
+    configure(lm=lm, callbacks=[])
+    tracer = enable_tracing(Tracer())
+
+    assert dspy.Predict("question -> answer")(question="What is 2 + 2?").answer == "4"
+
+    assert [span.retries for span in tracer.spans if span.kind == "lm"] == [0, 1]
+    assert tracer.aggregate()[("module", "Predict(answer)")]["count"] == 1
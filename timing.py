@@ -0,0 +1,7 @@
+def percentile(values, q):
+    """Return the q-th percentile (0-100) of a list of numbers, or 0.0 if it is empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
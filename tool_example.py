@@ -1,12 +1,18 @@
 import dspy
 import re
 import os
+import time
+import argparse
+import textwrap
+import numpy as np
 
-from typing import Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from dataclasses import dataclass
 from dotenv import load_dotenv
+from chunking import estimate_tokens
 
-load_dotenv()
+# Most numbers one tool call may cover, ranges included, so a call like fizzbuzz(1..10000000000) is refused
+MAX_VALUES = 10_000
 
 @dataclass
 class ToolResult:
@@ -60,29 +66,207 @@ class FizzBuzzTool:
                 error=f"Invalid input: {number}. Must be a number."
             )
     
+    def execute_many(self, numbers: Iterable[Union[int, range]]) -> List[Tuple[int, ToolResult]]:
+        """
+        Execute FizzBuzz replacement for many numbers at once.
+        
+        Accepts numbers and ranges (e.g. [12, 25, range(1, 16)]); ranges are
+        expanded in order. The rules are applied to all numbers as one
+        vectorized NumPy operation. Returns (number, result) pairs; an
+        invalid number yields an error result with number -1. More than
+        MAX_VALUES numbers in total yield a single error result instead.
+        """
+        numbers = list(numbers)
+        total = count_values(numbers)
+        if total > MAX_VALUES:
+            return [(-1, ToolResult(
+                success=False,
+                result="",
+                error=f"Too many numbers: {total}. At most {MAX_VALUES} can be checked at once."
+            ))]
+        
+        values = []
+        errors = []
+        for item in numbers:
+            try:
+                if isinstance(item, range):
+                    values.append(np.arange(item.start, item.stop, item.step, dtype=np.int64))
+                else:
+                    values.append(np.array([int(item)], dtype=np.int64))
+            except (ValueError, TypeError, OverflowError):
+                errors.append((-1, ToolResult(
+                    success=False,
+                    result="",
+                    error=f"Invalid input: {item}. Must be a number."
+                )))
+        
+        nums = np.concatenate(values) if values else np.array([], dtype=np.int64)
+        
+        # Apply the rules to the whole array; FizzBuzz is assigned last so it wins
+        labels = nums.astype(str).astype(object)
+        labels[nums % 3 == 0] = "Fizz"
+        labels[nums % 5 == 0] = "Buzz"
+        labels[nums % 15 == 0] = "FizzBuzz"
+        
+        results = [
+            (int(num), ToolResult(success=True, result=label))
+            for num, label in zip(nums.tolist(), labels.tolist())
+        ]
+        return results + errors
+    
     def get_tool_info(self) -> str:
         """Return information about this tool for the LLM."""
         return """
             Tool: fizzbuzz
-            Description: Applies FizzBuzz replacement to a number
-            Usage: fizzbuzz(number)
+            Description: Applies FizzBuzz replacement to a number or a range of numbers
+            Usage: fizzbuzz(number) or fizzbuzz(start..end) for an inclusive range
             Rules:
             - Returns "Fizz" if number is multiple of 3
             - Returns "Buzz" if number is multiple of 5  
             - Returns "FizzBuzz" if number is multiple of both 3 and 5
             - Returns the original number if neither multiple of 3 nor 5
             Example: fizzbuzz(15) returns "FizzBuzz"
+            Several calls can be made in one step, e.g. Action: fizzbuzz(12), fizzbuzz(25)
         """
 
+def count_values(numbers: Iterable[Union[int, range]]) -> int:
+    """Count the numbers a list of numbers and ranges covers, without expanding the ranges."""
+    return sum(len(item) if isinstance(item, range) else 1 for item in numbers)
+
+def parse_numbers(text: str) -> List[Union[int, range]]:
+    """
+    Find the numbers and inclusive ranges mentioned in a piece of text,
+    e.g. "12, 25, and 45" -> [12, 25, 45] and "1 through 15" -> [range(1, 16)].
+    A hyphen only makes a range with spaces around it ("1 - 15"), so
+    "2024-2030" or "8601-style" are plain numbers.
+    """
+    pattern = r'(\d+)(?:(?:\s*(?:\.\.|\bto\b|\bthrough\b)\s*|\s+-\s+)(\d+))?'
+    numbers = []
+    for match in re.finditer(pattern, text, re.IGNORECASE):
+        start = int(match.group(1))
+        if match.group(2) is not None:
+            numbers.append(range(start, int(match.group(2)) + 1))
+        else:
+            numbers.append(start)
+    return numbers
+
+def format_numbers(numbers: Iterable[int]) -> str:
+    """Format numbers compactly, collapsing consecutive runs: [1, 2, 3, 5] -> "1..3,5"."""
+    parts = []
+    run_start = previous = None
+    for number in sorted(set(numbers)):
+        if previous is not None and number == previous + 1:
+            previous = number
+            continue
+        if run_start is not None:
+            parts.append(str(run_start) if run_start == previous else f"{run_start}..{previous}")
+        run_start = previous = number
+    if run_start is not None:
+        parts.append(str(run_start) if run_start == previous else f"{run_start}..{previous}")
+    return ",".join(parts)
+
+COMPACT_INSTRUCTIONS = """You are an AI assistant that can use tools to solve problems. Follow the ReAct pattern:
+1. Think about what you need to do
+2. Act by calling the tool if needed
+3. Observe the results
+4. Provide a final answer
+
+When you need to use the tool, format your action as:
+Action: fizzbuzz(number)
+
+Observations are listed below, one line per step: the numbers checked, then number=result for
+the numbers that became Fizz, Buzz or FizzBuzz; every other number stays the same.
+Think step by step. Use the fizzbuzz tool when you need to apply FizzBuzz rules to numbers.
+
+Available tool:
+"""
+
+class ContextBuilder:
+    """
+    Incremental prompt context for FizzBuzzReAct.
+
+    The instructions and tool description form a prefix that is
+    byte-identical on every iteration and every question, so provider-side
+    prompt caching can reuse it; observations are only ever appended after
+    it, one compact line per step. When the observations exceed
+    `budget_tokens`, the oldest steps are folded into one summary line
+    (the numbers checked and which of them are Fizz, Buzz or FizzBuzz)
+    instead of being dropped.
+    """
+
+    def __init__(self, prefix: str, budget_tokens: int = 256):
+        self.prefix = prefix
+        self.budget_tokens = budget_tokens
+        self.steps: List[Tuple[str, Dict[int, str], int]] = []
+        self.folded: Dict[int, str] = {}
+        self.folded_errors = 0
+        self.summary = ""
+
+    def add(self, results: List[Tuple[int, ToolResult]]):
+        """Append one step of tool results and fold old steps if over budget."""
+        values = {number: result.result for number, result in results if result.success}
+        errors = [result.error for _, result in results if not result.success]
+        changed = " ".join(f"{number}={label}" for number, label in values.items() if label != str(number))
+        line = f"fizzbuzz {format_numbers(values)}: {changed or 'no Fizz or Buzz'}"
+        if errors:
+            line += "; errors: " + "; ".join(errors)
+        self.steps.append((line, values, len(errors)))
+
+        while len(self.steps) > 1 and self._tokens() > self.budget_tokens:
+            _, values, error_count = self.steps.pop(0)
+            self.folded.update(values)
+            self.folded_errors += error_count
+            self.summary = self._summarize()
+
+    def _tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(line) for line, _, _ in self.steps)
+
+    def _summarize(self) -> str:
+        labels = {}
+        for number, label in self.folded.items():
+            if label != str(number):
+                labels.setdefault(label, []).append(number)
+        parts = [f"{label} {format_numbers(labels[label])}" for label in ("Fizz", "Buzz", "FizzBuzz") if label in labels]
+        summary = f"earlier steps checked {format_numbers(self.folded)}: " + "; ".join(parts or ["no Fizz or Buzz"])
+        if estimate_tokens(summary) > self.budget_tokens // 2:
+            # Too many numbers to list; the rules restate the labels of every checked number exactly
+            summary = (f"earlier steps checked {format_numbers(self.folded)}: multiples of 15 are FizzBuzz, "
+                       f"other multiples of 3 Fizz, other multiples of 5 Buzz")
+        if self.folded_errors:
+            summary += f"; {self.folded_errors} tool errors"
+        return summary
+
+    def render(self) -> str:
+        if not self.steps and not self.summary:
+            return self.prefix
+        lines = ([self.summary] if self.summary else []) + [line for line, _, _ in self.steps]
+        return f"{self.prefix}\n\nObservations:\n" + "\n".join(lines)
+
 class FizzBuzzReAct(dspy.Module):
     """
     A ReAct module that can use the FizzBuzz tool to solve problems.
     """
     
-    def __init__(self, max_iterations: int = 3):
+    def __init__(self, max_iterations: int = 3, batch_tools: bool = True, fast_path: bool = True,
+                 compact_context: bool = True, context_budget: int = 256):
+        """
+        batch_tools: run every action in a response as one batch, instead of
+                     only the first one
+        fast_path: compute the numbers named in the question before the first
+                   LM call, so the model can usually answer in one iteration
+        compact_context: build the context with a ContextBuilder (stable prefix,
+                         compact observations, summarized past `context_budget`
+                         tokens) instead of the last three history lines
+        """
         super().__init__()
         self.fizzbuzz_tool = FizzBuzzTool()
         self.max_iterations = max_iterations
+        self.batch_tools = batch_tools
+        self.fast_path = fast_path
+        self.compact_context = compact_context
+        self.context_budget = context_budget
+        # Built once, so every iteration and question starts with the same bytes
+        self.context_prefix = COMPACT_INSTRUCTIONS + textwrap.dedent(self.fizzbuzz_tool.get_tool_info()).strip()
         
         # Define the ReAct signature properly
         class ReActSignature(dspy.Signature):
@@ -108,6 +292,40 @@ class FizzBuzzReAct(dspy.Module):
         
         return None
     
+    def _extract_tool_calls(self, text: str) -> List[Union[int, range]]:
+        """Extract every fizzbuzz tool call, single numbers and ranges, from the LLM response."""
+        calls = []
+        # Look for lines like: Action: fizzbuzz(12), fizzbuzz(1..15)
+        for line in re.findall(r'Action:(.*)', text, re.IGNORECASE):
+            for args in re.findall(r'fizzbuzz\(([^)]*)\)', line, re.IGNORECASE):
+                calls.extend(parse_numbers(args))
+        return calls
+    
+    def _observe(self, calls: List[Union[int, range]]) -> Tuple[str, str, set, List[Tuple[int, ToolResult]]]:
+        """
+        Run a batch of tool calls and format them as one action and one
+        observation line. Also returns the set of numbers observed and the
+        raw results.
+        """
+        actions = []
+        for call in calls:
+            if isinstance(call, range):
+                actions.append(f"fizzbuzz({call.start}..{call.stop - 1})")
+            else:
+                actions.append(f"fizzbuzz({call})")
+        
+        observations = []
+        numbers = set()
+        results = self.fizzbuzz_tool.execute_many(calls)
+        for number, result in results:
+            if result.success:
+                observations.append(f"fizzbuzz({number}) = {result.result}")
+                numbers.add(number)
+            else:
+                observations.append(f"Tool error: {result.error}")
+        
+        return "Action: " + ", ".join(actions), "Observation: " + ", ".join(observations), numbers, results
+    
     def forward(self, question: str) -> dspy.Prediction:
         """
         Execute the ReAct loop to answer the question using the FizzBuzz tool.
@@ -130,7 +348,28 @@ Action: fizzbuzz(number)
 
 Think step by step. Use the fizzbuzz tool when you need to apply FizzBuzz rules to numbers."""
         
-        current_context = context
+        builder = ContextBuilder(self.context_prefix, self.context_budget) if self.compact_context else None
+        
+        def updated_context(results):
+            if builder is None:
+                return f"{context}\n\nPrevious observations:\n" + "\n".join(conversation_history[-3:])
+            builder.add(results)
+            return builder.render()
+        
+        current_context = context if builder is None else builder.render()
+        lm_calls = 0
+        observed = set()
+        
+        if self.fast_path:
+            # Deterministic fast path: the numbers in the question are known up
+            # front, so run the tool on them before asking the model anything
+            calls = parse_numbers(question)
+            if calls:
+                action, observation, numbers, results = self._observe(calls)
+                conversation_history.append(action)
+                conversation_history.append(observation)
+                observed.update(numbers)
+                current_context = updated_context(results)
         
         for iteration in range(self.max_iterations):
             # Generate reasoning and potential action
@@ -138,10 +377,35 @@ Think step by step. Use the fizzbuzz tool when you need to apply FizzBuzz rules
                 context=current_context,
                 question=question
             )
+            lm_calls += 1
             
             conversation_history.append(f"Iteration {iteration + 1}:")
             conversation_history.append(f"Thought: {response.reasoning}")
             
+            if self.batch_tools:
+                calls = self._extract_tool_calls(response.reasoning)
+                requested = set()
+                if count_values(calls) <= MAX_VALUES:
+                    for call in calls:
+                        requested.update(call if isinstance(call, range) else [call])
+                else:
+                    # Too many to expand; the tool reports the error
+                    requested = None
+                
+                # Actions that only repeat earlier observations add nothing, so
+                # the response is treated as the final answer
+                if calls and (requested is None or not requested <= observed):
+                    action, observation, numbers, results = self._observe(calls)
+                    conversation_history.append(action)
+                    conversation_history.append(observation)
+                    observed.update(numbers)
+                    current_context = updated_context(results)
+                else:
+                    final_answer = response.reasoning
+                    conversation_history.append("Final Answer: " + final_answer)
+                    break
+                continue
+            
             # Check if there's a tool call in the response
             tool_call = self._extract_tool_call(response.reasoning)
             
@@ -157,11 +421,11 @@ Think step by step. Use the fizzbuzz tool when you need to apply FizzBuzz rules
                     conversation_history.append(observation)
                     
                     # Update context with the observation
-                    current_context = f"{context}\n\nPrevious observations:\n" + "\n".join(conversation_history[-3:])
+                    current_context = updated_context([(number, result)])
                 else:
                     error_msg = f"Observation: Tool error: {result.error}"
                     conversation_history.append(error_msg)
-                    current_context = f"{context}\n\nPrevious observations:\n" + "\n".join(conversation_history[-3:])
+                    current_context = updated_context([(number, result)])
             else:
                 # No tool call detected, this might be the final answer
                 final_answer = response.reasoning
@@ -179,7 +443,8 @@ Think step by step. Use the fizzbuzz tool when you need to apply FizzBuzz rules
         return dspy.Prediction(
             answer=final_answer,
             reasoning=full_reasoning,
-            iterations=iteration + 1
+            iterations=iteration + 1,
+            lm_calls=lm_calls
         )
 
 # Example usage and testing
@@ -211,7 +476,7 @@ def main():
         print("Reasoning Process:")
         print(prediction.reasoning)
         print(f"\nFinal Answer: {prediction.answer}")
-        print(f"Completed in {prediction.iterations} iterations")
+        print(f"Completed in {prediction.iterations} iterations ({prediction.lm_calls} LM calls)")
         print("=" * 70)
         print()
 
@@ -230,6 +495,55 @@ def test_fizzbuzz_tool():
         else:
             print(f"Error with {num}: {result.error}")
 
+def compare_modes():
+    """Compare iterations and LM calls per question with and without batched tool execution."""
+    
+    print("=== Batched vs. Single Tool Calls ===\n")
+    
+    single_agent = FizzBuzzReAct(batch_tools=False, fast_path=False)
+    batched_agent = FizzBuzzReAct()
+    
+    questions = [
+        "What is the FizzBuzz result for the number 9?",
+        "What happens when you apply FizzBuzz to the numbers 12, 25, and 45?",
+        "Generate FizzBuzz results for numbers 1 through 15",
+    ]
+    
+    print(f"{'Question':<50} | {'Before (iter/LM)':<16} | {'After (iter/LM)':<16}")
+    print("-" * 88)
+    for question in questions:
+        before = single_agent(question)
+        after = batched_agent(question)
+        label = question[:47] + "..." if len(question) > 50 else question
+        print(f"{label:<50} | {before.iterations:>4} / {before.lm_calls:<9} | {after.iterations:>4} / {after.lm_calls:<9}")
+
+def compare_context():
+    """Compare prompt tokens per iteration and latency of the legacy and the compact context."""
+    
+    print("=== Last-Three-Lines vs. Compact Context ===\n")
+    
+    lm = dspy.settings.lm
+    agents = {
+        "legacy": FizzBuzzReAct(compact_context=False),
+        "compact": FizzBuzzReAct(),
+    }
+    questions = [
+        "What happens when you apply FizzBuzz to the numbers 12, 25, and 45?",
+        "Generate FizzBuzz results for numbers 1 through 30, then check 33 and 35 too",
+        "Find the first three numbers above 40 whose FizzBuzz result is Fizz",
+    ]
+    
+    print(f"{'Question':<40} | {'Context':<7} | {'Iter':>4} | {'Prompt tokens per iteration':<28} | {'Seconds':>7}")
+    print("-" * 98)
+    for question in questions:
+        label = question[:37] + "..." if len(question) > 40 else question
+        for name, agent in agents.items():
+            start, history_start = time.perf_counter(), len(lm.history)
+            prediction = agent(question)
+            seconds = time.perf_counter() - start
+            tokens = [(entry.get('usage') or {}).get('prompt_tokens', 0) for entry in lm.history[history_start:]]
+            print(f"{label:<40} | {name:<7} | {prediction.iterations:>4} | {' '.join(map(str, tokens)):<28} | {seconds:>7.2f}")
+
 def demo_sequence():
     """Demonstrate FizzBuzz sequence generation."""
     
@@ -247,7 +561,17 @@ def demo_sequence():
     print(prediction.reasoning)
     print(f"\nFinal Answer: {prediction.answer}")
 
-if __name__ == "__main__":
+def run(argv=None):
+    """Run the FizzBuzz ReAct demos against gpt-4o, or answer a single --question."""
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="FizzBuzz ReAct agent with a custom tool.")
+    parser.add_argument("--question", help="answer this question instead of running the demos")
+    parser.add_argument("--legacy-context", action="store_true",
+                        help="build the context from the last three history lines, as before ContextBuilder")
+    parser.add_argument("--compare-context", action="store_true",
+                        help="only compare prompt tokens and latency of the legacy and compact contexts")
+    args = parser.parse_args(argv)
 
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
@@ -257,6 +581,15 @@ if __name__ == "__main__":
     lm = dspy.LM('openai/gpt-4o', api_key=api_key)
     dspy.settings.configure(lm=lm)
 
+    if args.question:
+        prediction = FizzBuzzReAct(compact_context=not args.legacy_context)(args.question)
+        print(f"Final Answer: {prediction.answer}")
+        return
+    
+    if args.compare_context:
+        compare_context()
+        return
+
     # Test the tool directly first
     test_fizzbuzz_tool()
     print()
@@ -265,4 +598,15 @@ if __name__ == "__main__":
     main()
     
     # Show sequence generation
-    demo_sequence()
\ No newline at end of file
+    demo_sequence()
+    print()
+    
+    # Compare against one tool call per iteration
+    compare_modes()
+    print()
+    
+    # Compare the legacy and compact contexts
+    compare_context()
+
+if __name__ == "__main__":
+    run()
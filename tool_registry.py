@@ -0,0 +1,382 @@
+import dspy
+import re
+import os
+import ast
+import time
+import asyncio
+import inspect
+import weakref
+import threading
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+from tool_example import ToolResult, FizzBuzzTool, parse_numbers
+
+def format_call(name: str, args: tuple) -> str:
+    """Format a tool call the way the LLM writes it, e.g. fizzbuzz(15) or fizzbuzz(1..15)."""
+    return f"{name}({', '.join(f'{a.start}..{a.stop - 1}' if isinstance(a, range) else repr(a) for a in args)})"
+
+def parse_args(args: str) -> tuple:
+    """Parse the arguments of a tool call as Python literals; "1..15" is an inclusive range."""
+    if not args.strip():
+        return ()
+    try:
+        return ast.literal_eval(f"({args},)")
+    except (ValueError, SyntaxError):
+        pass
+    if re.fullmatch(r'\s*\d+\s*\.\.\s*\d+\s*', args):
+        return tuple(parse_numbers(args))
+    return (args.strip(),)
+
+def range_aware(tool: Any) -> Callable[..., ToolResult]:
+    """
+    Wrap the execute() of a tool that also has execute_many(), such as
+    FizzBuzzTool, so a range argument runs as one batch. The labels are
+    joined in order; any error fails the whole call.
+    """
+    def execute(*args):
+        if len(args) != 1 or not isinstance(args[0], range):
+            return tool.execute(*args)
+        results = [result for _, result in tool.execute_many(args)]
+        for result in results:
+            if not result.success:
+                return result
+        return ToolResult(success=True, result=", ".join(result.result for result in results))
+    return execute
+
+@dataclass
+class RegisteredTool:
+    """A tool known to the registry, with its execution limits."""
+    name: str
+    func: Callable[..., Any]
+    info: str
+    timeout: Optional[float] = None
+    max_concurrency: Optional[int] = None
+    pure: bool = False
+
+class ToolRegistry:
+    """
+    A registry of tools that ReAct modules can call.
+
+    Tools can be plain functions or coroutine functions. All calls made in one
+    step run concurrently; each tool can have a timeout and a limit on how
+    many of its calls run at the same time. Results of tools registered with
+    pure=True are memoized, so repeating a call like fizzbuzz(15) is free.
+
+    Note that a timed out synchronous tool keeps running in its worker thread;
+    only its result is discarded, and it holds its max_concurrency slot
+    until the thread finishes.
+    """
+
+    def __init__(self, default_timeout: Optional[float] = 10.0):
+        self.default_timeout = default_timeout
+        self.tools: Dict[str, RegisteredTool] = {}
+        self._memo: Dict[Tuple, ToolResult] = {}
+        self._memo_lock = threading.Lock()
+        # Semaphores and in-flight calls belong to one event loop each
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._inflight = weakref.WeakKeyDictionary()
+        self.stats = {"calls": 0, "memo_hits": 0, "timeouts": 0, "errors": 0}
+        # Calls run on the event loop and on worker threads of several loops at once
+        self._stats_lock = threading.Lock()
+
+    def register(self, name: str, func: Callable[..., Any], description: str = "",
+                 usage: Optional[str] = None, timeout: Optional[float] = None,
+                 max_concurrency: Optional[int] = None, pure: bool = False,
+                 info: Optional[str] = None) -> None:
+        """Register a function or coroutine function as a tool."""
+        if info is None:
+            info = f"""
+            Tool: {name}
+            Description: {description}
+            Usage: {usage or f'{name}(...)'}
+        """
+        self.tools[name] = RegisteredTool(
+            name=name,
+            func=func,
+            info=info,
+            timeout=timeout if timeout is not None else self.default_timeout,
+            max_concurrency=max_concurrency,
+            pure=pure,
+        )
+
+    def register_tool(self, tool: Any, **options) -> None:
+        """
+        Register a tool object such as FizzBuzzTool, which provides a name,
+        an execute() method and get_tool_info(). If it also has
+        execute_many(), range arguments like fizzbuzz(1..15) go to it.
+        """
+        func = range_aware(tool) if hasattr(tool, "execute_many") else tool.execute
+        self.register(tool.name, func, info=tool.get_tool_info(), **options)
+
+    def get_tool_info(self) -> str:
+        """Return information about all registered tools for the LLM."""
+        return "\n".join(tool.info for tool in self.tools.values())
+
+    def parse_calls(self, text: str) -> List[Tuple[str, tuple]]:
+        """
+        Extract every call to a registered tool from the LLM response,
+        e.g. "Action: fizzbuzz(15), lookup_user(42)".
+        """
+        calls = []
+        for line in re.findall(r'Action:(.*)', text, re.IGNORECASE):
+            for name, args in re.findall(r'(\w+)\(([^)]*)\)', line):
+                if name not in self.tools:
+                    continue
+                calls.append((name, parse_args(args)))
+        return calls
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _semaphore(self, tool: RegisteredTool) -> Optional[asyncio.Semaphore]:
+        if not tool.max_concurrency:
+            return None
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if tool.name not in semaphores:
+            semaphores[tool.name] = asyncio.Semaphore(tool.max_concurrency)
+        return semaphores[tool.name]
+
+    async def _execute(self, tool: RegisteredTool, args: tuple) -> ToolResult:
+        semaphore = self._semaphore(tool)
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+            if inspect.iscoroutinefunction(tool.func):
+                work = asyncio.ensure_future(tool.func(*args))
+                pending = work
+            else:
+                work = asyncio.ensure_future(asyncio.to_thread(tool.func, *args))
+                # A thread cannot be cancelled, so a timeout only stops the waiting
+                pending = asyncio.shield(work)
+            if semaphore is not None:
+                # The slot is freed when the work ends, which for a timed out thread is after the timeout
+                work.add_done_callback(lambda _: semaphore.release())
+            value = await asyncio.wait_for(pending, timeout=tool.timeout)
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            return ToolResult(success=False, result="", error=f"{tool.name} timed out after {tool.timeout}s")
+        except Exception as e:
+            self._count("errors")
+            return ToolResult(success=False, result="", error=f"{tool.name} failed: {e}")
+
+        if isinstance(value, ToolResult):
+            return value
+        return ToolResult(success=True, result=str(value))
+
+    async def call(self, name: str, *args) -> ToolResult:
+        """Call one tool, reusing memoized or in-flight results of pure tools."""
+        tool = self.tools.get(name)
+        if tool is None:
+            return ToolResult(success=False, result="", error=f"Unknown tool: {name}")
+
+        self._count("calls")
+        if not tool.pure:
+            return await self._execute(tool, args)
+
+        key = (name, args)
+        try:
+            hash(key)
+        except TypeError:
+            # Unhashable arguments (e.g. lists) cannot be memoized
+            return await self._execute(tool, args)
+
+        with self._memo_lock:
+            if key in self._memo:
+                self._count("memo_hits")
+                return self._memo[key]
+
+        # Identical calls made in the same step share one execution
+        inflight = self._inflight.setdefault(asyncio.get_running_loop(), {})
+        if key in inflight:
+            self._count("memo_hits")
+            return await asyncio.shield(inflight[key])
+
+        task = asyncio.ensure_future(self._execute(tool, args))
+        inflight[key] = task
+        try:
+            result = await asyncio.shield(task)
+        finally:
+            inflight.pop(key, None)
+
+        if result.success:
+            with self._memo_lock:
+                self._memo[key] = result
+        return result
+
+    async def call_many(self, calls: List[Tuple[str, tuple]]) -> List[ToolResult]:
+        """Run a batch of tool calls concurrently and return results in call order."""
+        return await asyncio.gather(*(self.call(name, *args) for name, args in calls))
+
+    def run(self, calls: List[Tuple[str, tuple]]) -> List[ToolResult]:
+        """Synchronous wrapper around call_many for use inside dspy modules."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.call_many(calls))
+
+        # Already inside an event loop: run the batch on a helper thread
+        results = []
+        worker = threading.Thread(target=lambda: results.extend(asyncio.run(self.call_many(calls))))
+        worker.start()
+        worker.join()
+        return results
+
+class ToolReAct(dspy.Module):
+    """
+    A ReAct module that can use any tool in a ToolRegistry.
+
+    All actions in one response are executed concurrently through the
+    registry and their observations are fed back in a single step.
+    """
+
+    def __init__(self, registry: ToolRegistry, max_iterations: int = 3):
+        super().__init__()
+        self.registry = registry
+        self.max_iterations = max_iterations
+
+        class ReActSignature(dspy.Signature):
+            """Generate reasoning following ReAct pattern with context and question"""
+            context = dspy.InputField(desc="Context with instructions and tool info")
+            question = dspy.InputField(desc="The question to answer")
+            reasoning = dspy.OutputField(desc="Step-by-step reasoning following ReAct pattern")
+
+        self.react_cot = dspy.ChainOfThought(ReActSignature)
+
+    def forward(self, question: str) -> dspy.Prediction:
+        """
+        Execute the ReAct loop to answer the question using the registered tools.
+        """
+        conversation_history = []
+        final_answer = ""
+
+        context = f"""You are an AI assistant that can use tools to solve problems. Follow the ReAct pattern:
+1. Think about what you need to do
+2. Act by calling one or more tools if needed
+3. Observe the results
+4. Provide a final answer
+
+Available tools: {self.registry.get_tool_info()}
+
+When you need to use tools, format your action as:
+Action: tool_name(arguments), other_tool(arguments)
+
+Think step by step. Calls listed in one action run at the same time."""
+
+        current_context = context
+        # Every action and observation so far, so earlier results stay in the context
+        steps = []
+
+        for iteration in range(self.max_iterations):
+            response = self.react_cot(
+                context=current_context,
+                question=question
+            )
+
+            conversation_history.append(f"Iteration {iteration + 1}:")
+            conversation_history.append(f"Thought: {response.reasoning}")
+
+            calls = self.registry.parse_calls(response.reasoning)
+            if not calls:
+                final_answer = response.reasoning
+                conversation_history.append("Final Answer: " + final_answer)
+                break
+
+            start = time.perf_counter()
+            results = self.registry.run(calls)
+            elapsed = time.perf_counter() - start
+
+            observations = []
+            for (name, args), result in zip(calls, results):
+                call = format_call(name, args)
+                if result.success:
+                    observations.append(f"{call} = {result.result}")
+                else:
+                    observations.append(f"{call} error: {result.error}")
+
+            action = "Action: " + ", ".join(format_call(name, args) for name, args in calls)
+            observation = f"Observation ({elapsed:.2f}s): " + "; ".join(observations)
+            conversation_history.extend([action, observation])
+            steps.extend([action, observation])
+            current_context = f"{context}\n\nPrevious observations:\n" + "\n".join(steps)
+
+        if not final_answer:
+            final_answer = response.reasoning
+            conversation_history.append("Final Answer: " + final_answer)
+
+        return dspy.Prediction(
+            answer=final_answer,
+            reasoning="\n".join(conversation_history),
+            iterations=iteration + 1
+        )
+
+# Example I/O-bound tools standing in for a database lookup and an HTTP call
+async def lookup_user(user_id: int) -> str:
+    """Pretend database lookup."""
+    await asyncio.sleep(0.5)
+    return f"user {user_id}: active"
+
+def fetch_status(service: str) -> str:
+    """Pretend blocking HTTP call to a local stub."""
+    time.sleep(0.5)
+    return f"{service}: ok"
+
+def build_registry() -> ToolRegistry:
+    """Create a registry with the FizzBuzz tool and the example I/O tools."""
+    registry = ToolRegistry()
+    registry.register_tool(FizzBuzzTool(), pure=True)
+    registry.register("lookup_user", lookup_user,
+                      description="Looks up a user record by id",
+                      usage="lookup_user(user_id)",
+                      timeout=2.0, max_concurrency=4)
+    registry.register("fetch_status", fetch_status,
+                      description="Returns the health status of a service",
+                      usage="fetch_status('service-name')",
+                      timeout=1.0, max_concurrency=2)
+    return registry
+
+def demo_registry():
+    """Run several slow tool calls concurrently without an LM."""
+
+    print("=== Tool Registry Demo ===\n")
+
+    registry = build_registry()
+    calls = registry.parse_calls(
+        "Action: lookup_user(1), lookup_user(2), fetch_status('db'), fizzbuzz(15), fizzbuzz(15)"
+    )
+
+    start = time.perf_counter()
+    results = registry.run(calls)
+    elapsed = time.perf_counter() - start
+
+    for (name, args), result in zip(calls, results):
+        print(f"{format_call(name, args)} -> {result.result if result.success else result.error}")
+    print(f"\n{len(calls)} calls in {elapsed:.2f}s (each I/O tool takes 0.5s)")
+    print(f"Stats: {registry.stats}")
+
+def run(argv=None):
+    """Run the registry demo, then a ReAct question that uses several tools."""
+    load_dotenv()
+
+    demo_registry()
+    print()
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        print("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+        exit(1)
+
+    lm = dspy.LM('openai/gpt-4o', api_key=api_key)
+    dspy.settings.configure(lm=lm)
+
+    agent = ToolReAct(build_registry())
+    prediction = agent("Is user 7 active, is the 'billing' service healthy, and what is fizzbuzz(30)?")
+    print("Reasoning Process:")
+    print(prediction.reasoning)
+    print(f"\nFinal Answer: {prediction.answer}")
+
+if __name__ == "__main__":
+    run()
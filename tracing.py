@@ -0,0 +1,245 @@
+import dspy
+import json
+import time
+import threading
+
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from typing import Optional
+
+from dspy.utils.callback import BaseCallback, ACTIVE_CALL_ID
+
+@dataclass
+class Span:
+    """One traced module forward, LM call, adapter step, tool call or evaluation."""
+    span_id: str
+    parent_id: Optional[str]
+    kind: str
+    name: str
+    start: float
+    thread: str
+    seconds: float = 0.0
+    model: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_hit: bool = False
+    # LM calls beyond the first made by the same predictor (adapter fallbacks and re-asks)
+    retries: int = 0
+    error: Optional[str] = None
+    children: int = field(default=0, repr=False)
+
+def span_name(instance):
+    """A readable name for a traced instance: the class, plus the signature for predictors."""
+    name = type(instance).__name__
+    signature = getattr(instance, "signature", None)
+    if signature is not None:
+        label = signature.__name__
+        if label == "StringSignature":
+            label = ", ".join(signature.output_fields)
+        name = f"{name}({label})"
+    model = getattr(instance, "model", None)
+    if isinstance(model, str):
+        name = f"{name}[{model}]"
+    return name
+
+class Tracer(BaseCallback):
+    """
+    A dspy callback that records nested spans for every module forward, LM
+    call, adapter format/parse, tool call and evaluation.
+
+    Spans are linked to their parent through dspy's active call id, so
+    nesting is kept across modules. Work started on a plain thread pool
+    shows up as separate root spans. LM spans carry the prompt and
+    completion tokens from the LM's history entry, and are marked as cache
+    hits when that entry has no usage.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._open = {}
+        self._starts = {}
+        self._lm_instances = {}
+        self._predictors = set()
+        self._lock = threading.Lock()
+
+    def _start(self, call_id, kind, instance):
+        span = Span(
+            span_id=call_id,
+            parent_id=ACTIVE_CALL_ID.get(),
+            kind=kind,
+            name=span_name(instance),
+            start=time.time(),
+            thread=threading.current_thread().name,
+        )
+        with self._lock:
+            self._open[call_id] = span
+            self._starts[call_id] = time.perf_counter()
+            if isinstance(instance, dspy.Predict):
+                self._predictors.add(call_id)
+            parent = self._open.get(span.parent_id)
+            if kind == "lm" and span.parent_id in self._predictors:
+                # A predictor that calls the LM again is retrying (e.g. the adapter's JSON fallback)
+                span.retries = parent.children
+                parent.children += 1
+        return span
+
+    def _end(self, call_id, exception):
+        with self._lock:
+            span = self._open.pop(call_id, None)
+            started = self._starts.pop(call_id, None)
+            self._predictors.discard(call_id)
+            if span is None:
+                return None
+            span.seconds = time.perf_counter() - started
+            if exception is not None:
+                span.error = f"{type(exception).__name__}: {exception}"
+            self.spans.append(span)
+        return span
+
+    def on_module_start(self, call_id, instance, inputs):
+        self._start(call_id, "module", instance)
+
+    def on_module_end(self, call_id, outputs, exception=None):
+        self._end(call_id, exception)
+
+    def on_lm_start(self, call_id, instance, inputs):
+        span = self._start(call_id, "lm", instance)
+        span.model = getattr(instance, "model", None)
+        with self._lock:
+            self._lm_instances[call_id] = instance
+
+    def on_lm_end(self, call_id, outputs, exception=None):
+        with self._lock:
+            instance = self._lm_instances.pop(call_id, None)
+        span = self._end(call_id, exception)
+        if span is None or instance is None or outputs is None:
+            return
+        # The history entry of this call holds the very outputs list we were handed
+        for entry in reversed(getattr(instance, "history", [])[-64:]):
+            if entry.get("outputs") is outputs:
+                usage = entry.get("usage") or {}
+                span.prompt_tokens = usage.get("prompt_tokens", 0) or 0
+                span.completion_tokens = usage.get("completion_tokens", 0) or 0
+                # dspy records no usage for a call served from its cache; older litellm-style
+                # responses also carry the flag themselves
+                span.cache_hit = not usage or bool(getattr(entry.get("response"), "cache_hit", False))
+                break
+
+    def on_adapter_format_start(self, call_id, instance, inputs):
+        self._start(call_id, "adapter", instance).name += ".format"
+
+    def on_adapter_format_end(self, call_id, outputs, exception=None):
+        self._end(call_id, exception)
+
+    def on_adapter_parse_start(self, call_id, instance, inputs):
+        self._start(call_id, "adapter", instance).name += ".parse"
+
+    def on_adapter_parse_end(self, call_id, outputs, exception=None):
+        self._end(call_id, exception)
+
+    def on_tool_start(self, call_id, instance, inputs):
+        span = self._start(call_id, "tool", instance)
+        span.name = f"Tool({getattr(instance, 'name', span.name)})"
+
+    def on_tool_end(self, call_id, outputs, exception=None):
+        self._end(call_id, exception)
+
+    def on_evaluate_start(self, call_id, instance, inputs):
+        self._start(call_id, "evaluate", instance)
+
+    def on_evaluate_end(self, call_id, outputs, exception=None):
+        self._end(call_id, exception)
+
+    def export_jsonl(self, path):
+        """Write one JSON object per finished span."""
+        with self._lock:
+            spans = list(self.spans)
+        with open(path, "w", encoding="utf-8") as f:
+            for span in spans:
+                record = asdict(span)
+                record.pop("children")
+                f.write(json.dumps(record) + "\n")
+
+    def aggregate(self):
+        """Per (kind, name) totals: count, seconds, tokens, cache hits, retries and errors."""
+        totals = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = totals[(span.kind, span.name)]
+            entry["count"] += 1
+            entry["seconds"] += span.seconds
+            entry["max_seconds"] = max(entry["max_seconds"], span.seconds)
+            entry["prompt_tokens"] += span.prompt_tokens
+            entry["completion_tokens"] += span.completion_tokens
+            entry["cache_hits"] += span.cache_hit
+            entry["retries"] += span.retries
+            entry["errors"] += span.error is not None
+        return totals
+
+    def export_prometheus(self, path):
+        """Write the aggregated span metrics in the Prometheus text exposition format."""
+        metrics = [
+            ("dspy_span_count", "counter", "Finished spans.", "count"),
+            ("dspy_span_seconds_total", "counter", "Wall time spent in spans.", "seconds"),
+            ("dspy_span_max_seconds", "gauge", "Slowest single span.", "max_seconds"),
+            ("dspy_span_prompt_tokens_total", "counter", "Prompt tokens of LM calls.", "prompt_tokens"),
+            ("dspy_span_completion_tokens_total", "counter", "Completion tokens of LM calls.", "completion_tokens"),
+            ("dspy_span_cache_hits_total", "counter", "LM calls answered from the cache.", "cache_hits"),
+            ("dspy_span_retries_total", "counter", "Repeated LM calls by the same predictor.", "retries"),
+            ("dspy_span_errors_total", "counter", "Spans that raised.", "errors"),
+        ]
+        totals = self.aggregate()
+        lines = []
+        for metric, kind, help_text, key in metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for (span_kind, name), entry in sorted(totals.items()):
+                label = name.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{metric}{{kind="{span_kind}",name="{label}"}} {entry[key]:g}')
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def report(self, top=10):
+        """Return a text report of the slowest spans and of the time per span name."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: -s.seconds)
+        lines = [f"Slowest {min(top, len(spans))} of {len(spans)} spans:"]
+        lines.append(f"{'Seconds':>8} | {'Kind':<8} | {'Tokens':>7} | Name")
+        for span in spans[:top]:
+            tokens = span.prompt_tokens + span.completion_tokens
+            flags = (" (cache hit)" if span.cache_hit else "") + (f" (retry {span.retries})" if span.retries else "")
+            lines.append(f"{span.seconds:>8.3f} | {span.kind:<8} | {tokens:>7} | {span.name}{flags}")
+
+        lines.append("")
+        lines.append(f"{'Total s':>8} | {'Count':>6} | {'Mean ms':>8} | {'Kind':<8} | Name")
+        totals = sorted(self.aggregate().items(), key=lambda item: -item[1]["seconds"])
+        for (kind, name), entry in totals[:top]:
+            mean_ms = entry["seconds"] / entry["count"] * 1000
+            lines.append(f"{entry['seconds']:>8.3f} | {int(entry['count']):>6} | {mean_ms:>8.1f} | {kind:<8} | {name}")
+        return "\n".join(lines)
+
+def enable_tracing(tracer=None):
+    """Add a Tracer to dspy's global callbacks and return it."""
+    tracer = tracer or Tracer()
+    callbacks = [cb for cb in dspy.settings.get("callbacks", []) or [] if cb is not tracer]
+    dspy.configure(callbacks=callbacks + [tracer])
+    return tracer
+
+@contextmanager
+def traced(jsonl_path=None, prometheus_path=None, top=10):
+    """
+    Trace everything run inside the block, then export the spans and print
+    the slowest-span report.
+    """
+    tracer = enable_tracing()
+    try:
+        yield tracer
+    finally:
+        dspy.configure(callbacks=[cb for cb in dspy.settings.get("callbacks", []) if cb is not tracer])
+        if jsonl_path:
+            tracer.export_jsonl(jsonl_path)
+        if prometheus_path:
+            tracer.export_prometheus(prometheus_path)
+        print(tracer.report(top=top))